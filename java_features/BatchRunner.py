@@ -0,0 +1,259 @@
+"""BatchRunner is a module that processes many assignment directories in one run.
+Tokenization and pair chunks of all assignments are scheduled on one shared process pool,
+so small assignments don't leave cores idle. Every assignment keeps its own config,
+output file and percentile stats.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+import sys
+from os.path import dirname, abspath
+utilities_dir = dirname(abspath(__file__)) +'\\utilities'
+sys.path.append(utilities_dir)
+
+from main_utility import get_all_filepaths, generate_init_data
+from config_utility import FeatureConfig
+from shard_utility import count_pairs
+from stats_scoring_utility import calculate_tokens_percentile, calculate_features_percentile
+from stats_scoring_utility import build_token_stats_features, build_main_style_stats_features
+
+from .FeaturesCalculation import build_style_sequence, create_features_result_df
+
+
+INIT_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+# count of files tokenized by one task
+DEFAULT_TOKENIZE_CHUNK_SIZE = 50
+# count of pairs scored by one task
+DEFAULT_PAIR_CHUNK_SIZE = 2000
+# maximum count of pair tasks of one assignment per worker, every task builds the pair scorer of all codes again
+PAIR_CHUNKS_PER_WORKER = 4
+
+# per-assignment config file, used by assignments_from_directory
+ASSIGNMENT_CONFIG_FILENAME = 'plag-configs.ini'
+
+
+@dataclass
+class Assignment:
+    """Assignment is a directory of codes that are compared with each other.
+
+    Attributes:
+        name (str): Name of the assignment (used for the output file name).
+        directory (str): Directory that contains the codes.
+        config (FeatureConfig/str): Config of the assignment, or file path of .ini config.
+            If set to None, FeatureConfig.default() is used.
+        output_path (str): File path of the output csv. If set to None, '{output_dir}/{name}-features-output.csv'.
+        features_kwargs (dict): Other parameters of create_features_result_df (for example same_segment_nerf).
+
+    """
+    name: str
+    directory: str
+    config: object = None
+    output_path: str = None
+    features_kwargs: dict = field(default_factory=dict)
+
+    def get_config(self):
+        if self.config is None:
+            return FeatureConfig.default()
+        if isinstance(self.config, str):
+            return FeatureConfig.from_ini(self.config)
+        return self.config
+
+
+def assignments_from_directory(parent_directory, config=None, **features_kwargs):
+    """Make an assignment from every sub directory (sorted by name).
+    A sub directory that has its own plag-configs.ini uses that config.
+
+    Args:
+        parent_directory (str): Directory that contains one sub directory per assignment.
+        config (FeatureConfig/str): Config of assignments without their own config file.
+        **features_kwargs: Parameters of create_features_result_df for all assignments.
+
+    Returns:
+        list: A list of Assignment.
+
+    """
+    assignments = []
+    for name in sorted(os.listdir(parent_directory)):
+        directory = os.path.join(parent_directory, name)
+        if not os.path.isdir(directory):
+            continue
+        config_path = os.path.join(directory, ASSIGNMENT_CONFIG_FILENAME)
+        assignment_config = config_path if os.path.exists(config_path) else config
+        assignments.append(Assignment(name, directory, assignment_config, features_kwargs=dict(features_kwargs)))
+    return assignments
+
+
+################
+# Worker Tasks #
+################
+
+
+def _prepare_codes(filepaths, config):
+    # tokenize a chunk of files and build their style sequences
+    codes_df = pd.DataFrame(generate_init_data(filepaths), columns=INIT_COLUMNS)
+    if len(codes_df) > 0:
+        build_style_sequence(codes_df, config=config)
+    return codes_df
+
+
+def _score_pairs(main_codes_df, config, features_kwargs, shard_index, shard_count):
+    # score one chunk (shard) of the pairs of an assignment
+    return create_features_result_df(main_codes_df, config=config, shard_index=shard_index, shard_count=shard_count, **features_kwargs)
+
+
+def count_pair_chunks(code_count, features_kwargs, pair_chunk_size=DEFAULT_PAIR_CHUNK_SIZE, max_chunks=None):
+    """Count pair chunks of an assignment.
+    Skeleton code mined with greedy string tiling compares all pairs, so that nerf is calculated in one chunk.
+
+    Args:
+        code_count (int): Count of codes of the assignment.
+        features_kwargs (dict): Parameters of create_features_result_df.
+        pair_chunk_size (int): Count of pairs per chunk.
+        max_chunks (int): Maximum count of chunks, larger assignments get bigger chunks.
+            Every chunk pickles the codes and builds the pair scorer (bigrams, templates, mining) again.
+            If set to None, there is no maximum.
+
+    Returns:
+        int: Count of chunks (at least 1).
+
+    """
+    mined_nerf = (features_kwargs.get('same_segment_nerf', False) and features_kwargs.get('template_registry') is None
+                  and not features_kwargs.get('frequent_segment_mining', False))
+    if mined_nerf:
+        return 1
+    chunk_count = max(1, -(-count_pairs(code_count) // pair_chunk_size))
+    if max_chunks is not None:
+        chunk_count = min(chunk_count, max(1, max_chunks))
+    return chunk_count
+
+
+def build_assignment_stats(result_scoring_df, main_codes_df, config):
+    """Add token and percentile stats features with the percentiles of this assignment only.
+
+    Args:
+        result_scoring_df (pandas.DataFrame): Features result of the assignment.
+        main_codes_df (pandas.DataFrame): Codes of the assignment.
+        config (FeatureConfig): Config of the assignment.
+
+    Returns:
+        None
+
+    """
+    if len(result_scoring_df) == 0:
+        return
+    main_codes_df = main_codes_df.assign(sequence_len=main_codes_df['sequence'].str.len())
+    build_token_stats_features(result_scoring_df, main_codes_df, config, calculate_tokens_percentile(main_codes_df, config))
+    build_main_style_stats_features(result_scoring_df, config, calculate_features_percentile(result_scoring_df, config))
+
+
+################
+# Batch Runner #
+################
+
+
+def run_batch(assignments, output_dir='.', max_workers=None, tokenize_chunk_size=DEFAULT_TOKENIZE_CHUNK_SIZE,
+              pair_chunk_size=DEFAULT_PAIR_CHUNK_SIZE, keep_results=False):
+    """Calculate features of many assignments on one shared process pool.
+    Tokenization chunks of all assignments are scheduled first, pair chunks of an assignment are scheduled
+    as soon as its codes are ready. Every assignment is written to its own csv (same as the boilerplate code).
+    An error of one assignment stops only that assignment, the other assignments are still calculated.
+
+    Args:
+        assignments (list): A list of Assignment.
+        output_dir (str): Directory of outputs without output_path.
+        max_workers (int): Count of worker processes. If set to None, count of CPUs.
+        tokenize_chunk_size (int): Count of files per tokenization task.
+        pair_chunk_size (int): Count of pairs per scoring task. Large assignments get bigger tasks,
+            at most PAIR_CHUNKS_PER_WORKER tasks per worker and assignment.
+        keep_results (bool): If set to True, the results are also returned as DataFrames.
+
+    Returns:
+        dict: Assignment name to output path (or to features result DataFrame if keep_results),
+            or to the raised exception if the assignment failed.
+
+    """
+    if len({x.name for x in assignments}) != len(assignments):
+        raise ValueError('assignment names must be unique')
+    os.makedirs(output_dir, exist_ok=True)
+    max_pair_chunks = PAIR_CHUNKS_PER_WORKER * (max_workers or os.cpu_count() or 1)
+
+    configs = [None] * len(assignments)
+    codes_parts = dict()
+    result_parts = dict()
+    all_codes_df = dict()
+    outputs = dict()
+    failed = set()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        running = dict()
+
+        def fail_assignment(index, error):
+            # drop the parts and the waiting tasks of the assignment, other assignments go on
+            print('Error assignment: ', assignments[index].name)
+            print(error)
+            failed.add(index)
+            for parts in [codes_parts, result_parts, all_codes_df]:
+                parts.pop(index, None)
+            for future, (_, future_index, _) in list(running.items()):
+                if future_index == index and future.cancel():
+                    running.pop(future)
+            outputs[assignments[index].name] = error
+
+        def finish_assignment(index):
+            assignment = assignments[index]
+            result_scoring_df = pd.concat(result_parts.pop(index), ignore_index=True)
+            build_assignment_stats(result_scoring_df, all_codes_df.pop(index), configs[index])
+
+            output_path = assignment.output_path or os.path.join(output_dir, f'{assignment.name}-features-output.csv')
+            result_scoring_df.to_csv(output_path, index=False)
+            outputs[assignment.name] = result_scoring_df if keep_results else output_path
+
+        def schedule_pairs(index):
+            # same order as the boilerplate code: codes in file order, sorted by line length
+            main_codes_df = pd.concat(codes_parts.pop(index), ignore_index=True)
+            main_codes_df = main_codes_df.sort_values(by=['line_len']).reset_index(drop=True)
+            all_codes_df[index] = main_codes_df
+
+            features_kwargs = assignments[index].features_kwargs
+            shard_count = count_pair_chunks(len(main_codes_df), features_kwargs, pair_chunk_size, max_pair_chunks)
+            result_parts[index] = [None] * shard_count
+            for shard_index in range(shard_count):
+                future = pool.submit(_score_pairs, main_codes_df, configs[index], features_kwargs, shard_index, shard_count)
+                running[future] = ('pairs', index, shard_index)
+
+        for index, assignment in enumerate(assignments):
+            try:
+                configs[index] = assignment.get_config()
+                filepaths = list(get_all_filepaths(assignment.directory))
+            except Exception as error:
+                fail_assignment(index, error)
+                continue
+            chunks = [filepaths[x:x + tokenize_chunk_size] for x in range(0, len(filepaths), tokenize_chunk_size)] or [[]]
+            codes_parts[index] = [None] * len(chunks)
+            for part, chunk in enumerate(chunks):
+                running[pool.submit(_prepare_codes, chunk, configs[index])] = ('codes', index, part)
+
+        while len(running) > 0:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, index, part = running.pop(future)
+                if index in failed:
+                    continue
+                try:
+                    if kind == 'codes':
+                        codes_parts[index][part] = future.result()
+                        if all(x is not None for x in codes_parts[index]):
+                            schedule_pairs(index)
+                    else:
+                        result_parts[index][part] = future.result()
+                        if all(x is not None for x in result_parts[index]):
+                            finish_assignment(index)
+                except Exception as error:
+                    fail_assignment(index, error)
+
+    return outputs
@@ -0,0 +1,224 @@
+"""Corpus is a module that keeps scored codes of an assignment and updates them incrementally.
+Late submissions are tokenized and scored only against the existing codes (new x existing and new x new pairs),
+removed submissions drop their rows. The result is the same as running the whole pipeline again on all codes
+(sorted by line length); percentile thresholds from mergeable sketches are an approximate, faster option.
+"""
+
+import pickle
+
+import pandas as pd
+import numpy as np
+
+import sys
+from os.path import dirname, abspath
+utilities_dir = dirname(abspath(__file__)) +'\\utilities'
+sys.path.append(utilities_dir)
+
+from main_utility import generate_init_data
+from sketch_utility import DEFAULT_SKETCH_K
+from stats_scoring_utility import build_features_sketches, features_percentile_from_sketches, calculate_features_percentile
+from stats_scoring_utility import calculate_tokens_percentile, build_token_stats_features, build_main_style_stats_features
+
+from .FeaturesCalculation import build_style_sequence, create_features_result_df, get_feature_config
+
+
+INIT_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+
+class Corpus:
+    """Corpus holds tokenized codes and the features of all their pairs.
+    Codes are ordered by line length (then by insertion), a pair is always oriented
+    from the earlier code to the later code, the same as create_features_result_df on the sorted codes.
+
+    """
+
+    def __init__(self, config=None, use_preprocessing=True, same_segment_nerf=False, template_registry=None,
+                 sketch_k=DEFAULT_SKETCH_K, **features_kwargs):
+        """
+        Args:
+            config (FeatureConfig): Determines the used features. If set to None, the config of initialize_config is used.
+            use_preprocessing (bool): Same as create_features_result_df.
+            same_segment_nerf (bool): Same as create_features_result_df. Skeleton code mined from the codes
+                depends on all pairs, so the nerf needs a template_registry (nerf values of a pair don't change
+                when codes are added).
+            template_registry (TemplateRegistry): Registered starter codes of the assignment.
+            sketch_k (int): Size parameter of the percentile sketches.
+            **features_kwargs: Other parameters of create_features_result_df
+                (for example css_bit_parallel, style_run_length, deduplicate).
+
+        """
+        if same_segment_nerf and template_registry is None:
+            raise ValueError('incremental nerf needs a template_registry, mined skeleton code depends on all pairs')
+
+        self.config = config if config is not None else get_feature_config()
+        self.use_preprocessing = use_preprocessing
+        self.same_segment_nerf = same_segment_nerf
+        self.template_registry = template_registry
+        self.sketch_k = sketch_k
+        self.features_kwargs = features_kwargs
+
+        self.codes_df = pd.DataFrame(columns=INIT_COLUMNS + ['code_id'])
+        self.result_scoring_df = None
+        self.next_code_id = 0
+        self.features_sketches = None
+
+    def __len__(self):
+        return len(self.codes_df)
+
+    def add(self, filepaths):
+        """Tokenize and add codes, score only the pairs that contain a new code.
+
+        Args:
+            filepaths (list/generator): Contains filepaths of the new codes.
+
+        Returns:
+            pandas.DataFrame: Features of the new pairs (without stats features).
+
+        """
+        new_codes_df = pd.DataFrame(generate_init_data(filepaths), columns=INIT_COLUMNS)
+        return self.add_codes(new_codes_df)
+
+    def add_codes(self, new_codes_df):
+        """Add codes that are already tokenized, score only the pairs that contain a new code.
+
+        Args:
+            new_codes_df (pandas.DataFrame): Init dataframe of the new codes (the product of generate_init_data).
+
+        Returns:
+            pandas.DataFrame: Features of the new pairs (without stats features).
+
+        """
+        new_codes_df = new_codes_df[INIT_COLUMNS].reset_index(drop=True)
+        duplicated = set(new_codes_df['filename']) & set(self.codes_df['filename'])
+        if len(duplicated) > 0 or new_codes_df['filename'].duplicated().any():
+            raise ValueError(f'file names must be unique, already exist: {sorted(duplicated)}')
+
+        build_style_sequence(new_codes_df, config=self.config)
+        new_codes_df['code_id'] = np.arange(self.next_code_id, self.next_code_id + len(new_codes_df))
+        self.next_code_id += len(new_codes_df)
+
+        all_codes_df = pd.concat([self.codes_df, new_codes_df], ignore_index=True)
+        all_codes_df = all_codes_df.sort_values(by=['line_len', 'code_id']).reset_index(drop=True)
+
+        new_positions = np.flatnonzero(all_codes_df['code_id'].isin(new_codes_df['code_id']).to_numpy())
+        new_positions_set = set(new_positions.tolist())
+        pairs = [(min(i, j), max(i, j)) for i in new_positions for j in range(len(all_codes_df))
+                 if j != i and (j not in new_positions_set or j > i)]
+
+        new_result_df = create_features_result_df(all_codes_df, same_segment_nerf=self.same_segment_nerf,
+                                                  use_preprocessing=self.use_preprocessing, template_registry=self.template_registry,
+                                                  config=self.config, pairs=pairs, **self.features_kwargs)
+
+        self.codes_df = all_codes_df
+        if self.result_scoring_df is None:
+            self.result_scoring_df = new_result_df
+        else:
+            self.result_scoring_df = pd.concat([self.result_scoring_df, new_result_df], ignore_index=True)
+
+        if self.features_sketches is not None:
+            self.features_sketches = build_features_sketches(new_result_df, self.features_sketches, self.sketch_k, self.config)
+        return new_result_df
+
+    def remove(self, filenames):
+        """Remove codes and drop the rows of their pairs.
+
+        Args:
+            filenames (str/list): File name (or a list of file names) of the codes.
+
+        Returns:
+            int: Count of dropped pairs.
+
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+
+        self.codes_df = self.codes_df[~self.codes_df['filename'].isin(filenames)].reset_index(drop=True)
+        if self.result_scoring_df is None:
+            return 0
+
+        dropped = (self.result_scoring_df['Filename 1'].isin(filenames) | self.result_scoring_df['Filename 2'].isin(filenames))
+        self.result_scoring_df = self.result_scoring_df[~dropped].reset_index(drop=True)
+
+        # sketches can't remove values, they are rebuilt when the thresholds are needed
+        if dropped.any():
+            self.features_sketches = None
+        return int(dropped.sum())
+
+    def get_percentiles(self, exact=True):
+        """Get percentile thresholds of the tokens length and the features.
+
+        Args:
+            exact (bool): If set to True, feature percentiles are calculated with np.percentile on all pairs,
+                otherwise from the sketches (updated on add, rebuilt after remove, approximate for large corpora).
+
+        Returns:
+            tuple: Contains tokens_percentile, features_percentile (both list).
+
+        """
+        codes_df = self.codes_df.assign(sequence_len=self.codes_df['sequence'].str.len())
+        tokens_percentile = calculate_tokens_percentile(codes_df, self.config)
+
+        if self.result_scoring_df is None or len(self.result_scoring_df) == 0:
+            return tokens_percentile, []
+
+        if exact:
+            return tokens_percentile, calculate_features_percentile(self.result_scoring_df, self.config)
+
+        if self.features_sketches is None:
+            self.features_sketches = build_features_sketches(self.result_scoring_df, None, self.sketch_k, self.config)
+        return tokens_percentile, features_percentile_from_sketches(self.features_sketches, self.config)
+
+    def get_result(self, with_stats=True, exact=True):
+        """Get features of all pairs, same order as create_features_result_df on the sorted codes.
+
+        Args:
+            with_stats (bool): If set to True, token stats and percentile stats features are added.
+            exact (bool): Passed to get_percentiles. If set to False, the '{feature}_more_XX' columns are approximate.
+
+        Returns:
+            pandas.DataFrame: Contains DataFrame for features result.
+
+        """
+        if self.result_scoring_df is None:
+            return None
+
+        positions = pd.Series(np.arange(len(self.codes_df)), index=self.codes_df['filename'])
+        order = np.lexsort((positions[self.result_scoring_df['Filename 2']].to_numpy(),
+                            positions[self.result_scoring_df['Filename 1']].to_numpy()))
+        result_scoring_df = self.result_scoring_df.iloc[order].reset_index(drop=True)
+
+        if with_stats:
+            tokens_percentile, features_percentile = self.get_percentiles(exact)
+            build_token_stats_features(result_scoring_df, self.codes_df, self.config, tokens_percentile)
+            build_main_style_stats_features(result_scoring_df, self.config, features_percentile)
+        return result_scoring_df
+
+    def save(self, file_path):
+        """Save the corpus (codes, pair features and settings) to a file.
+
+        Args:
+            file_path (str): File path of the corpus.
+
+        Returns:
+            None
+
+        """
+        with open(file_path, 'wb') as corpus_file:
+            pickle.dump(self.__dict__, corpus_file)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load a corpus saved by save.
+
+        Args:
+            file_path (str): File path of the corpus.
+
+        Returns:
+            Corpus: The loaded corpus.
+
+        """
+        with open(file_path, 'rb') as corpus_file:
+            state = pickle.load(corpus_file)
+        corpus = cls.__new__(cls)
+        corpus.__dict__.update(state)
+        return corpus
@@ -6,8 +6,8 @@ The dataframe later can be used as a dataset that serves the purpose to create a
 import pandas as pd
 import numpy as np
 from gst_calculation import gst
-import configparser
 
+import os
 import sys
 from os.path import dirname, abspath
 utilities_dir = dirname(abspath(__file__)) +'\\utilities'
@@ -15,13 +15,28 @@ sys.path.append(utilities_dir)
 
 from java_raw_tokenizer import tokenize
 # preprocess and init functions
-from main_utility import get_all_filepaths, preprocess, get_processed_code, generate_init_data
+from main_utility import get_all_filepaths, preprocess, get_processed_code, generate_init_data, get_duplicate_representatives
 # style scoring
 from scoring_utility import consume_mostleft_space, determine_indent_sequence, brace_check, check_charbychar, dup_segment_counter, filter_dup_segment
+from scoring_utility import run_length_encode, rle_greedy_string_tiling
 # main scoring
-from scoring_utility import calculate_css, calculate_clts, calculate_csa, calculate_cln, calculate_cbln80, generate_bigram_lines, count_duplicate_patterns
-
+from scoring_utility import calculate_css, calculate_clts, calculate_csa, calculate_cln, calculate_cbln80, generate_bigram_lines
+from scoring_utility import calculate_cln_from_counts, find_duplicate_patterns
+from scoring_utility import lev_ratio, calculate_css_from_ratio, calculate_clts_from_gst, calculate_cbln80_from_matches, count_cbln80_matches
+from scoring_utility import APPROXIMATED_FEATURES, approximate_lev_ratio, approximate_gst, count_bigram_matches_banded
+from skeleton_utility import SkeletonMatcher
+from segment_mining_utility import frequent_segment_counter
+# all pairs line features
+from sparse_scoring_utility import build_line_features_index, get_pair_line_counts, iter_all_pairs_cln
+# multi machine sharding
+from shard_utility import shard_pairs, select_shard
+# checkpoint and resume
+from checkpoint_utility import PairCheckpoint, corpus_hash, settings_hash, DEFAULT_CHECKPOINT_CHUNK_SIZE
+# memory budget
+from memory_utility import MemoryBudget, SpilledDocuments, SpilledResult, estimate_document_bytes
 from stats_scoring_utility import initialize_stats_config
+# immutable config
+from config_utility import FeatureConfig, read_ini_config, read_comma_separated
 
 # GLOBAL VARIABLES
 STYLE_FEATURE_COLS = ['BS','WS','CS']
@@ -67,35 +82,7 @@ def read_ini(file_path):
         None
 
     """
-    config = configparser.ConfigParser()
-    config.read(file_path)
-    for section in config.sections():
-        for key in config[section]:
-            CONFIG_FROM_FILE[key] = config[section][key]
-
-
-def read_comma_separated(config_text, type=str):
-    """Read and parse comma separated elements from config file.
-    The parsed element will be converted according to specified type.
-    All elements will be returned as list.
-
-    Args:
-        config_text (str): Text from config file that has comma separated structure.
-        type (type): type of the element (supports all python basic types).
-
-    Returns:
-        list: Contains elements from the text
-
-    """
-    config_list = config_text.split(',')
-
-    config_list = [x.strip() for x in config_list]
-    
-    if (len(config_list[0]) == 0):
-        config_list = []
-    config_list = [type(x) for x in config_list]
-
-    return config_list
+    CONFIG_FROM_FILE.update(read_ini_config(file_path))
 
 
 def initialize_config(config_filepath=None):
@@ -141,6 +128,21 @@ def initialize_config(config_filepath=None):
         return PERCENTILES_DEFINE_TOKEN, ADD_PERCENTILE_FEATURE_COLS, PERCENTILES_DEFINE_FEATURE, USED_MAIN_FEATURES
 
 
+def get_feature_config():
+    """Get a FeatureConfig from the config set by initialize_config.
+    Used by the feature calculation when no config is passed.
+
+    Returns:
+        FeatureConfig: Snapshot of the current config.
+
+    """
+    return FeatureConfig(used_main_features=USED_MAIN_FEATURES,
+                         used_style_features=USED_STYLE_FEATURES,
+                         percentiles_define_token=PERCENTILES_DEFINE_TOKEN,
+                         add_percentile_feature_cols=ADD_PERCENTILE_FEATURE_COLS,
+                         percentiles_define_feature=PERCENTILES_DEFINE_FEATURE)
+
+
 def get_code_style_sequence(raw_code):
     """Compile all code style sequence.
     This function will compile all code style sequence (whiteline_sequence, braces_sequence, comments_sequence)
@@ -178,18 +180,23 @@ def get_code_style_sequence(raw_code):
     return whiteline_sequence, braces_sequence, comments_sequence
 
 
-def build_style_sequence(main_codes_df):
+def build_style_sequence(main_codes_df, run_length=False, config=None):
     """Add style sequences to the init DataFrame.
 
     Args:
         main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        run_length (bool): If set to True, run-length encoded style sequences 
+            are also added ('{style}_runs' columns).
+        config (FeatureConfig): If set to None, the config of initialize_config is used.
 
     Returns:
         None
 
     """
+    if config is None:
+        config = get_feature_config()
 
-    if len(USED_STYLE_FEATURES) == 0:
+    if len(config.used_style_features) == 0:
         return
     
     all_styles = []
@@ -200,12 +207,16 @@ def build_style_sequence(main_codes_df):
         all_styles.append([braces_sequence, whiteline_sequence, comments_sequence])
         
     style_sequence_cols = []
-    for label in USED_STYLE_FEATURES:
+    for label in config.used_style_features:
         label += '_sequence'
         style_sequence_cols.append(label)
     
     main_codes_df[style_sequence_cols] = all_styles
 
+    if run_length:
+        for label in config.used_style_features:
+            main_codes_df[label + '_runs'] = [run_length_encode(x) for x in main_codes_df[label + '_sequence']]
+
 
 def calculate_style_feature(sequence_1, sequence_2):
     """Calculate style sequence using greedy string tiling algorithm.
@@ -235,7 +246,61 @@ def calculate_style_feature(sequence_1, sequence_2):
         return total_score / min_len
 
 
-def calculate_main_features(sequence_line_l, sequence_l, sequence_line_r, sequence_r, line_len_l, same_segment_nerf=False, all_duplicate_line_sequences=None):
+def calculate_rle_style_feature(runs_1, runs_2):
+    """Calculate style feature from run-length encoded style sequences.
+    Same normalization as calculate_style_feature, but the tiling works on runs
+    (rle_greedy_string_tiling), so the cost depends on the number of runs.
+
+    Args:
+        runs_1 (list): run-length encoded style sequence 1.
+        runs_2 (list): run-length encoded style sequence 2.
+
+    Returns:
+        float: normalized score (between 0-1)
+
+    """
+    len_sequence_1 = sum(length for _, length in runs_1)
+    len_sequence_2 = sum(length for _, length in runs_2)
+
+    total_score = rle_greedy_string_tiling(runs_1, runs_2)[1]
+
+    # if style sequence minimum len is 0, then return 0 as the score
+    min_len = min(len_sequence_1, len_sequence_2)
+
+    if(min_len == 0):
+        return 0
+    else:
+        return total_score / min_len
+
+
+def calculate_approximate_style_feature(sequence_1, sequence_2, max_cells):
+    """Calculate style feature of long style sequences with approximate_gst.
+    Same normalization as calculate_style_feature, the tiling compares at most max_cells symbol pairs.
+
+    Args:
+        sequence_1 (list): style sequence 1.
+        sequence_2 (list): style sequence 2.
+        max_cells (int): Maximum count of compared cells (len_1 * len_2 of all tiled blocks).
+
+    Returns:
+        float: normalized score (between 0-1)
+
+    """
+    total_score = approximate_gst(sequence_1, sequence_2, max_cells)[1]
+
+    # if style sequence minimum len is 0, then return 0 as the score
+    min_len = min(len(sequence_1), len(sequence_2))
+
+    if(min_len == 0):
+        return 0
+    else:
+        return total_score / min_len
+
+
+def calculate_main_features(sequence_line_l, sequence_l, sequence_line_r, sequence_r, line_len_l, same_segment_nerf=False, all_duplicate_line_sequences=None,
+                            css_min_ratio=None, css_bit_parallel=False,
+                            bigram_line_l=None, bigram_line_r=None, line_counts=None, bigram_counts=None,
+                            duplicate_pattern_lengths=None, config=None, size_budget=None, approximated_features=None):
     """Compile all main features.
 
     Args:
@@ -248,161 +313,527 @@ def calculate_main_features(sequence_line_l, sequence_l, sequence_line_r, sequen
             (same segment / duplicate segment nerf calculation).
         all_duplicate_line_sequences (dict): Contains pattern as key and count as value.
             Pattern is a list of tokens that are converted into a string.
+        css_min_ratio (float): Cutoff for CSS, will be passed to calculate_css as min_ratio.
+        css_bit_parallel (bool): If set to True, CSS use the bit-parallel engine.
+        bigram_line_l (list): Bigram lines of code 1. If set to None, generated from sequence_line_l.
+        bigram_line_r (list): Bigram lines of code 2. If set to None, generated from sequence_line_r.
+        line_counts (tuple): Precounted (duplicated_lines, distinct_len_l, distinct_len_r) for CLN.
+            If set to None, CLN counts the lines of the pair.
+        bigram_counts (tuple): Precounted (duplicated_lines, distinct_len_l, distinct_len_r) for CBLN.
+            If set to None, CBLN counts the bigram lines of the pair.
+        duplicate_pattern_lengths (tuple): Precomputed (same_line_length, same_sequence_length) for the nerf,
+            the product of SkeletonMatcher.match_pair. If set to None, find_duplicate_patterns is used.
+        config (FeatureConfig): If set to None, the config of initialize_config is used.
+        size_budget (int/dict): Maximum compared cells of CSS (tokens_l * tokens_r), CLTS (lines_l * lines_r)
+            and CBLN80 (bigram_lines_l * bigram_lines_r), one value for all or a dict per feature
+            (the style features keys are read by build_pair_scorer).
+            Features of pairs above the budget are calculated with a bounded approximation
+            (approximate_lev_ratio, approximate_gst, count_bigram_matches_banded). If set to None, always exact.
+        approximated_features (list): If given, names of the approximated features are appended to it.
 
     Returns:
         tuple: Contains all main features (css, clts, clts_dicts, csa, cln, cbln, cbln80)
 
     """
-    if (same_segment_nerf):
-        count_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences)
+    if config is None:
+        config = get_feature_config()
+
+    # nerf values are passed to the scoring functions (no shared state between pairs)
+    if (same_segment_nerf and duplicate_pattern_lengths is None):
+        duplicate_pattern_lengths = find_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences)
+
+    if size_budget is None:
+        size_budget = dict()
+    elif not isinstance(size_budget, dict):
+        size_budget = {feature: size_budget for feature in APPROXIMATED_FEATURES}
+    if approximated_features is None:
+        approximated_features = []
     
-    if ('CSS' in USED_MAIN_FEATURES):
-        css = calculate_css(sequence_l, sequence_r, nerf=same_segment_nerf)
+    if ('CSS' in config.used_main_features) and len(sequence_l) * len(sequence_r) > size_budget.get('CSS', np.inf):
+        css = calculate_css_from_ratio(approximate_lev_ratio(sequence_l, sequence_r, size_budget['CSS']),
+                                       len(sequence_l) + len(sequence_r), same_segment_nerf, duplicate_pattern_lengths)
+        approximated_features.append('CSS')
+    elif ('CSS' in config.used_main_features):
+        css = calculate_css(sequence_l, sequence_r, nerf=same_segment_nerf,
+                            min_ratio=css_min_ratio, bit_parallel=css_bit_parallel,
+                            duplicate_pattern_lengths=duplicate_pattern_lengths)
     else:
         css = None
     
-    if ('CLTS' in USED_MAIN_FEATURES):
-        clts, clts_dicts = calculate_clts(sequence_line_l, sequence_line_r, line_len_l, same_segment_nerf, all_duplicate_line_sequences)
+    if ('CLTS' in config.used_main_features) and len(sequence_line_l) * len(sequence_line_r) > size_budget.get('CLTS', np.inf):
+        gst_calculate = approximate_gst(sequence_line_l, sequence_line_r, size_budget['CLTS'])
+        clts, clts_dicts = calculate_clts_from_gst(gst_calculate, sequence_line_l, line_len_l, same_segment_nerf,
+                                                   all_duplicate_line_sequences, duplicate_pattern_lengths)
+        approximated_features.append('CLTS')
+    elif ('CLTS' in config.used_main_features):
+        clts, clts_dicts = calculate_clts(sequence_line_l, sequence_line_r, line_len_l, same_segment_nerf, all_duplicate_line_sequences,
+                                          duplicate_pattern_lengths)
     else:
         clts, clts_dicts = None, None
     
-    if ('CSA' in USED_MAIN_FEATURES):
+    if ('CSA' in config.used_main_features):
         csa = calculate_csa(css, clts)
     else:
         csa = 0
     
-    if('CLN' in USED_MAIN_FEATURES):
-        cln = calculate_cln(sequence_line_l, sequence_line_r, nerf=same_segment_nerf)
+    if('CLN' in config.used_main_features):
+        if line_counts is not None:
+            cln = calculate_cln_from_counts(*line_counts, nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
+        else:
+            cln = calculate_cln(sequence_line_l, sequence_line_r, nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
     else:
         cln = 0
     
-    bigram_line_l = generate_bigram_lines(sequence_line_l)
-    bigram_line_r = generate_bigram_lines(sequence_line_r)
-
-    if('CBLN' in USED_MAIN_FEATURES):
-        cbln = calculate_cln(bigram_line_l, bigram_line_r, nerf=same_segment_nerf)
+    if bigram_line_l is None:
+        bigram_line_l = generate_bigram_lines(sequence_line_l)
+    if bigram_line_r is None:
+        bigram_line_r = generate_bigram_lines(sequence_line_r)
+
+    if('CBLN' in config.used_main_features):
+        if bigram_counts is not None:
+            cbln = calculate_cln_from_counts(*bigram_counts, nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
+        else:
+            cbln = calculate_cln(bigram_line_l, bigram_line_r, nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
     else:
         cbln = 0
     
-    if('CBLN80' in USED_MAIN_FEATURES):
-        cbln80 = calculate_cbln80(bigram_line_l, bigram_line_r, nerf=same_segment_nerf)
+    if('CBLN80' in config.used_main_features) and len(bigram_line_l) * len(bigram_line_r) > size_budget.get('CBLN80', np.inf):
+        counter80 = count_bigram_matches_banded(bigram_line_l, bigram_line_r, size_budget['CBLN80'])
+        cbln80 = calculate_cbln80_from_matches(counter80, len(bigram_line_l), same_segment_nerf, duplicate_pattern_lengths)
+        approximated_features.append('CBLN80')
+    elif('CBLN80' in config.used_main_features):
+        cbln80 = calculate_cbln80(bigram_line_l, bigram_line_r, nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
     else:
         cbln80 = 0
     
     return (css, clts, clts_dicts, csa, cln, cbln, cbln80)
 
 
-def create_features_result_df(main_codes_df, same_segment_nerf = False, minimal_pair_have_same_segment=0.25, use_preprocessing=True):
-    """Compile all main features and style features into a DataFrame.
+def build_pair_scorer(main_codes_df, same_segment_nerf=False, minimal_pair_have_same_segment=0.25, use_preprocessing=True,
+                      css_min_ratio=None, css_bit_parallel=False, sparse_line_features=False, style_run_length=False,
+                      frequent_segment_mining=False, template_registry=None, config=None, document_bytes=None, pair_size_budget=None,
+                      document_spill_dir=None):
+    """Prepare everything that is calculated once per code (nerf patterns, bigram lines, style runs, line index)
+    and return a function that scores a pair of codes.
+    Parameters are the same as create_features_result_df.
 
     Args:
         main_codes_df (pandas.DataFrame): Taken from init dataframe.
-        same_segment_nerf (bool): If set to True, the score will be nerfed 
-            (same segment / duplicate segment nerf calculation)
-        minimal_pair_have_same_segment (float): Minimum percentage of code pairs having the 
-            same pattern (for that pattern to be considered as a duplicate pattern / skeleton code).
-            Will be used by filter_dup_segment function.
-        use_preprocessing (bool): If set to True, then the model will use preprocess for the
-            features calculation, otherwise for False.
+        document_bytes (int): If given, and the payloads of all codes (scored columns, bigram lines, style runs)
+            don't fit document_bytes, the payloads are spilled to disk and loaded per pair (SpilledDocuments).
+        document_spill_dir (str): Directory of the spilled payloads. If set to None, a temporary directory.
 
     Returns:
-        pandas.DataFrame: Contains DataFrame for features result.
+        function: Returns scores of the pair (i, j) (row positions, code i is the left code), a tuple of
+            (shortest_tokens_length, clts_dicts, css, clts, csa, bs, ws, cs, cssa, cln, cbln, cbln80)
+            followed by the approximated features names if pair_size_budget is given.
 
     """
+    if config is None:
+        config = get_feature_config()
 
     # handle if nerf features
     all_duplicate_line_sequences = None
-    if same_segment_nerf:
+    if same_segment_nerf and template_registry is not None:
+        lines_col = 'sequence_line' if use_preprocessing else 'raw_sequence_line'
+        # segments are collected from the current codes only, the registry is not changed
+        matched_segments = dict()
+        all_template_masks = [template_registry.match(x, matched_segments) for x in main_codes_df[lines_col]]
+        all_duplicate_line_sequences = template_registry.duplicate_line_sequences(matched_segments)
+    elif same_segment_nerf and frequent_segment_mining:
+        duplicate_segments_counter = frequent_segment_counter(main_codes_df)
+        all_duplicate_line_sequences = filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_have_same_segment,
+                                                          document_frequency=True)
+    elif same_segment_nerf:
         duplicate_segments_counter = dup_segment_counter(main_codes_df)
         all_duplicate_line_sequences = filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_have_same_segment)
 
-    features_data = []
-    # start = time.time()
-    for i in range(len(main_codes_df)):
-        for j in range(i+1, len(main_codes_df)):
+    # duplicate patterns are matched once per code
+    skeleton_matcher = None
+    if same_segment_nerf and template_registry is None:
+        skeleton_matcher = SkeletonMatcher(all_duplicate_line_sequences)
+        sequence_col = 'sequence' if use_preprocessing else 'raw_code'
+        for index, sequence in enumerate(main_codes_df[sequence_col]):
+            skeleton_matcher.add_document(index, sequence)
+
+    # columns of a code that are read by calculate_pair
+    if use_preprocessing:
+        document_columns = ['sequence_line', 'sequence', 'line_len']
+    else:
+        document_columns = ['raw_sequence_line', 'raw_code']
+    if not style_run_length:
+        document_columns += [label + '_sequence' for label in ['WS', 'BS', 'CS'] if label in config.used_style_features]
+    all_sequence_lines = list(main_codes_df[document_columns[0]])
+
+    def encode_style_runs(label, position):
+        if label + '_runs' in main_codes_df.columns:
+            return main_codes_df[label + '_runs'].iloc[position]
+        return run_length_encode(main_codes_df[label + '_sequence'].iloc[position])
+
+    # payloads of the codes are spilled to disk if they don't fit document_bytes
+    documents = None
+    if document_bytes is not None:
+        style_columns = [label + '_sequence' for label in config.used_style_features] if style_run_length else []
+        estimated_bytes = sum(estimate_document_bytes(code_values[1:], code_values[0]) for code_values
+                              in zip(all_sequence_lines, *[main_codes_df[x] for x in document_columns + style_columns]))
+        if estimated_bytes > document_bytes:
+            def build_document(position):
+                code_data = main_codes_df.iloc[position]
+                document = {x: code_data[x] for x in document_columns}
+                document['bigram_lines'] = generate_bigram_lines(all_sequence_lines[position])
+                if style_run_length:
+                    for label in config.used_style_features:
+                        document[label + '_runs'] = encode_style_runs(label, position)
+                return document
+            documents = SpilledDocuments(build_document, len(main_codes_df), document_bytes, document_spill_dir)
+
+    # bigram lines are generated once per code
+    all_bigram_lines = None
+    if documents is None:
+        all_bigram_lines = [generate_bigram_lines(x) for x in all_sequence_lines]
+
+    # run-length encoded style sequences, encoded once per code
+    all_style_runs = dict()
+    if style_run_length and documents is None:
+        for label in config.used_style_features:
+            if label + '_runs' in main_codes_df.columns:
+                all_style_runs[label] = list(main_codes_df[label + '_runs'])
+            else:
+                all_style_runs[label] = [run_length_encode(x) for x in main_codes_df[label + '_sequence']]
+
+    line_features_index = None
+    if sparse_line_features:
+        line_features_index = build_line_features_index(main_codes_df, use_preprocessing)
+
+    def style_runs(label, position, code_data):
+        if documents is not None:
+            return code_data[label + '_runs']
+        return all_style_runs[label][position]
+
+    # style budgets of the pair, the main feature budgets are read by calculate_main_features
+    if pair_size_budget is None or isinstance(pair_size_budget, dict):
+        style_size_budget = pair_size_budget or dict()
+    else:
+        style_size_budget = {label: pair_size_budget for label in APPROXIMATED_FEATURES}
+
+    def calculate_style(label, i, j, code_data_l, code_data_r, approximated_features):
+        # style feature of the pair, approximated above the style budget of the label
+        if style_run_length:
+            runs_l, runs_r = style_runs(label, i, code_data_l), style_runs(label, j, code_data_r)
+            if len(runs_l) * len(runs_r) <= style_size_budget.get(label, np.inf):
+                return calculate_rle_style_feature(runs_l, runs_r)
+            style_sequence_l = [symbol for symbol, length in runs_l for _ in range(length)]
+            style_sequence_r = [symbol for symbol, length in runs_r for _ in range(length)]
+        else:
+            style_sequence_l, style_sequence_r = code_data_l[label + '_sequence'], code_data_r[label + '_sequence']
+            if len(style_sequence_l) * len(style_sequence_r) <= style_size_budget.get(label, np.inf):
+                return calculate_style_feature(style_sequence_l, style_sequence_r)
+        approximated_features.append(label)
+        return calculate_approximate_style_feature(style_sequence_l, style_sequence_r, style_size_budget[label])
+
+    def calculate_pair(i, j):
+        # scores of the pair (i, j), code i is the left code
+        if documents is not None:
+            # pairs are scanned row by row, the row code stays loaded
+            documents.pin(i)
+            code_data_l = documents[i]
+            code_data_r = documents[j]
+            bigram_lines_l = code_data_l['bigram_lines']
+            bigram_lines_r = code_data_r['bigram_lines']
+        else:
             code_data_l = main_codes_df.iloc[i]
             code_data_r = main_codes_df.iloc[j]
+            bigram_lines_l = all_bigram_lines[i]
+            bigram_lines_r = all_bigram_lines[j]
+
+        if use_preprocessing:
+            sequence_line_l = code_data_l['sequence_line']
+            sequence_l = code_data_l['sequence']
+        else:
+            sequence_line_l = code_data_l['raw_sequence_line']
+            sequence_l = code_data_l['raw_code']
+
+        if use_preprocessing:
+            sequence_line_r = code_data_r['sequence_line']
+            sequence_r = code_data_r['sequence']
+        else:
+            sequence_line_r = code_data_r['raw_sequence_line']
+            sequence_r = code_data_r['raw_code']
+
+        # shortest length of line 
+        if use_preprocessing:
+            line_len_l = code_data_l['line_len']
+        else:
+            line_len_l = min(len(sequence_line_l), len(sequence_line_r))
+
+        approximated_features = []
+
+        #WS feature
+        if ('WS' in config.used_style_features):
+            ws = calculate_style('WS', i, j, code_data_l, code_data_r, approximated_features)
+        else:
+            ws = 0
+            
+        #BS feature
+        if('BS' in config.used_style_features):
+            bs = calculate_style('BS', i, j, code_data_l, code_data_r, approximated_features)
+        else:
+            bs = 0
+
+        #CS feature
+        if('CS' in config.used_style_features):
+            cs = calculate_style('CS', i, j, code_data_l, code_data_r, approximated_features)
+        else:
+            cs = 0
+
+        #CSSA feature
+        if('CSSA' in config.used_style_features):
+            cssa = np.average([ws,bs,cs])
+        else:
+            cssa = 0
+
+        shortest_tokens_length = len(sequence_l)
+        if len(sequence_r) < shortest_tokens_length:
+            shortest_tokens_length = len(sequence_r)
+
+        line_counts, bigram_counts = None, None
+        if line_features_index is not None:
+            line_counts = get_pair_line_counts(line_features_index['line'], i, j)
+            bigram_counts = get_pair_line_counts(line_features_index['bigram'], i, j)
+
+        duplicate_pattern_lengths = None
+        if skeleton_matcher is not None:
+            duplicate_pattern_lengths = skeleton_matcher.match_pair(i, j)[:2]
+        elif same_segment_nerf and template_registry is not None:
+            duplicate_pattern_lengths = template_registry.pair_lengths(all_template_masks[i], all_template_masks[j])
+
+        css, clts, clts_dicts, csa, cln, cbln, cbln80 = calculate_main_features(
+            sequence_line_l, sequence_l, sequence_line_r, sequence_r, line_len_l,
+            same_segment_nerf, all_duplicate_line_sequences, css_min_ratio, css_bit_parallel,
+            bigram_lines_l, bigram_lines_r, line_counts, bigram_counts,
+            duplicate_pattern_lengths, config, pair_size_budget, approximated_features)
+        scores = (shortest_tokens_length, clts_dicts, css, clts, csa, bs, ws, cs, cssa, cln, cbln, cbln80)
+        if pair_size_budget is not None:
+            scores += (','.join(approximated_features),)
+        return scores
+
+    return calculate_pair
+
+
+def create_features_result_df(main_codes_df, same_segment_nerf = False, minimal_pair_have_same_segment=0.25, use_preprocessing=True,
+                              css_min_ratio=None, css_bit_parallel=False, sparse_line_features=False, style_run_length=False,
+                              frequent_segment_mining=False, template_registry=None, config=None, deduplicate=False, pairs=None,
+                              result_store=None, shard_index=None, shard_count=None, checkpoint_dir=None, resume=False,
+                              checkpoint_chunk_size=DEFAULT_CHECKPOINT_CHUNK_SIZE, memory_budget=None, spill_dir=None,
+                              pair_size_budget=None):
+    """Compile all main features and style features into a DataFrame.
 
-            filename_l = code_data_l['filename']
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        same_segment_nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        minimal_pair_have_same_segment (float): Minimum percentage of code pairs having the 
+            same pattern (for that pattern to be considered as a duplicate pattern / skeleton code).
+            Will be used by filter_dup_segment function.
+        use_preprocessing (bool): If set to True, then the model will use preprocess for the
+            features calculation, otherwise for False.
+        css_min_ratio (float): Cutoff for CSS. Pairs with CSS lower than css_min_ratio
+            stop early and get an upper bound of CSS instead of the exact value.
+            Set to None to always calculate the exact CSS.
+        css_bit_parallel (bool): If set to True, CSS use the bit-parallel engine
+            (same result as the default engine).
+        sparse_line_features (bool): If set to True, shared lines for CLN and CBLN are counted for all pairs
+            with sparse matrix product (sparse_scoring_utility, one block of rows at a time), instead of set operations per pair.
+        style_run_length (bool): If set to True, style features are tiled on run-length encoded 
+            style sequences ('{style}_runs' columns, encoded here if missing). Faster for long sequences,
+            same tiles as the default tiling.
+        frequent_segment_mining (bool): If set to True, duplicate segments for the nerf are mined 
+            from all codes at once with suffix array (frequent_segment_counter) and selected by 
+            document frequency, instead of greedy string tiling on all pairs (dup_segment_counter).
+        template_registry (TemplateRegistry): Registered starter codes of the assignment (template_utility).
+            If given, the nerf subtracts the template lines that exist on both codes,
+            no duplicate segments are mined from the codes.
+        config (FeatureConfig): Determines the used features. If set to None, the config of initialize_config is used.
+            Passing a config makes the calculation independent from the module config,
+            so it's safe to run multiple calculations concurrently (for example in threads).
+        deduplicate (bool): If set to True, codes with identical scored content (get_duplicate_representatives)
+            are scored once and their results are copied to every member (same result, fewer pairs).
+        pairs (list): Pairs (i, j) of row positions to score, for example the product of
+            generate_candidate_pairs (lsh_utility). If set to None, all pairs are scored.
+        result_store (ResultStore): If given, rows are inserted into the store (result_store_utility)
+            every result_store.batch_size pairs instead of being kept in memory.
+        shard_index (int): Index of the shard to score (0 to shard_count - 1), see shard_utility.
+        shard_count (int): If given, pairs (all pairs, or the given pairs) are split into shard_count
+            contiguous balanced shards and only the shard_index shard is scored. With more than one shard,
+            the nerf needs a template_registry or frequent_segment_mining (mining with dup_segment_counter compares all pairs).
+        checkpoint_dir (str): If given, every checkpoint_chunk_size finished pairs are saved to this
+            local directory (checkpoint_utility).
+        resume (bool): If set to True, finished pair ranges in checkpoint_dir are loaded instead of scored.
+            Codes and settings must be the same as the checkpointed run. With a result_store, rows that
+            the checkpointed run already committed to the (same) store are not inserted again.
+        checkpoint_chunk_size (int): Count of pairs per checkpointed range.
+        memory_budget (int/str): Memory limit of the calculation, for example '2G' (memory_utility).
+            Per-code data (sequences, bigram lines) is spilled to spill_dir/documents if it doesn't fit,
+            result rows are spilled to spill_dir in chunks sized from the measured row footprint.
+        spill_dir (str): Directory of the spilled result chunks and codes. If set to None, a temporary directory.
+        pair_size_budget (int/dict): Size budget of the expensive features of a pair (see calculate_main_features size_budget).
+            WS, BS and CS budget the compared style symbols (len_l * len_r, runs_l * runs_r with style_run_length).
+            If given, pathological pairs are approximated and flagged in the 'Approximated Features' column.
 
-            if use_preprocessing:
-                sequence_line_l = code_data_l['sequence_line']
-                sequence_l = code_data_l['sequence']
-            else:
-                sequence_line_l = code_data_l['raw_sequence_line']
-                sequence_l = code_data_l['raw_code']
-            line_pos_l = code_data_l['line_pos']
+    Returns:
+        pandas.DataFrame: Contains DataFrame for features result (None if result_store is given,
+            SpilledResult if memory_budget is given).
 
-            filename_r = code_data_r['filename']
-            if use_preprocessing:
-                sequence_line_r = code_data_r['sequence_line']
-                sequence_r = code_data_r['sequence']
+    """
+    if config is None:
+        config = get_feature_config()
+
+    if (shard_count is not None and shard_count > 1 and same_segment_nerf and template_registry is None
+            and not frequent_segment_mining):
+        raise ValueError('sharded nerf needs a template_registry or frequent_segment_mining=True, '
+                         'mined skeleton code compares all pairs in every shard')
+
+    budget = None
+    if memory_budget is not None:
+        budget = MemoryBudget(memory_budget)
+
+    calculate_pair = build_pair_scorer(main_codes_df, same_segment_nerf, minimal_pair_have_same_segment, use_preprocessing,
+                                       css_min_ratio, css_bit_parallel, sparse_line_features, style_run_length,
+                                       frequent_segment_mining, template_registry, config,
+                                       None if budget is None else budget.document_bytes, pair_size_budget,
+                                       None if spill_dir is None else os.path.join(spill_dir, 'documents'))
+
+    # duplicate submissions are scored once, by their representative
+    representatives = None
+    if deduplicate:
+        representatives = get_duplicate_representatives(main_codes_df, use_preprocessing)
+        group_sizes = np.bincount(representatives, minlength=len(main_codes_df))
+    all_filenames = list(main_codes_df['filename'])
+    all_line_pos = list(main_codes_df['line_pos'])
+
+    if pairs is None and shard_count is not None:
+        pairs = shard_pairs(len(main_codes_df), shard_index, shard_count)
+    elif pairs is None:
+        pairs = ((i, j) for i in range(len(main_codes_df)) for j in range(i+1, len(main_codes_df)))
+    else:
+        # same orientation and order as the full calculation
+        pairs = sorted({(min(i, j), max(i, j)) for i, j in pairs if i != j})
+        if shard_count is not None:
+            pairs = select_shard(pairs, shard_index, shard_count)
+
+    pair_scores = dict()
+    def score_row(i, j):
+        if representatives is None:
+            scores = calculate_pair(i, j)
+        else:
+            # pairs within the same group are scored once as (representative, representative),
+            # only pairs with a duplicated code are kept (a pair of unique codes is scored once anyway)
+            key = (representatives[i], representatives[j])
+            if group_sizes[key[0]] == 1 and group_sizes[key[1]] == 1:
+                scores = calculate_pair(*key)
+            elif key in pair_scores:
+                scores = pair_scores[key]
             else:
-                sequence_line_r = code_data_r['raw_sequence_line']
-                sequence_r = code_data_r['raw_code']
+                scores = pair_scores[key] = calculate_pair(*key)
+        return (all_filenames[i], all_filenames[j], all_line_pos[i], all_line_pos[j]) + scores
 
-            line_pos_r = code_data_r['line_pos']
+    if checkpoint_dir is None:
+        rows = (score_row(i, j) for i, j in pairs)
+    else:
+        settings = {
+            'config': config, 'same_segment_nerf': same_segment_nerf, 'minimal_pair_have_same_segment': minimal_pair_have_same_segment,
+            'use_preprocessing': use_preprocessing, 'css_min_ratio': css_min_ratio, 'css_bit_parallel': css_bit_parallel,
+            'sparse_line_features': sparse_line_features, 'style_run_length': style_run_length,
+            'frequent_segment_mining': frequent_segment_mining, 'shard_index': shard_index, 'shard_count': shard_count,
+            'pair_size_budget': pair_size_budget,
+            'pairs': pairs if isinstance(pairs, list) else None,
+            'template_registry': None if template_registry is None else (template_registry.minimal_segment_lines,
+                                                                         template_registry.use_preprocessing,
+                                                                         template_registry.template_lines),
+        }
+        checkpoint = PairCheckpoint(checkpoint_dir, corpus_hash(main_codes_df), settings_hash(settings), resume, checkpoint_chunk_size)
+        rows = checkpoint.iterate_rows(pairs, score_row)
+
+    with_approximated = pair_size_budget is not None
+    spilled_result = None
+    if budget is not None and result_store is None:
+        spilled_result = SpilledResult(spill_dir)
+
+    # rows that the checkpointed run already committed to the store are not inserted again
+    committed_count = 0
+    store_length = 0
+    if result_store is not None and checkpoint_dir is not None:
+        store_length = len(result_store)
+        committed_count = checkpoint.start_store(store_length)
+
+    def insert_rows(features_data, end_rank):
+        nonlocal store_length
+        result_store.insert_df(build_result_df(features_data, config, with_approximated))
+        if checkpoint_dir is not None:
+            result_store.flush()
+            store_length += len(features_data)
+            checkpoint.save_store(end_rank, store_length)
 
-            # shortest length of line 
-            if use_preprocessing:
-                line_len_l = code_data_l['line_len']
+    features_data = []
+    end_rank = 0
+    for end_rank, row in enumerate(rows, 1):
+        if end_rank <= committed_count:
+            continue
+        features_data.append(row)
+        if budget is not None:
+            budget.add_row(row)
+
+        if result_store is not None and len(features_data) >= result_store.batch_size:
+            insert_rows(features_data, end_rank)
+            features_data = []
+        elif budget is not None and len(features_data) >= budget.row_limit():
+            if result_store is not None:
+                insert_rows(features_data, end_rank)
             else:
-                line_len_l = min(len(sequence_line_l), len(sequence_line_r))
+                spilled_result.add(build_result_df(features_data, config, with_approximated))
+            features_data = []
+
+    if result_store is not None:
+        if len(features_data) > 0:
+            insert_rows(features_data, end_rank)
+        result_store.flush()
+        return None
+
+    if spilled_result is not None:
+        if len(features_data) > 0:
+            spilled_result.add(build_result_df(features_data, config, with_approximated))
+        return spilled_result
+    
+    return build_result_df(features_data, config, with_approximated)
 
-            #WS feature
-            if ('WS' in USED_STYLE_FEATURES):
-                ws_sequence_l = code_data_l['WS_sequence']
-                ws_sequence_r = code_data_r['WS_sequence']
-                ws = calculate_style_feature(ws_sequence_l, ws_sequence_r)
-            else:
-                ws = 0
-            
-            #BS feature
-            if('BS' in USED_STYLE_FEATURES):
-                bs_sequence_l = code_data_l['BS_sequence']
-                bs_sequence_r = code_data_r['BS_sequence']
-                bs = calculate_style_feature(bs_sequence_l, bs_sequence_r)
-            else:
-                bs = 0
 
-            #CS feature
-            if('CS' in USED_STYLE_FEATURES):
-                cs_sequence_l = code_data_l['CS_sequence']
-                cs_sequence_r = code_data_r['CS_sequence']
-                cs = calculate_style_feature(cs_sequence_l, cs_sequence_r)
-            else:
-                cs = 0
+def build_result_df(features_data, config, with_approximated=False):
+    """Build features result DataFrame from the calculated pairs, only with the used features.
 
-            #CSSA feature
-            if('CSSA' in USED_STYLE_FEATURES):
-                cssa = np.average([ws,bs,cs])
-            else:
-                cssa = 0
-
-            shortest_tokens_length = len(sequence_l)
-            if len(sequence_r) < shortest_tokens_length:
-                shortest_tokens_length = len(sequence_r)
-
-            css, clts, clts_dicts, csa, cln, cbln, cbln80 = calculate_main_features(
-                sequence_line_l, sequence_l, sequence_line_r, sequence_r, line_len_l,
-                same_segment_nerf, all_duplicate_line_sequences)
-            current_data = (filename_l, filename_r, line_pos_l, line_pos_r, shortest_tokens_length, clts_dicts,
-                            css, clts, csa, bs, ws, cs, cssa, cln, cbln, cbln80)
-            features_data.append(current_data)
-            # break
-        # break
-    
+    Args:
+        features_data (list): A list of tuples (filename_l, filename_r, line_pos_l, line_pos_r, shortest_tokens_length,
+            clts_dicts, css, clts, csa, bs, ws, cs, cssa, cln, cbln, cbln80), one per pair.
+        config (FeatureConfig): Determines the used features.
+        with_approximated (bool): If set to True, the tuples end with approximated features names
+            (comma separated), kept as 'Approximated Features' column.
+
+    Returns:
+        pandas.DataFrame: Contains DataFrame for features result.
+
+    """
     columns = ['Filename 1', 'Filename 2', 'Line Pos 1', 'Line Pos 2', 'Shortest Token Length', 'CLTS Dicts',
                'CSS', 'CLTS', 'CSA', 'BS', 'WS', 'CS', 'CSSA', 'CLN', 'CBLN', 'CBLN80']
+    if with_approximated:
+        columns += ['Approximated Features']
     result_scoring_df = pd.DataFrame(features_data, columns=columns)
 
 
     # adjust columns to only used features
     columns = ['Filename 1', 'Filename 2', 'Line Pos 1', 'Line Pos 2', 'Shortest Token Length']
-    if ('CLTS' in USED_MAIN_FEATURES):
+    if ('CLTS' in config.used_main_features):
         columns += ['CLTS Dicts']
 
-    columns += (USED_MAIN_FEATURES + USED_STYLE_FEATURES)
+    columns += (list(config.used_main_features) + list(config.used_style_features))
 
     # remove column names that will be calculated later
     try:
@@ -411,6 +842,326 @@ def create_features_result_df(main_codes_df, same_segment_nerf = False, minimal_
     except:
         pass
 
+    if with_approximated:
+        columns += ['Approximated Features']
+
     result_scoring_df = result_scoring_df[columns]
     
     return result_scoring_df
+
+
+###################
+# Parameter Sweep #
+###################
+
+
+def calculate_pair_intermediates(main_codes_df, use_preprocessing=True, config=None):
+    """Calculate raw (not nerfed) intermediates of every pair, shared by all configs of a sweep.
+    Contains GST tiles of lines and style sequences, levenshtein ratio, shared line counts
+    and matched bigram lines, only for the features used by the config.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe (after "build_style_sequence").
+        use_preprocessing (bool): If set to True, then the model will use preprocess for the
+            features calculation, otherwise for False.
+        config (FeatureConfig): Determines the features to calculate (for a sweep, the union of all configs).
+            If set to None, the config of initialize_config is used.
+
+    Returns:
+        list: A list of dicts, one per pair (same order as create_features_result_df).
+
+    """
+    if config is None:
+        config = get_feature_config()
+    used_main_features = config.used_main_features
+
+    if use_preprocessing:
+        all_sequence_lines = list(main_codes_df['sequence_line'])
+        all_sequences = list(main_codes_df['sequence'])
+    else:
+        all_sequence_lines = list(main_codes_df['raw_sequence_line'])
+        all_sequences = list(main_codes_df['raw_code'])
+    all_bigram_lines = [generate_bigram_lines(x) for x in all_sequence_lines]
+
+    all_style_sequences = dict()
+    for label in config.used_style_features:
+        all_style_sequences[label] = list(main_codes_df[label + '_sequence'])
+
+    pair_intermediates = []
+    for i in range(len(main_codes_df)):
+        for j in range(i+1, len(main_codes_df)):
+            sequence_line_l, sequence_line_r = all_sequence_lines[i], all_sequence_lines[j]
+            sequence_l, sequence_r = all_sequences[i], all_sequences[j]
+            bigram_line_l, bigram_line_r = all_bigram_lines[i], all_bigram_lines[j]
+
+            if use_preprocessing:
+                line_len_l = main_codes_df['line_len'].iat[i]
+            else:
+                line_len_l = min(len(sequence_line_l), len(sequence_line_r))
+
+            intermediates = {
+                'index': (i, j),
+                'line_len_l': line_len_l,
+                'total_sequence_length': len(sequence_l) + len(sequence_r),
+                'shortest_tokens_length': min(len(sequence_l), len(sequence_r)),
+            }
+
+            for label in config.used_style_features:
+                intermediates[label] = calculate_style_feature(all_style_sequences[label][i], all_style_sequences[label][j])
+
+            if ('CSS' in used_main_features):
+                intermediates['css_ratio'] = lev_ratio(sequence_l, sequence_r)
+            if ('CLTS' in used_main_features):
+                intermediates['gst_lines'] = gst.calculate(sequence_line_l, sequence_line_r, 3)
+            if ('CLN' in used_main_features):
+                distinct_l, distinct_r = set(sequence_line_l), set(sequence_line_r)
+                intermediates['line_counts'] = (len(distinct_l & distinct_r), len(distinct_l), len(distinct_r))
+            if ('CBLN' in used_main_features):
+                distinct_l, distinct_r = set(bigram_line_l), set(bigram_line_r)
+                intermediates['bigram_counts'] = (len(distinct_l & distinct_r), len(distinct_l), len(distinct_r))
+            if ('CBLN80' in used_main_features):
+                intermediates['cbln80_matches'] = count_cbln80_matches(bigram_line_l, bigram_line_r)
+                intermediates['bigram_len_l'] = len(bigram_line_l)
+
+            pair_intermediates.append(intermediates)
+
+    return pair_intermediates
+
+
+def derive_features_result_df(main_codes_df, pair_intermediates, same_segment_nerf=False, all_duplicate_line_sequences=None,
+                              use_preprocessing=True, config=None, skeleton_matcher=None):
+    """Derive the features result of a config from the pair intermediates (without calculating GST / levenshtein again).
+    The result is the same as create_features_result_df with the same config.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        pair_intermediates (list): The product of calculate_pair_intermediates (with all features of config).
+        same_segment_nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        all_duplicate_line_sequences (list): The product of filter_dup_segment, used if same_segment_nerf.
+        use_preprocessing (bool): Must be the same as calculate_pair_intermediates.
+        config (FeatureConfig): Determines the used features. If set to None, the config of initialize_config is used.
+        skeleton_matcher (SkeletonMatcher): Matcher of all_duplicate_line_sequences with every code added
+            (keyed by row position). If set to None and same_segment_nerf, it's built here.
+
+    Returns:
+        pandas.DataFrame: Contains DataFrame for features result.
+
+    """
+    if config is None:
+        config = get_feature_config()
+    used_main_features = config.used_main_features
+    used_style_features = config.used_style_features
+
+    lines_col = 'sequence_line' if use_preprocessing else 'raw_sequence_line'
+    all_sequence_lines = list(main_codes_df[lines_col])
+    all_filenames = list(main_codes_df['filename'])
+    all_line_pos = list(main_codes_df['line_pos'])
+
+    if same_segment_nerf and skeleton_matcher is None:
+        skeleton_matcher = SkeletonMatcher(all_duplicate_line_sequences)
+        sequence_col = 'sequence' if use_preprocessing else 'raw_code'
+        for index, sequence in enumerate(main_codes_df[sequence_col]):
+            skeleton_matcher.add_document(index, sequence)
+
+    features_data = []
+    for intermediates in pair_intermediates:
+        i, j = intermediates['index']
+
+        duplicate_pattern_lengths = None
+        if same_segment_nerf:
+            duplicate_pattern_lengths = skeleton_matcher.match_pair(i, j)[:2]
+
+        ws = intermediates['WS'] if 'WS' in used_style_features else 0
+        bs = intermediates['BS'] if 'BS' in used_style_features else 0
+        cs = intermediates['CS'] if 'CS' in used_style_features else 0
+        cssa = np.average([ws,bs,cs]) if 'CSSA' in used_style_features else 0
+
+        if ('CSS' in used_main_features):
+            css = calculate_css_from_ratio(intermediates['css_ratio'], intermediates['total_sequence_length'],
+                                           same_segment_nerf, duplicate_pattern_lengths)
+        else:
+            css = None
+
+        if ('CLTS' in used_main_features):
+            clts, clts_dicts = calculate_clts_from_gst(intermediates['gst_lines'], all_sequence_lines[i], intermediates['line_len_l'],
+                                                       same_segment_nerf, all_duplicate_line_sequences, duplicate_pattern_lengths)
+        else:
+            clts, clts_dicts = None, None
+
+        csa = calculate_csa(css, clts) if 'CSA' in used_main_features else 0
+
+        if ('CLN' in used_main_features):
+            cln = calculate_cln_from_counts(*intermediates['line_counts'], nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
+        else:
+            cln = 0
+
+        if ('CBLN' in used_main_features):
+            cbln = calculate_cln_from_counts(*intermediates['bigram_counts'], nerf=same_segment_nerf, duplicate_pattern_lengths=duplicate_pattern_lengths)
+        else:
+            cbln = 0
+
+        if ('CBLN80' in used_main_features):
+            cbln80 = calculate_cbln80_from_matches(intermediates['cbln80_matches'], intermediates['bigram_len_l'],
+                                                   same_segment_nerf, duplicate_pattern_lengths)
+        else:
+            cbln80 = 0
+
+        current_data = (all_filenames[i], all_filenames[j], all_line_pos[i], all_line_pos[j], intermediates['shortest_tokens_length'],
+                        clts_dicts, css, clts, csa, bs, ws, cs, cssa, cln, cbln, cbln80)
+        features_data.append(current_data)
+
+    return build_result_df(features_data, config)
+
+
+def sweep_features_result_df(main_codes_df, sweep_settings, use_preprocessing=True):
+    """Calculate features results for many settings, sharing the expensive calculations.
+    Pair intermediates are calculated once for the union of all configs, duplicate segments are counted once
+    and filtered once per minimal_pair_have_same_segment, then every setting only derives its features.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe (after "build_style_sequence" with the union of style features).
+        sweep_settings (list): A list of dicts, keys are the parameters of create_features_result_df:
+            'config' (FeatureConfig), 'same_segment_nerf' (bool), 'minimal_pair_have_same_segment' (float)
+            and 'frequent_segment_mining' (bool). Missing keys use the create_features_result_df defaults
+            (missing config uses the config of initialize_config).
+        use_preprocessing (bool): If set to True, then the model will use preprocess for the
+            features calculation, otherwise for False.
+
+    Returns:
+        list: Features result (pandas.DataFrame) for every setting, same order as sweep_settings.
+
+    """
+    all_configs = [setting.get('config') or get_feature_config() for setting in sweep_settings]
+
+    # union of all features, keeps the order of the first appearance
+    used_main_features, used_style_features = [], []
+    for config in all_configs:
+        used_main_features += [x for x in config.used_main_features if x not in used_main_features]
+        used_style_features += [x for x in config.used_style_features if x not in used_style_features]
+    union_config = FeatureConfig(used_main_features=used_main_features, used_style_features=used_style_features)
+
+    pair_intermediates = calculate_pair_intermediates(main_codes_df, use_preprocessing, union_config)
+
+    duplicate_segments_counters = dict()
+    skeleton_matchers = dict()
+    all_results = []
+    for setting, config in zip(sweep_settings, all_configs):
+        same_segment_nerf = setting.get('same_segment_nerf', False)
+        minimal_pair_have_same_segment = setting.get('minimal_pair_have_same_segment', 0.25)
+        frequent_segment_mining = setting.get('frequent_segment_mining', False)
+
+        all_duplicate_line_sequences = None
+        skeleton_matcher = None
+        if same_segment_nerf:
+            if frequent_segment_mining not in duplicate_segments_counters:
+                if frequent_segment_mining:
+                    duplicate_segments_counters[True] = frequent_segment_counter(main_codes_df)
+                else:
+                    duplicate_segments_counters[False] = dup_segment_counter(main_codes_df)
+
+            matcher_key = (frequent_segment_mining, minimal_pair_have_same_segment)
+            if matcher_key not in skeleton_matchers:
+                all_duplicate_line_sequences = filter_dup_segment(main_codes_df, duplicate_segments_counters[frequent_segment_mining],
+                                                                  minimal_pair_have_same_segment, document_frequency=frequent_segment_mining)
+                skeleton_matcher = SkeletonMatcher(all_duplicate_line_sequences)
+                sequence_col = 'sequence' if use_preprocessing else 'raw_code'
+                for index, sequence in enumerate(main_codes_df[sequence_col]):
+                    skeleton_matcher.add_document(index, sequence)
+                skeleton_matchers[matcher_key] = (all_duplicate_line_sequences, skeleton_matcher)
+            all_duplicate_line_sequences, skeleton_matcher = skeleton_matchers[matcher_key]
+
+        all_results.append(derive_features_result_df(main_codes_df, pair_intermediates, same_segment_nerf, all_duplicate_line_sequences,
+                                                      use_preprocessing, config, skeleton_matcher))
+    return all_results
+
+
+#######################
+# Progressive Scoring #
+#######################
+
+
+# count of pairs fully scored between two snapshots
+DEFAULT_PROGRESSIVE_BATCH_SIZE = 1000
+
+
+def progressive_features_result_df(main_codes_df, batch_size=DEFAULT_PROGRESSIVE_BATCH_SIZE, same_segment_nerf=False,
+                                   minimal_pair_have_same_segment=0.25, use_preprocessing=True, config=None, **scorer_kwargs):
+    """Score all pairs progressively, the most suspicious pairs first.
+    Cheap features (CLN, CBLN without nerf) are calculated for all pairs at once, then pairs are fully scored
+    (CSS, CLTS, CBLN80, style features, ...) in descending order of suspicion (max of the cheap CLN and CBLN).
+    A snapshot of all pairs is yielded after the cheap features and after every batch_size fully scored pairs.
+    Every snapshot is the same DataFrame, updated in place (copy it to keep the state of a snapshot).
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        batch_size (int): Count of fully scored pairs between two snapshots.
+        same_segment_nerf (bool): Same as create_features_result_df (cheap features are not nerfed).
+        minimal_pair_have_same_segment (float): Same as create_features_result_df.
+        use_preprocessing (bool): Same as create_features_result_df.
+        config (FeatureConfig): If set to None, the config of initialize_config is used.
+        **scorer_kwargs: Other parameters of build_pair_scorer (for example template_registry, pair_size_budget).
+
+    Returns:
+        generator: Generator object for snapshots (pandas.DataFrame), same rows and columns as create_features_result_df
+            plus 'Suspicion' and 'Final' columns. Rows that are not final have only the cheap features
+            (other features are NaN). The last snapshot has all rows final.
+
+    """
+    if config is None:
+        config = get_feature_config()
+    with_approximated = scorer_kwargs.get('pair_size_budget') is not None
+
+    # cheap features of all pairs, block by block of rows (no dense codes x codes matrices)
+    all_cln, all_cbln = [np.zeros(0)], [np.zeros(0)]
+    for block_cln, block_cbln in iter_all_pairs_cln(main_codes_df, use_preprocessing):
+        all_cln.append(block_cln)
+        all_cbln.append(block_cbln)
+    cln, cbln = np.concatenate(all_cln), np.concatenate(all_cbln)
+    suspicion = np.maximum(cln, cbln)
+    pairs_l, pairs_r = np.triu_indices(len(main_codes_df), k=1)
+
+    all_filenames = np.array(list(main_codes_df['filename']), dtype=object)
+    all_line_pos = np.empty(len(main_codes_df), dtype=object)
+    all_line_pos[:] = list(main_codes_df['line_pos'])
+    all_tokens_length = main_codes_df['sequence' if use_preprocessing else 'raw_code'].str.len().to_numpy()
+
+    # one DataFrame of all pairs, the fully scored rows are updated in place
+    pairs_count = len(pairs_l)
+    features_data = {
+        'Filename 1': all_filenames[pairs_l], 'Filename 2': all_filenames[pairs_r],
+        'Line Pos 1': all_line_pos[pairs_l], 'Line Pos 2': all_line_pos[pairs_r],
+        'Shortest Token Length': np.minimum(all_tokens_length[pairs_l], all_tokens_length[pairs_r]),
+        'CLTS Dicts': np.full(pairs_count, None, dtype=object),
+        'CLN': cln, 'CBLN': cbln,
+        'Approximated Features': np.full(pairs_count, '', dtype=object),
+    }
+    for feature in ['CSS', 'CLTS', 'CSA', 'BS', 'WS', 'CS', 'CSSA', 'CBLN80']:
+        features_data[feature] = np.full(pairs_count, np.nan)
+    result_scoring_df = build_result_df(features_data, config, with_approximated)
+    result_scoring_df['Suspicion'] = suspicion
+    result_scoring_df['Final'] = False
+
+    yield result_scoring_df
+
+    calculate_pair = build_pair_scorer(main_codes_df, same_segment_nerf, minimal_pair_have_same_segment, use_preprocessing,
+                                       config=config, **scorer_kwargs)
+
+    # most suspicious first, ties keep the pair order
+    order = np.argsort(-suspicion, kind='stable')
+    final_column = result_scoring_df.columns.get_loc('Final')
+    for start in range(0, len(order), batch_size):
+        positions = order[start:start + batch_size]
+        batch_data = []
+        for i, j in zip(pairs_l[positions].tolist(), pairs_r[positions].tolist()):
+            batch_data.append((all_filenames[i], all_filenames[j], all_line_pos[i], all_line_pos[j]) + calculate_pair(i, j))
+        batch_df = build_result_df(batch_data, config, with_approximated)
+
+        for column in batch_df.columns:
+            values = batch_df[column].to_numpy()
+            if result_scoring_df[column].dtype == object:
+                # keep lists and dicts as single values
+                values = values.astype(object)
+            result_scoring_df.iloc[positions, result_scoring_df.columns.get_loc(column)] = values
+        result_scoring_df.iloc[positions, final_column] = True
+        yield result_scoring_df
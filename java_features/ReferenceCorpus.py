@@ -0,0 +1,247 @@
+"""ReferenceCorpus is a module that compares a set of codes (query, for example this semester) only against
+a reference set (for example past semesters), without scoring the reference against itself.
+The reference is tokenized and indexed once (interned lines, line and shingle postings, profiles),
+saved to disk and reused across runs. Only the reference codes of the candidate pairs are scored.
+"""
+
+import pickle
+from collections import Counter
+
+import pandas as pd
+import numpy as np
+
+import sys
+from os.path import dirname, abspath
+utilities_dir = dirname(abspath(__file__)) +'\\utilities'
+sys.path.append(utilities_dir)
+
+from main_utility import generate_init_data
+from lsh_utility import token_shingles
+
+from .FeaturesCalculation import build_style_sequence, create_features_result_df, get_feature_config
+
+
+INIT_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+# token n-gram size of the shingle postings
+SHINGLE_NGRAM = 5
+
+
+class ReferenceIndex:
+    """ReferenceIndex holds the tokenized reference codes with their style sequences and an index for candidate search:
+    interned lines (line -> line id), postings of line ids and token shingles (-> reference positions)
+    and profiles (tokens length, lines length, distinct lines count).
+
+    """
+
+    def __init__(self, config=None, use_preprocessing=True, shingle_ngram=SHINGLE_NGRAM):
+        """
+        Args:
+            config (FeatureConfig): Determines the style sequences to build. If set to None, the config of initialize_config is used.
+            use_preprocessing (bool): Must be the same as the features calculation.
+            shingle_ngram (int): Token n-gram size of the shingle postings.
+
+        """
+        self.config = config if config is not None else get_feature_config()
+        self.use_preprocessing = use_preprocessing
+        self.shingle_ngram = shingle_ngram
+
+        self.codes_df = pd.DataFrame(columns=INIT_COLUMNS)
+        self.line_vocabulary = dict()
+        self.line_postings = dict()
+        self.shingle_postings = dict()
+        self.profiles = pd.DataFrame(columns=['sequence_len', 'line_len', 'distinct_lines'])
+
+    def __len__(self):
+        return len(self.codes_df)
+
+    def build(self, filepaths, filename_prefix=''):
+        """Tokenize and index reference codes.
+
+        Args:
+            filepaths (list/generator): Contains filepaths of the reference codes.
+            filename_prefix (str): Added to the reference file names (for example '2023/'),
+                so they don't clash with the query file names.
+
+        Returns:
+            int: Count of indexed codes.
+
+        """
+        codes_df = pd.DataFrame(generate_init_data(filepaths), columns=INIT_COLUMNS)
+        codes_df['filename'] = filename_prefix + codes_df['filename']
+        return self.add_codes(codes_df)
+
+    def add_codes(self, codes_df):
+        """Index reference codes that are already tokenized.
+
+        Args:
+            codes_df (pandas.DataFrame): Init dataframe of the reference codes (the product of generate_init_data).
+
+        Returns:
+            int: Count of indexed codes.
+
+        """
+        codes_df = codes_df[INIT_COLUMNS].reset_index(drop=True)
+        build_style_sequence(codes_df, config=self.config)
+
+        offset = len(self.codes_df)
+        lines_col = 'sequence_line' if self.use_preprocessing else 'raw_sequence_line'
+        sequence_col = 'sequence' if self.use_preprocessing else 'raw_code'
+
+        profiles = []
+        for position, (sequence_lines, sequence) in enumerate(zip(codes_df[lines_col], codes_df[sequence_col])):
+            reference_position = offset + position
+            distinct_lines = set(sequence_lines)
+            for line in distinct_lines:
+                line_id = self.line_vocabulary.setdefault(line, len(self.line_vocabulary))
+                self.line_postings.setdefault(line_id, []).append(reference_position)
+            for shingle in token_shingles(sequence, self.shingle_ngram).tolist():
+                self.shingle_postings.setdefault(shingle, []).append(reference_position)
+            profiles.append((len(sequence), len(sequence_lines), len(distinct_lines)))
+
+        self.codes_df = pd.concat([self.codes_df, codes_df], ignore_index=True)
+        self.profiles = pd.concat([self.profiles, pd.DataFrame(profiles, columns=self.profiles.columns)], ignore_index=True)
+        return len(codes_df)
+
+    def count_shared(self, query_codes_df, by='shingles', min_length_ratio=None):
+        """Count shared distinct lines or token shingles between every query code and every reference code.
+
+        Args:
+            query_codes_df (pandas.DataFrame): Init dataframe of the query codes.
+            by (str): 'shingles' for token shingles or 'lines' for interned lines.
+            min_length_ratio (float): Prefilter on the profiles, reference codes with tokens length ratio
+                (shorter / longer) to the query code below min_length_ratio are not counted.
+                If set to None, all reference codes are counted.
+
+        Returns:
+            list: A Counter (reference position -> shared count) for every query code.
+
+        """
+        if by not in ['shingles', 'lines']:
+            raise ValueError(f"by must be 'shingles' or 'lines', got {by}")
+        lines_col = 'sequence_line' if self.use_preprocessing else 'raw_sequence_line'
+        sequence_col = 'sequence' if self.use_preprocessing else 'raw_code'
+        reference_lengths = self.profiles['sequence_len'].to_numpy(dtype=np.int64)
+
+        all_shared = []
+        for sequence_lines, sequence in zip(query_codes_df[lines_col], query_codes_df[sequence_col]):
+            if by == 'lines':
+                line_ids = [self.line_vocabulary.get(line) for line in set(sequence_lines)]
+                all_postings = [self.line_postings[x] for x in line_ids if x is not None]
+            else:
+                all_postings = [self.shingle_postings.get(x, ()) for x in token_shingles(sequence, self.shingle_ngram).tolist()]
+
+            if min_length_ratio is not None:
+                length_ratio = np.minimum(reference_lengths, len(sequence)) / np.maximum(np.maximum(reference_lengths, len(sequence)), 1)
+                allowed = length_ratio >= min_length_ratio
+                all_postings = [[x for x in postings if allowed[x]] for postings in all_postings]
+
+            shared = Counter()
+            for postings in all_postings:
+                shared.update(postings)
+            all_shared.append(shared)
+        return all_shared
+
+    def candidate_pairs(self, query_codes_df, by='shingles', min_shared=1, top_k=None, min_length_ratio=None):
+        """Find reference codes that share enough lines / shingles with every query code.
+
+        Args:
+            query_codes_df (pandas.DataFrame): Init dataframe of the query codes.
+            by (str): 'shingles' or 'lines' (see count_shared).
+            min_shared (int): Minimum count of shared lines / shingles.
+            top_k (int): Keep only the top_k reference codes per query code. If set to None, keep all.
+            min_length_ratio (float): Skip reference codes with tokens length ratio (shorter / longer) to the query code
+                below min_length_ratio (see count_shared). CSS of a pair is at most 2 * shorter / (shorter + longer).
+
+        Returns:
+            list: Pairs (query position, reference position).
+
+        """
+        pairs = []
+        for query_position, shared in enumerate(self.count_shared(query_codes_df, by, min_length_ratio)):
+            candidates = [(reference_position, count) for reference_position, count in shared.most_common(top_k) if count >= min_shared]
+            pairs += [(query_position, reference_position) for reference_position, _ in candidates]
+        return pairs
+
+    def save(self, file_path):
+        """Save the reference index to a file.
+
+        Args:
+            file_path (str): File path of the index.
+
+        Returns:
+            None
+
+        """
+        with open(file_path, 'wb') as index_file:
+            pickle.dump(self.__dict__, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load a reference index saved by save.
+
+        Args:
+            file_path (str): File path of the index.
+
+        Returns:
+            ReferenceIndex: The loaded index.
+
+        """
+        with open(file_path, 'rb') as index_file:
+            state = pickle.load(index_file)
+        reference_index = cls.__new__(cls)
+        reference_index.__dict__.update(state)
+        return reference_index
+
+
+def score_against_reference(query_codes_df, reference_index, pairs=None, same_segment_nerf=False, template_registry=None, **features_kwargs):
+    """Calculate features of query x reference pairs only.
+    Only the query codes and the reference codes of the pairs are prepared (bigram lines, template matches, ...).
+    Pairs are oriented the same as create_features_result_df on all codes sorted by line length
+    (query codes before reference codes on equal length), so without the nerf the rows equal the rows of a full run.
+
+    Args:
+        query_codes_df (pandas.DataFrame): Init dataframe of the query codes (the product of generate_init_data).
+        reference_index (ReferenceIndex): The reference codes.
+        pairs (list): Pairs (query position, reference position) to score, for example the product of
+            ReferenceIndex.candidate_pairs. If set to None, every query code is scored against every reference code.
+        same_segment_nerf (bool): Same as create_features_result_df. Mined skeleton code would need all pairs,
+            so the nerf needs a template_registry (template segments matched in the scored codes hide CLTS tiles)
+            or frequent_segment_mining=True (segments are mined from the query and all reference codes).
+        template_registry (TemplateRegistry): Registered starter codes of the assignment.
+        **features_kwargs: Other parameters of create_features_result_df.
+
+    Returns:
+        pandas.DataFrame: Contains DataFrame for features result.
+
+    """
+    if same_segment_nerf and template_registry is None and not features_kwargs.get('frequent_segment_mining', False):
+        raise ValueError('reference nerf needs a template_registry or frequent_segment_mining=True')
+
+    query_codes_df = query_codes_df[INIT_COLUMNS].reset_index(drop=True)
+    build_style_sequence(query_codes_df, config=reference_index.config)
+
+    query_count = len(query_codes_df)
+    if pairs is None:
+        pairs = [(query_position, reference_position) for query_position in range(query_count)
+                 for reference_position in range(len(reference_index))]
+    pairs = list(pairs)
+
+    # reference codes that are not in any pair are left out (mining needs all of them),
+    # the source positions keep the relative order of the full run
+    if same_segment_nerf and features_kwargs.get('frequent_segment_mining', False):
+        used_reference_positions = np.arange(len(reference_index))
+    else:
+        used_reference_positions = np.unique(np.array([x[1] for x in pairs], dtype=np.int64))
+    reference_codes_df = reference_index.codes_df.iloc[used_reference_positions]
+    all_codes_df = pd.concat([query_codes_df, reference_codes_df], ignore_index=True)
+    all_codes_df['source_position'] = np.concatenate([np.arange(query_count), query_count + used_reference_positions])
+    all_codes_df = all_codes_df.sort_values(by=['line_len', 'source_position'], kind='stable').reset_index(drop=True)
+    sorted_positions = dict(zip(all_codes_df['source_position'].tolist(), range(len(all_codes_df))))
+
+    sorted_pairs = [(sorted_positions[query_position], sorted_positions[query_count + reference_position])
+                    for query_position, reference_position in pairs]
+    all_codes_df = all_codes_df.drop(columns=['source_position'])
+
+    return create_features_result_df(all_codes_df, same_segment_nerf=same_segment_nerf, use_preprocessing=reference_index.use_preprocessing,
+                                     template_registry=template_registry, config=reference_index.config, pairs=sorted_pairs, **features_kwargs)
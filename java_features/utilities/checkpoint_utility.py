@@ -0,0 +1,200 @@
+"""Checkpoint Utility is a module that saves finished pair ranges of a long pairwise run to a local directory.
+Pairs are scored in ranges of chunk_size pairs (in the order of create_features_result_df), every finished range
+is written to its own file. A resumed run loads the finished ranges instead of scoring them again,
+after checking that the codes and the settings are the same as the checkpointed run.
+Rows committed to a result store are counted in the manifest, so a resumed run doesn't insert them again.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from itertools import islice
+
+
+DEFAULT_CHECKPOINT_CHUNK_SIZE = 10000
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# columns that the features are calculated from
+CORPUS_HASH_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+
+def corpus_hash(main_codes_df):
+    """Hash of the codes (init columns and style sequences, in row order).
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+
+    Returns:
+        str: Hex digest.
+
+    """
+    columns = CORPUS_HASH_COLUMNS + sorted(x for x in main_codes_df.columns if x.endswith('_sequence') or x.endswith('_runs'))
+    digest = hashlib.blake2b(digest_size=16)
+    for column in columns:
+        digest.update(column.encode('utf8'))
+        for value in main_codes_df[column]:
+            digest.update(repr(value).encode('utf8'))
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def settings_hash(settings):
+    """Hash of the run settings (config, scoring parameters, pairs).
+
+    Args:
+        settings (dict): Setting name to value, values are hashed by repr.
+
+    Returns:
+        str: Hex digest.
+
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(settings):
+        digest.update(f'{name}={settings[name]!r}\0'.encode('utf8'))
+    return digest.hexdigest()
+
+
+class PairCheckpoint:
+    """PairCheckpoint keeps finished pair ranges of a run in a directory
+    (manifest.json with the hashes, one file per finished range).
+
+    """
+
+    def __init__(self, directory, corpus_digest, settings_digest, resume=False, chunk_size=DEFAULT_CHECKPOINT_CHUNK_SIZE):
+        """
+        Args:
+            directory (str): Local checkpoint directory (created if missing).
+            corpus_digest (str): corpus_hash of the codes.
+            settings_digest (str): settings_hash of the run settings.
+            resume (bool): If set to True, finished ranges of the previous run are used
+                (the hashes must match), otherwise previous checkpoints are removed.
+            chunk_size (int): Count of pairs per range (must be the same when resuming).
+
+        """
+        self.directory = directory
+        self.manifest = {'corpus_hash': corpus_digest, 'settings_hash': settings_digest, 'chunk_size': chunk_size}
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+
+        manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+        if resume and os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                previous_manifest = json.load(manifest_file)
+            for key in ['corpus_hash', 'settings_hash', 'chunk_size']:
+                if previous_manifest[key] != self.manifest[key]:
+                    raise ValueError(f'checkpoint {key} is different from the current run, can not resume')
+            if 'store' in previous_manifest:
+                self.manifest['store'] = previous_manifest['store']
+        else:
+            for filename in self.range_filenames():
+                os.remove(os.path.join(directory, filename))
+            self.write_manifest()
+
+        # start rank -> end rank of finished ranges
+        self.completed = dict()
+        for filename in self.range_filenames():
+            start, end = filename[len('pairs-'):-len('.pkl')].split('-')
+            self.completed[int(start)] = int(end)
+
+    def write_manifest(self):
+        # written to a temporary file first, then renamed
+        manifest_path = os.path.join(self.directory, MANIFEST_FILENAME)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def start_store(self, store_length):
+        """Count rows of this run that are already committed to the result store (in pair order).
+        Rows that were committed after the last save_store (a crash in between) are found from the store length,
+        so the store must not be written by anything else during the run.
+
+        Args:
+            store_length (int): Current count of rows in the result store.
+
+        Returns:
+            int: Count of the first rows that must not be inserted again.
+
+        """
+        committed = 0
+        if 'store' in self.manifest:
+            extra = store_length - self.manifest['store']['store_length']
+            if extra < 0:
+                raise ValueError('result store has less rows than the checkpointed run, can not resume')
+            committed = self.manifest['store']['committed'] + extra
+        self.save_store(committed, store_length)
+        return committed
+
+    def save_store(self, committed, store_length):
+        """Save the count of rows committed to the result store.
+
+        Args:
+            committed (int): Count of the first rows (in pair order) that are committed.
+            store_length (int): Count of rows in the result store after the commit.
+
+        Returns:
+            None
+
+        """
+        self.manifest['store'] = {'committed': committed, 'store_length': store_length}
+        self.write_manifest()
+
+    def range_filenames(self):
+        return [x for x in os.listdir(self.directory) if x.startswith('pairs-') and x.endswith('.pkl')]
+
+    def range_path(self, start, end):
+        return os.path.join(self.directory, f'pairs-{start:012d}-{end:012d}.pkl')
+
+    def save_range(self, start, end, rows):
+        """Save rows of a finished range (written to a temporary file first, then renamed).
+
+        Args:
+            start (int): Rank of the first pair.
+            end (int): Rank after the last pair.
+            rows (list): Features rows of the pairs.
+
+        Returns:
+            None
+
+        """
+        file_path = self.range_path(start, end)
+        with open(file_path + '.tmp', 'wb') as range_file:
+            pickle.dump(rows, range_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file_path + '.tmp', file_path)
+        self.completed[start] = end
+
+    def load_range(self, start, end):
+        with open(self.range_path(start, end), 'rb') as range_file:
+            return pickle.load(range_file)
+
+    def iterate_rows(self, pairs, score_row):
+        """Generate features rows of all pairs in order: finished ranges are loaded,
+        other ranges are scored and saved.
+
+        Args:
+            pairs (iterable): Pairs (i, j) in scoring order.
+            score_row (function): Returns the features row of a pair (i, j).
+
+        Returns:
+            generator: Generator object for features rows.
+
+        """
+        pairs = iter(pairs)
+        start = 0
+        while True:
+            if start in self.completed:
+                end = self.completed[start]
+                skipped = sum(1 for _ in islice(pairs, end - start))
+                if skipped != end - start:
+                    raise ValueError('checkpoint has more pairs than the current run')
+                yield from self.load_range(start, end)
+            else:
+                range_pairs = list(islice(pairs, self.chunk_size))
+                if len(range_pairs) == 0:
+                    break
+                end = start + len(range_pairs)
+                rows = [score_row(i, j) for i, j in range_pairs]
+                self.save_range(start, end, rows)
+                yield from rows
+            start = end
@@ -0,0 +1,135 @@
+"""Config Utility is a module that contains an immutable feature configuration.
+A FeatureConfig is passed explicitly to the feature calculation and stats functions,
+so different configurations (for example two assignments) can be scored concurrently in one process.
+"""
+
+import configparser
+from dataclasses import dataclass, fields, replace
+
+
+def read_ini_config(file_path):
+    """Read and parse .ini config file.
+
+    Args:
+        file_path (str): File path of config (.ini) file.
+
+    Returns:
+        dict: Contains all keys (lowercase) of all sections and their raw text values.
+
+    """
+    config = configparser.ConfigParser()
+    config.read(file_path)
+    config_from_file = dict()
+    for section in config.sections():
+        for key in config[section]:
+            config_from_file[key] = config[section][key]
+    return config_from_file
+
+
+def read_comma_separated(config_text, type=str):
+    """Read and parse comma separated elements from config file.
+    The parsed element will be converted according to specified type.
+    All elements will be returned as list.
+
+    Args:
+        config_text (str): Text from config file that has comma separated structure.
+        type (type): type of the element (supports all python basic types).
+
+    Returns:
+        list: Contains elements from the text
+
+    """
+    config_list = config_text.split(',')
+
+    config_list = [x.strip() for x in config_list]
+
+    if (len(config_list[0]) == 0):
+        config_list = []
+    config_list = [type(x) for x in config_list]
+
+    return config_list
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    """FeatureConfig determines which features are calculated.
+    Lists are stored as tuples, so the config can't be changed after it's created
+    (use with_changes to derive a new config).
+
+    Attributes:
+        used_main_features (tuple): All used main features (including TCA / TCD).
+        used_style_features (tuple): All used style features.
+        percentiles_define_token (tuple): Percentiles to calculate 'tokens_less_{percentile}' feature.
+        add_percentile_feature_cols (tuple): Column names that will be calculated for '{feature}_more_{percentile}' feature.
+        percentiles_define_feature (tuple): Percentiles to calculate '{feature}_more_{percentile}' feature.
+
+    """
+    used_main_features: tuple = ()
+    used_style_features: tuple = ()
+    percentiles_define_token: tuple = ()
+    add_percentile_feature_cols: tuple = ()
+    percentiles_define_feature: tuple = ()
+
+    def __post_init__(self):
+        for field in fields(self):
+            object.__setattr__(self, field.name, tuple(getattr(self, field.name)))
+
+    @property
+    def percentile_tokens_label(self):
+        return tuple(f'tokens_less_{str(i).zfill(2)}' for i in self.percentiles_define_token)
+
+    @classmethod
+    def default(cls):
+        """Default config, same as default_config of FeaturesCalculation.
+
+        Returns:
+            FeatureConfig: The default config.
+
+        """
+        return cls(
+            used_main_features=('CSS', 'CLTS', 'CSA', 'CSSA', 'CLN', 'CBLN', 'CBLN80', 'TCA', 'TCD'),
+            used_style_features=('BS', 'WS', 'CS'),
+            percentiles_define_token=(5, 10, 15),
+            add_percentile_feature_cols=('CSS', 'CLTS', 'CSA', 'BS', 'WS', 'CS', 'CSSA', 'CLN', 'CBLN', 'CBLN80'),
+            percentiles_define_feature=(85, 90, 95),
+        )
+
+    @classmethod
+    def from_ini(cls, file_path):
+        """Read config from .ini file (please look at plag-configs-example.ini for an example).
+        Keys that don't exist in the file are left empty.
+
+        Args:
+            file_path (str): File path of config (.ini) file.
+
+        Returns:
+            FeatureConfig: The config from the file.
+
+        """
+        config_from_file = read_ini_config(file_path)
+        values = dict()
+
+        if 'use_main_features' in config_from_file:
+            values['used_main_features'] = read_comma_separated(config_from_file['use_main_features'])
+        if 'use_style_features' in config_from_file:
+            values['used_style_features'] = read_comma_separated(config_from_file['use_style_features'])
+        if 'tokens_stats_percentile' in config_from_file:
+            values['percentiles_define_token'] = read_comma_separated(config_from_file['tokens_stats_percentile'], int)
+        if 'main_stats_names' in config_from_file:
+            values['add_percentile_feature_cols'] = read_comma_separated(config_from_file['main_stats_names'])
+            if len(values['add_percentile_feature_cols']) > 0:
+                values['percentiles_define_feature'] = read_comma_separated(config_from_file['main_stats_percentile'], int)
+
+        return cls(**values)
+
+    def with_changes(self, **changes):
+        """Derive a new config with some fields changed.
+
+        Args:
+            **changes: Field names and their new values.
+
+        Returns:
+            FeatureConfig: The new config.
+
+        """
+        return replace(self, **changes)
@@ -0,0 +1,332 @@
+"""Levenshtein Utility is a module that contains bit-parallel levenshtein ratio kernels.
+The batched kernels score many string pairs in a single call with bit-parallel LCS
+(Hyyro, 2004) over padded numpy arrays, the single pair kernel uses python integers
+as bit vectors for long token sequences (CSS).
+The results are the same as lev_ratio from scoring_utility.
+"""
+
+from collections import Counter
+
+import numpy as np
+
+
+WORD_BITS = 64
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# upper bound of (rows * columns * words) processed at once, keeps temporary arrays small
+MAX_BLOCK_CELLS = 1 << 18
+
+POPCOUNT_TABLE = np.array([bin(x).count('1') for x in range(256)], dtype=np.int64)
+
+
+###########################
+# Bit-Parallel Essentials #
+###########################
+
+
+def popcount(words):
+    """Count set bits of every element in an uint64 array.
+
+    Args:
+        words (numpy.ndarray): Array with uint64 dtype.
+
+    Returns:
+        numpy.ndarray: Count of set bits with the same shape as words.
+
+    """
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    bytes_view = words.reshape(words.shape + (1,)).view(np.uint8)
+    return POPCOUNT_TABLE[bytes_view].sum(axis=-1)
+
+
+def build_alphabet(*sequences_groups):
+    """Build alphabet code for every character that exists in the sequences.
+    Code 0 is reserved for padding.
+
+    Args:
+        *sequences_groups (list): Lists of strings.
+
+    Returns:
+        dict: Contains character as key and code (starting from 1) as value.
+
+    """
+    characters = set()
+    for sequences in sequences_groups:
+        for sequence in sequences:
+            characters.update(sequence)
+    return {character: code + 1 for code, character in enumerate(sorted(characters))}
+
+
+def encode_sequences(sequences, alphabet):
+    """Encode strings into a zero padded 2D array of alphabet codes.
+
+    Args:
+        sequences (list): A list of strings.
+        alphabet (dict): The product of build_alphabet.
+
+    Returns:
+        tuple: Contains codes, lengths.
+            codes = Padded codes with shape (len(sequences), longest sequence) (numpy.ndarray)
+            lengths = Length of every sequence (numpy.ndarray)
+
+    """
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    max_len = int(lengths.max()) if len(sequences) > 0 else 0
+
+    table = {ord(character): code for character, code in alphabet.items()}
+    padded = ''.join(sequence.translate(table).ljust(max_len, '\0') for sequence in sequences)
+
+    # small alphabet (the grammar tokens) fits into uint8
+    if len(alphabet) < 256:
+        codes = np.frombuffer(padded.encode('latin-1'), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(padded.encode('utf-32-le'), dtype=np.uint32)
+
+    return codes.reshape(len(sequences), max_len), lengths
+
+
+def build_pattern_masks(codes, lengths, alphabet_size):
+    """Build match bit vectors of every pattern (row) for every alphabet code.
+
+    Args:
+        codes (numpy.ndarray): Padded codes, the product of encode_sequences.
+        lengths (numpy.ndarray): Length of every pattern.
+        alphabet_size (int): Count of alphabet codes (excluding padding).
+
+    Returns:
+        numpy.ndarray: Bit vectors with shape (rows, alphabet_size + 1, words).
+            Bit i of the vector is set if the pattern has that code at position i.
+
+    """
+    rows_count, max_len = codes.shape
+    words = max(1, -(-max_len // WORD_BITS))
+    masks = np.zeros((rows_count, alphabet_size + 1, words), dtype=np.uint64)
+
+    rows, positions = np.nonzero(np.arange(max_len) < lengths[:, None])
+    bits = np.left_shift(np.uint64(1), (positions % WORD_BITS).astype(np.uint64))
+    np.bitwise_or.at(masks, (rows, codes[rows, positions], positions // WORD_BITS), bits)
+
+    # padding code never matches
+    masks[:, 0, :] = 0
+    return masks
+
+
+def build_length_masks(lengths, words):
+    """Build bit masks that cover the first N bits of every pattern.
+
+    Args:
+        lengths (numpy.ndarray): Length of every pattern.
+        words (int): Count of 64 bits words per pattern.
+
+    Returns:
+        numpy.ndarray: Masks with shape (rows, words).
+
+    """
+    bits = np.clip(lengths[:, None] - np.arange(words) * WORD_BITS, 0, WORD_BITS)
+    partial = np.left_shift(np.uint64(1), (bits % WORD_BITS).astype(np.uint64)) - np.uint64(1)
+    return np.where(bits == WORD_BITS, ALL_ONES, partial)
+
+
+##########################
+# Batched LCS and Ratios #
+##########################
+
+
+def lcs_length_matrix(sequences_l, sequences_r):
+    """Calculate longest common subsequence length between every pair of strings.
+    Every string of sequences_l becomes a bit-parallel pattern, the columns of
+    sequences_r are consumed one character position at a time for all pairs at once.
+
+    Args:
+        sequences_l (list): A list of strings (rows).
+        sequences_r (list): A list of strings (columns).
+
+    Returns:
+        numpy.ndarray: LCS length with shape (len(sequences_l), len(sequences_r)).
+
+    """
+    rows_count = len(sequences_l)
+    cols_count = len(sequences_r)
+    lcs = np.zeros((rows_count, cols_count), dtype=np.int64)
+    if rows_count == 0 or cols_count == 0:
+        return lcs
+
+    alphabet = build_alphabet(sequences_l, sequences_r)
+    codes_l, lengths_l = encode_sequences(sequences_l, alphabet)
+    codes_r, lengths_r = encode_sequences(sequences_r, alphabet)
+
+    pattern_masks = build_pattern_masks(codes_l, lengths_l, len(alphabet))
+    words = pattern_masks.shape[2]
+    length_masks = build_length_masks(lengths_l, words)
+    max_len_r = codes_r.shape[1]
+
+    block_size = max(1, MAX_BLOCK_CELLS // (cols_count * words))
+    for start in range(0, rows_count, block_size):
+        stop = min(start + block_size, rows_count)
+        block_masks = pattern_masks[start:stop]
+        v = np.full((stop - start, cols_count, words), ALL_ONES, dtype=np.uint64)
+
+        for position in range(max_len_r):
+            u = v & block_masks[:, codes_r[:, position], :]
+
+            # v = (v + u) | (v - u), u is a subset of v so (v - u) never borrows
+            if words == 1:
+                v = (v + u) | (v & ~u)
+            else:
+                carry = np.zeros(v.shape[:2], dtype=np.uint64)
+                for word in range(words):
+                    v_word = v[:, :, word]
+                    u_word = u[:, :, word]
+                    added = v_word + u_word
+                    added_carry = added + carry
+                    carry = ((added < v_word) | (added_carry < added)).astype(np.uint64)
+                    v[:, :, word] = added_carry | (v_word & ~u_word)
+
+        # LCS is the count of zero bits within the pattern length
+        ones = popcount(v & length_masks[start:stop, None, :]).sum(axis=-1)
+        lcs[start:stop] = lengths_l[start:stop, None] - ones
+
+    return lcs
+
+
+def lev_ratio_matrix(sequences_l, sequences_r):
+    """Calculate levenshtein ratio between every pair of strings.
+    The result is equal to calling lev_ratio for each pair.
+
+    Args:
+        sequences_l (list): A list of strings (rows).
+        sequences_r (list): A list of strings (columns).
+
+    Returns:
+        numpy.ndarray: Rounded to 4 precision of levenshtein ratio
+            with shape (len(sequences_l), len(sequences_r)).
+
+    """
+    lcs = lcs_length_matrix(sequences_l, sequences_r)
+    lengths_l = np.array([len(sequence) for sequence in sequences_l], dtype=np.int64)
+    lengths_r = np.array([len(sequence) for sequence in sequences_r], dtype=np.int64)
+    total_lengths = lengths_l[:, None] + lengths_r[None, :]
+
+    # ratio only has few distinct (lcs, total length) combinations,
+    # round them with python round so the result is exactly the same as lev_ratio
+    keys = lcs * (int(total_lengths.max(initial=0)) + 1) + total_lengths
+    unique_keys, inverse = np.unique(keys.ravel(), return_inverse=True)
+    unique_lcs, unique_totals = np.divmod(unique_keys, int(total_lengths.max(initial=0)) + 1)
+    unique_scores = np.array([
+        round((2 * int(common)) / int(total), 4) if total > 0 else 1.0
+        for common, total in zip(unique_lcs, unique_totals)
+    ], dtype=np.float64)
+
+    return unique_scores[inverse].reshape(lcs.shape)
+
+
+def lev_ratio_one_to_many(sequence, sequences):
+    """Calculate levenshtein ratio between one string and many candidate strings.
+
+    Args:
+        sequence (str): A string for base comparison.
+        sequences (list): A list of candidate strings.
+
+    Returns:
+        numpy.ndarray: Rounded to 4 precision of levenshtein ratio for every candidate.
+
+    """
+    return lev_ratio_matrix([sequence], sequences)[0]
+
+
+##########################
+# Single Pair CSS Kernel #
+##########################
+
+
+def ratio_from_lcs(lcs, total_length):
+    """Convert LCS length into levenshtein ratio.
+    Levenshtein ratio with substitution cost of 2 is equal to 2 * LCS / total length.
+
+    Args:
+        lcs (int): LCS length.
+        total_length (int): Length of sequence 1 + length of sequence 2.
+
+    Returns:
+        float: Rounded to 4 precision of levenshtein ratio.
+
+    """
+    if total_length == 0:
+        return 1.0
+    return round((2 * lcs) / total_length, 4)
+
+
+def lcs_length_bit_parallel(sequence_l, sequence_r, min_ratio=None, check_every=WORD_BITS):
+    """Calculate longest common subsequence length with bit-parallel algorithm.
+    The shorter sequence becomes the pattern, stored as python integer bit vectors,
+    so every character of the longer sequence costs a few big integer operations.
+
+    With min_ratio, the calculation stops early once the ratio can't reach min_ratio anymore,
+    the returned value is then an upper bound of the LCS length (not the exact one).
+
+    Args:
+        sequence_l (str): The string sequence 1.
+        sequence_r (str): The string sequence 2.
+        min_ratio (float): Cutoff of levenshtein ratio. If set to None, the exact LCS is always calculated.
+        check_every (int): Count of processed characters between the cutoff checks.
+
+    Returns:
+        tuple: Contains lcs, is_exact.
+            lcs = LCS length or upper bound of LCS length (int)
+            is_exact = False if the calculation stopped early (bool)
+
+    """
+    if len(sequence_l) > len(sequence_r):
+        sequence_l, sequence_r = sequence_r, sequence_l
+    pattern_len = len(sequence_l)
+    text_len = len(sequence_r)
+    total_length = pattern_len + text_len
+
+    if pattern_len == 0:
+        return 0, True
+
+    if min_ratio is not None:
+        # every LCS character must exist on both sequences
+        counter_l = Counter(sequence_l)
+        counter_r = Counter(sequence_r)
+        upper_bound = sum(min(count, counter_r[character]) for character, count in counter_l.items())
+        if ratio_from_lcs(upper_bound, total_length) < min_ratio:
+            return upper_bound, False
+
+    masks = {}
+    for character in set(sequence_l):
+        masks[character] = int(''.join('1' if x == character else '0' for x in reversed(sequence_l)), 2)
+
+    full = (1 << pattern_len) - 1
+    v = full
+    for position, character in enumerate(sequence_r):
+        mask = masks.get(character)
+        if mask:
+            u = v & mask
+            v = ((v + u) | (v - u)) & full
+
+        if min_ratio is not None and (position + 1) % check_every == 0:
+            # remaining characters can add at most 1 LCS each
+            upper_bound = min(pattern_len - bin(v).count('1') + (text_len - position - 1), pattern_len)
+            if ratio_from_lcs(upper_bound, total_length) < min_ratio:
+                return upper_bound, False
+
+    return pattern_len - bin(v).count('1'), True
+
+
+def css_ratio(sequence_l, sequence_r, min_ratio=None):
+    """Calculate levenshtein ratio of two token sequences with bit-parallel LCS.
+    Without min_ratio, the result is the same as lev_ratio.
+
+    Args:
+        sequence_l (str): tokens sequence of code 1.
+        sequence_r (str): tokens sequence of code 2.
+        min_ratio (float): Cutoff of levenshtein ratio. If the ratio can't reach min_ratio,
+            the calculation stops early and an upper bound of the ratio (lower than min_ratio) is returned.
+
+    Returns:
+        float: Rounded to 4 precision of levenshtein ratio (or its upper bound).
+
+    """
+    lcs, _ = lcs_length_bit_parallel(sequence_l, sequence_r, min_ratio)
+    return ratio_from_lcs(lcs, len(sequence_l) + len(sequence_r))
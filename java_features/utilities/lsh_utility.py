@@ -0,0 +1,177 @@
+"""LSH Utility is a module that generates candidate pairs for large corpora with MinHash and banded LSH.
+Every code becomes a set of shingles (token n-grams of the sequence or hashed lines), MinHash signatures
+estimate the Jaccard similarity between codes, and codes that collide in at least one LSH band become a candidate pair.
+Only candidate pairs are scored by create_features_result_df, instead of all pairs.
+"""
+
+import zlib
+
+import numpy as np
+
+
+# mersenne prime 2^31 - 1, (a * x + b) stays inside uint64 for 31 bits a, b and x
+MINHASH_PRIME = (1 << 31) - 1
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_ROWS = 4
+
+
+#############
+# Shingling #
+#############
+
+
+def token_shingles(sequence, ngram=5):
+    """Build hashed token n-grams of a tokens sequence.
+
+    Args:
+        sequence (str): tokens sequence of a code.
+        ngram (int): Count of tokens per shingle.
+
+    Returns:
+        numpy.ndarray: Distinct shingle hashes (uint64).
+
+    """
+    if len(sequence) < ngram:
+        grams = {sequence}
+    else:
+        grams = {sequence[i:i + ngram] for i in range(len(sequence) - ngram + 1)}
+    return np.array(sorted(zlib.crc32(x.encode('utf8')) % MINHASH_PRIME for x in grams), dtype=np.uint64)
+
+
+def line_shingles(sequence_lines, ngram=1):
+    """Build hashed shingles of consecutive lines (line ids).
+
+    Args:
+        sequence_lines (list): A list of code lines.
+        ngram (int): Count of consecutive lines per shingle.
+
+    Returns:
+        numpy.ndarray: Distinct shingle hashes (uint64).
+
+    """
+    if len(sequence_lines) < ngram:
+        grams = {'\n'.join(sequence_lines)}
+    else:
+        grams = {'\n'.join(sequence_lines[i:i + ngram]) for i in range(len(sequence_lines) - ngram + 1)}
+    return np.array(sorted(zlib.crc32(x.encode('utf8')) % MINHASH_PRIME for x in grams), dtype=np.uint64)
+
+
+##########################
+# MinHash and Banded LSH #
+##########################
+
+
+def minhash_signatures(all_shingles, num_perm=DEFAULT_NUM_PERM, seed=1):
+    """Build MinHash signatures with universal hashing ((a * x + b) mod prime).
+
+    Args:
+        all_shingles (list): A list of shingle hashes (numpy.ndarray), one per code.
+        num_perm (int): Count of hash functions (signature length).
+        seed (int): Seed of the hash functions, signatures are comparable only with the same seed.
+
+    Returns:
+        numpy.ndarray: Signatures with shape (codes, num_perm).
+
+    """
+    random_state = np.random.RandomState(seed)
+    a = random_state.randint(1, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+    b = random_state.randint(0, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+    prime = np.uint64(MINHASH_PRIME)
+
+    signatures = np.full((len(all_shingles), num_perm), MINHASH_PRIME, dtype=np.uint64)
+    for index, shingles in enumerate(all_shingles):
+        if len(shingles) > 0:
+            signatures[index] = ((a[:, None] * shingles[None, :] + b[:, None]) % prime).min(axis=1)
+    return signatures
+
+
+def lsh_candidate_pairs(signatures, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS):
+    """Find pairs of codes that have the same signature on at least one band.
+
+    Args:
+        signatures (numpy.ndarray): The product of minhash_signatures.
+        bands (int): Count of bands, more bands give higher recall.
+        rows (int): Count of signature rows per band, more rows give fewer false candidates.
+            bands * rows must not be bigger than the signature length.
+
+    Returns:
+        list: Sorted candidate pairs (i, j) with i < j (row positions).
+
+    """
+    if bands * rows > signatures.shape[1]:
+        raise ValueError(f'bands * rows ({bands * rows}) is bigger than the signature length ({signatures.shape[1]})')
+
+    candidate_pairs = set()
+    for band in range(bands):
+        buckets = dict()
+        band_signatures = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for index in range(len(band_signatures)):
+            buckets.setdefault(band_signatures[index].tobytes(), []).append(index)
+
+        for members in buckets.values():
+            for position, i in enumerate(members):
+                for j in members[position + 1:]:
+                    candidate_pairs.add((i, j))
+    return sorted(candidate_pairs)
+
+
+def lsh_collision_probability(similarity, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS):
+    """Probability of a pair with the given Jaccard similarity to become a candidate (expected recall).
+
+    Args:
+        similarity (float): Jaccard similarity of the shingles between 0-1.
+        bands (int): Count of bands.
+        rows (int): Count of signature rows per band.
+
+    Returns:
+        float: Probability between 0-1.
+
+    """
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def lsh_threshold(bands=DEFAULT_BANDS, rows=DEFAULT_ROWS):
+    """Approximate Jaccard similarity where the collision probability rises steeply.
+
+    Args:
+        bands (int): Count of bands.
+        rows (int): Count of signature rows per band.
+
+    Returns:
+        float: Similarity threshold between 0-1.
+
+    """
+    return (1 / bands) ** (1 / rows)
+
+
+def generate_candidate_pairs(main_codes_df, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, shingle='tokens', ngram=None,
+                             use_preprocessing=True, seed=1):
+    """Generate candidate pairs of the codes with MinHash LSH, to be passed to create_features_result_df.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        bands (int): Count of bands, more bands give higher recall.
+        rows (int): Count of signature rows per band, more rows give fewer false candidates.
+        shingle (str): 'tokens' for token n-grams of the sequence or 'lines' for line shingles.
+        ngram (int): Size of a shingle. If set to None, 5 tokens or 1 line.
+        use_preprocessing (bool): If set to True, the tokenized sequence / lines are used,
+            otherwise the raw code / lines.
+        seed (int): Seed of the MinHash functions.
+
+    Returns:
+        list: Sorted candidate pairs (i, j) with i < j (row positions of main_codes_df).
+
+    """
+    if shingle == 'tokens':
+        sequence_col = 'sequence' if use_preprocessing else 'raw_code'
+        all_shingles = [token_shingles(x, ngram or 5) for x in main_codes_df[sequence_col]]
+    elif shingle == 'lines':
+        lines_col = 'sequence_line' if use_preprocessing else 'raw_sequence_line'
+        all_shingles = [line_shingles(x, ngram or 1) for x in main_codes_df[lines_col]]
+    else:
+        raise ValueError(f"shingle must be 'tokens' or 'lines', got {shingle}")
+
+    signatures = minhash_signatures(all_shingles, bands * rows, seed)
+    return lsh_candidate_pairs(signatures, bands, rows)
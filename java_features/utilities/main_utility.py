@@ -4,6 +4,7 @@ and file processing.
 
 import os
 import re
+import hashlib
 
 import java_raw_tokenizer
 
@@ -434,3 +435,31 @@ def generate_init_data(filepaths):
         line_sequence = [x[0] for x in line_sequence]
 
         yield (filename, raw_code, line_sequence, line_num, raw_line_sequence, sequence, len(line_sequence))
+
+
+def get_duplicate_representatives(main_codes_df, use_preprocessing=True):
+    """Group codes with identical scored content (copy-paste submissions).
+    Codes are grouped by a hash of everything the features are calculated from:
+    tokens sequence and tokenized lines (or raw code and raw lines without preprocessing),
+    and the style sequences ('{style}_sequence' columns) if they exist.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        use_preprocessing (bool): Must be the same as the features calculation.
+
+    Returns:
+        list: Row position of the group representative (first member) for every code.
+
+    """
+    if use_preprocessing:
+        key_cols = ['sequence', 'sequence_line']
+    else:
+        key_cols = ['raw_code', 'raw_sequence_line']
+    key_cols += [x for x in main_codes_df.columns if x.endswith('_sequence') and x != 'raw_sequence_line']
+
+    representatives = []
+    groups = dict()
+    for position, content in enumerate(zip(*[main_codes_df[x] for x in key_cols])):
+        code_hash = hashlib.blake2b(repr(content).encode('utf8'), digest_size=16).digest()
+        representatives.append(groups.setdefault(code_hash, position))
+    return representatives
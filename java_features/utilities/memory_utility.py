@@ -0,0 +1,249 @@
+"""Memory Utility is a module that keeps create_features_result_df inside a memory budget.
+Per-document payloads (code columns, bigram lines, style runs) and per-pair rows are estimated:
+payloads that don't fit their share of the budget are built once, spilled to disk (one file per code)
+and loaded by position through a bounded cache, result rows are spilled to disk
+in chunks sized from the measured row footprint.
+"""
+
+import os
+import sys
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# share of the budget for per-document payloads, the rest is for result rows
+DOCUMENT_BUDGET_SHARE = 0.25
+
+# count of rows measured to estimate the footprint of a row
+ROW_SAMPLE_SIZE = 64
+
+MEMORY_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_memory_size(memory_size):
+    """Parse memory size, for example 4096, '512M' or '4G'.
+
+    Args:
+        memory_size (int/str): Size in bytes, or a number with K / M / G suffix.
+
+    Returns:
+        int: Size in bytes.
+
+    """
+    if isinstance(memory_size, str):
+        memory_size = memory_size.strip().upper().rstrip('B')
+        if memory_size[-1] in MEMORY_UNITS:
+            return int(float(memory_size[:-1]) * MEMORY_UNITS[memory_size[-1]])
+    return int(memory_size)
+
+
+def deep_sizeof(value):
+    """Approximate memory footprint of a value, including the values it contains.
+
+    Args:
+        value (object): str, number, list, tuple, set, dict or numpy array (nested).
+
+    Returns:
+        int: Size in bytes.
+
+    """
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.base is None else value.nbytes)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x) for x in value)
+    return size
+
+
+def estimate_bigram_lines_bytes(sequence_lines):
+    """Estimate the footprint of the bigram lines of a code, without generating them.
+
+    Args:
+        sequence_lines (list): Lines of the code.
+
+    Returns:
+        int: Size in bytes (0 if the lines are reused as they are).
+
+    """
+    if len(sequence_lines) <= 1:
+        return 0
+    lengths = [len(x) for x in sequence_lines]
+    return sys.getsizeof([]) + 8 * (len(lengths) - 1) + sum(sys.getsizeof('') + a + b for a, b in zip(lengths, lengths[1:]))
+
+
+def estimate_document_bytes(code_values, sequence_lines):
+    """Estimate the footprint of the payload of a code: its column values and its bigram lines.
+
+    Args:
+        code_values (list): Column values of the code used for scoring (sequences, lines, style sequences).
+        sequence_lines (list): Lines of the code (bigram lines are estimated from them).
+
+    Returns:
+        int: Size in bytes.
+
+    """
+    return sum(deep_sizeof(x) for x in code_values) + estimate_bigram_lines_bytes(sequence_lines)
+
+
+class MemoryBudget:
+    """MemoryBudget splits a memory limit between per-document payloads and buffered result rows.
+
+    """
+
+    def __init__(self, memory_budget, document_share=DOCUMENT_BUDGET_SHARE):
+        """
+        Args:
+            memory_budget (int/str): Memory limit (see parse_memory_size).
+            document_share (float): Share of the limit for per-document payloads.
+
+        """
+        self.budget_bytes = parse_memory_size(memory_budget)
+        self.document_bytes = int(self.budget_bytes * document_share)
+        self.rows_bytes = self.budget_bytes - self.document_bytes
+        self.sampled_rows = 0
+        self.sampled_bytes = 0
+
+    def add_row(self, row):
+        # the first ROW_SAMPLE_SIZE rows are measured
+        if self.sampled_rows < ROW_SAMPLE_SIZE:
+            self.sampled_rows += 1
+            self.sampled_bytes += deep_sizeof(row)
+
+    def row_limit(self):
+        """Count of rows that can be buffered, building the chunk DataFrame takes about the same memory again.
+
+        Returns:
+            int: Count of rows (at least 1).
+
+        """
+        if self.sampled_rows == 0:
+            return 1
+        return max(1, int(self.rows_bytes // (2 * self.sampled_bytes / self.sampled_rows)))
+
+
+class SpilledDocuments:
+    """SpilledDocuments keeps per-code payloads on disk, one pickle per code. Every payload is built once,
+    loaded payloads are kept in a cache with a memory limit.
+    The payload of the row code (pinned) is never evicted, so scanning the pairs of a row
+    loads only the column codes that are not cached.
+
+    """
+
+    def __init__(self, build, count, max_bytes, spill_dir=None):
+        """
+        Args:
+            build (function): Returns the payload of a code position.
+            count (int): Count of codes.
+            max_bytes (int): Memory limit of the loaded payloads.
+            spill_dir (str): Directory of the payload files (created if missing). If set to None, a temporary directory.
+
+        """
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix='java-features-documents-')
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.values = OrderedDict()
+        self.total_bytes = 0
+        self.pinned = None
+        self.load_count = 0
+
+        self.file_paths = []
+        for position in range(count):
+            file_path = os.path.join(spill_dir, f'document-{position:06d}.pkl')
+            with open(file_path, 'wb') as document_file:
+                pickle.dump(build(position), document_file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file_paths.append(file_path)
+
+    def __len__(self):
+        return len(self.file_paths)
+
+    def pin(self, position):
+        """Keep the payload of a code in memory (the previously pinned code can be evicted again).
+
+        Args:
+            position (int): Code position.
+
+        Returns:
+            None
+
+        """
+        self.pinned = position
+
+    def __getitem__(self, position):
+        if position in self.values:
+            self.values.move_to_end(position)
+            return self.values[position][0]
+
+        with open(self.file_paths[position], 'rb') as document_file:
+            value = pickle.load(document_file)
+        self.load_count += 1
+        size = deep_sizeof(value)
+        self.values[position] = (value, size)
+        self.total_bytes += size
+
+        # pairs are scanned by row, so codes before the row code are not needed anymore.
+        # Then the most recently used payloads are evicted, the columns of every row scan
+        # keep hitting the payloads that stay (least recently used would miss every column)
+        evictable = [x for x in reversed(self.values) if x != self.pinned and x != position]
+        if self.pinned is not None:
+            evictable = [x for x in evictable if x < self.pinned] + [x for x in evictable if x > self.pinned]
+        for key in evictable:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.total_bytes -= self.values.pop(key)[1]
+        return value
+
+
+class SpilledResult:
+    """SpilledResult is a features result that is written to disk in chunks (pickled DataFrames).
+    load_chunks can be passed to build_stats_features_two_pass (stats_scoring_utility).
+
+    """
+
+    def __init__(self, spill_dir=None):
+        """
+        Args:
+            spill_dir (str): Directory of the chunks (created if missing). If set to None, a temporary directory.
+
+        """
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix='java-features-spill-')
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+        self.file_paths = []
+        self.row_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    def add(self, result_chunk_df):
+        file_path = os.path.join(self.spill_dir, f'result-{len(self.file_paths):06d}.pkl')
+        result_chunk_df.to_pickle(file_path)
+        self.file_paths.append(file_path)
+        self.row_count += len(result_chunk_df)
+
+    def load_chunks(self):
+        """Load the chunks one by one.
+
+        Returns:
+            generator: Generator object for result chunks (pandas.DataFrame).
+
+        """
+        for file_path in self.file_paths:
+            yield pd.read_pickle(file_path)
+
+    def to_df(self):
+        """Load all chunks into one DataFrame (only if it fits in memory).
+
+        Returns:
+            pandas.DataFrame: Contains DataFrame for features result.
+
+        """
+        return pd.concat(list(self.load_chunks()), ignore_index=True)
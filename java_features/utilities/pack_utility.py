@@ -0,0 +1,275 @@
+"""Pack Utility is a module that stores a prepared corpus (init data and style sequences) in a single binary file.
+The pack contains interned line dictionary, concatenated token bytes, line id arrays, line positions,
+style sequences and offset tables. It's opened with mmap, so loading is instant (nothing is parsed
+until it's requested) and processes that open the same pack share the page cache.
+main_codes_df compatible DataFrame is built only when requested.
+"""
+
+import json
+import mmap
+
+import numpy as np
+import pandas as pd
+
+
+PACK_MAGIC = b'JFPACK01'
+PACK_ALIGNMENT = 8
+
+INIT_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+
+###########
+# Writing #
+###########
+
+
+def _encode_strings(strings):
+    # concatenated utf8 bytes and offsets (count + 1)
+    all_bytes = [x.encode('utf8') for x in strings]
+    offsets = np.zeros(len(all_bytes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in all_bytes])
+    return np.frombuffer(b''.join(all_bytes), dtype=np.uint8), offsets
+
+
+def _encode_id_lists(value_lists, vocabulary, dtype=np.int32):
+    # concatenated ids of interned values and offsets (count + 1), new values are added to vocabulary
+    offsets = np.zeros(len(value_lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in value_lists])
+    ids = np.fromiter((vocabulary.setdefault(x, len(vocabulary)) for values in value_lists for x in values),
+                      dtype=dtype, count=int(offsets[-1]))
+    return ids, offsets
+
+
+def write_corpus_pack(main_codes_df, file_path, style_labels=None):
+    """Write init data (and style sequences) of the codes to a pack file.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe (with or without style sequences).
+        file_path (str): File path of the pack.
+        style_labels (list): Style labels to store ('{label}_sequence' columns).
+            If set to None, all '{label}_sequence' columns of main_codes_df are stored.
+
+    Returns:
+        None
+
+    """
+    if style_labels is None:
+        style_labels = [x[:-len('_sequence')] for x in main_codes_df.columns if x.endswith('_sequence')]
+
+    for sequence_lines, line_pos in zip(main_codes_df['sequence_line'], main_codes_df['line_pos']):
+        if len(sequence_lines) != len(line_pos):
+            raise ValueError('sequence_line and line_pos must have the same length')
+
+    sections = dict()
+    sections['filename_bytes'], sections['filename_offsets'] = _encode_strings(main_codes_df['filename'])
+    sections['raw_code_bytes'], sections['raw_code_offsets'] = _encode_strings(main_codes_df['raw_code'])
+    sections['sequence_bytes'], sections['sequence_offsets'] = _encode_strings(main_codes_df['sequence'])
+
+    # tokenized and raw lines share one interned line dictionary
+    line_vocabulary = dict()
+    sections['line_ids'], sections['line_offsets'] = _encode_id_lists(list(main_codes_df['sequence_line']), line_vocabulary)
+    sections['raw_line_ids'], sections['raw_line_offsets'] = _encode_id_lists(list(main_codes_df['raw_sequence_line']), line_vocabulary)
+    sections['vocabulary_bytes'], sections['vocabulary_offsets'] = _encode_strings(list(line_vocabulary))
+
+    # line positions have the same offsets as the tokenized lines
+    sections['line_pos'] = np.fromiter((x for line_pos in main_codes_df['line_pos'] for x in line_pos),
+                                       dtype=np.int64, count=int(sections['line_offsets'][-1]))
+    sections['line_len'] = main_codes_df['line_len'].to_numpy(dtype=np.int64)
+
+    style_vocabulary = dict()
+    for label in style_labels:
+        sections[f'{label}_style_ids'], sections[f'{label}_style_offsets'] = _encode_id_lists(
+            list(main_codes_df[label + '_sequence']), style_vocabulary)
+
+    # section offsets are relative to the (aligned) end of the header
+    section_table = dict()
+    offset = 0
+    for name, array in sections.items():
+        section_table[name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // PACK_ALIGNMENT) * PACK_ALIGNMENT
+
+    header = json.dumps({
+        'count': len(main_codes_df),
+        'style_labels': list(style_labels),
+        'style_symbols': list(style_vocabulary),
+        'sections': section_table,
+    }).encode('utf8')
+    header_end = len(PACK_MAGIC) + 8 + len(header)
+    data_start = -(-header_end // PACK_ALIGNMENT) * PACK_ALIGNMENT
+
+    with open(file_path, 'wb') as pack_file:
+        pack_file.write(PACK_MAGIC)
+        pack_file.write(np.uint64(len(header)).tobytes())
+        pack_file.write(header)
+        pack_file.write(b'\0' * (data_start - header_end))
+        for name, array in sections.items():
+            pack_file.write(array.tobytes())
+            pack_file.write(b'\0' * (-array.nbytes % PACK_ALIGNMENT))
+
+
+###########
+# Reading #
+###########
+
+
+class CorpusPack:
+    """CorpusPack is a read-only view of a pack file (opened with mmap).
+    Arrays are numpy views of the mapped file, strings and lists are decoded per code only when requested.
+    A CorpusPack can be pickled (for process pools), it's reopened from the file path.
+
+    """
+
+    def __init__(self, file_path):
+        """
+        Args:
+            file_path (str): File path of the pack (written by write_corpus_pack).
+
+        """
+        self.file_path = file_path
+        self.pack_file = open(file_path, 'rb')
+        self.buffer = mmap.mmap(self.pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self.close()
+            raise ValueError(f'{file_path} is not a corpus pack')
+
+        header_length = int(np.frombuffer(self.buffer, dtype=np.uint64, count=1, offset=len(PACK_MAGIC))[0])
+        header_end = len(PACK_MAGIC) + 8 + header_length
+        header = json.loads(self.buffer[len(PACK_MAGIC) + 8:header_end].decode('utf8'))
+        data_start = -(-header_end // PACK_ALIGNMENT) * PACK_ALIGNMENT
+
+        self.count = header['count']
+        self.style_labels = header['style_labels']
+        self.style_symbols = header['style_symbols']
+        self.arrays = {name: np.frombuffer(self.buffer, dtype=np.dtype(dtype), count=length, offset=data_start + offset)
+                       for name, (offset, dtype, length) in header['sections'].items()}
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getstate__(self):
+        return {'file_path': self.file_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['file_path'])
+
+    def close(self):
+        """Close the mapped file (arrays taken from the pack can't be used after this).
+
+        Returns:
+            None
+
+        """
+        self.arrays = dict()
+        self.buffer.close()
+        self.pack_file.close()
+
+    def _string(self, name, position):
+        offsets = self.arrays[name + '_offsets']
+        data = self.arrays[name + '_bytes']
+        return data[offsets[position]:offsets[position + 1]].tobytes().decode('utf8')
+
+    def _ids(self, ids_name, offsets_name, position):
+        offsets = self.arrays[offsets_name]
+        return self.arrays[ids_name][offsets[position]:offsets[position + 1]]
+
+    def filename(self, position):
+        return self._string('filename', position)
+
+    def raw_code(self, position):
+        return self._string('raw_code', position)
+
+    def sequence(self, position):
+        return self._string('sequence', position)
+
+    def line(self, line_id):
+        """Decode an interned line.
+
+        Args:
+            line_id (int): Id of the line in the line dictionary.
+
+        Returns:
+            str: The line.
+
+        """
+        return self._string('vocabulary', line_id)
+
+    def line_ids(self, position, raw=False):
+        """Get interned line ids of a code (a view of the pack, not a copy).
+
+        Args:
+            position (int): Position of the code.
+            raw (bool): If set to True, ids of the raw lines, otherwise of the tokenized lines.
+
+        Returns:
+            numpy.ndarray: Line ids.
+
+        """
+        if raw:
+            return self._ids('raw_line_ids', 'raw_line_offsets', position)
+        return self._ids('line_ids', 'line_offsets', position)
+
+    def sequence_line(self, position):
+        return [self.line(x) for x in self.line_ids(position).tolist()]
+
+    def raw_sequence_line(self, position):
+        return [self.line(x) for x in self.line_ids(position, raw=True).tolist()]
+
+    def line_pos(self, position):
+        return self._ids('line_pos', 'line_offsets', position).tolist()
+
+    def line_len(self, position):
+        return int(self.arrays['line_len'][position])
+
+    def style_sequence(self, label, position):
+        """Decode a style sequence of a code.
+
+        Args:
+            label (str): Style label, for example 'WS'.
+            position (int): Position of the code.
+
+        Returns:
+            list: The style sequence.
+
+        """
+        ids = self._ids(f'{label}_style_ids', f'{label}_style_offsets', position)
+        return [self.style_symbols[x] for x in ids.tolist()]
+
+    def filenames(self):
+        return [self.filename(x) for x in range(self.count)]
+
+    def to_codes_df(self, columns=None, positions=None):
+        """Build main_codes_df compatible DataFrame (init columns and style sequences).
+
+        Args:
+            columns (list): Columns to build, for example ['filename', 'sequence_line', 'sequence', 'line_len'].
+                If set to None, all init columns and all stored style sequences.
+            positions (list): Positions of the codes. If set to None, all codes.
+
+        Returns:
+            pandas.DataFrame: Codes DataFrame with the requested columns.
+
+        """
+        if columns is None:
+            columns = INIT_COLUMNS + [label + '_sequence' for label in self.style_labels]
+        if positions is None:
+            positions = range(self.count)
+        positions = list(positions)
+
+        codes_data = dict()
+        for column in columns:
+            if column == 'line_len':
+                codes_data[column] = self.arrays['line_len'][positions].copy()
+            elif column.endswith('_sequence') and column[:-len('_sequence')] in self.style_labels:
+                codes_data[column] = [self.style_sequence(column[:-len('_sequence')], x) for x in positions]
+            elif column in INIT_COLUMNS:
+                codes_data[column] = [getattr(self, column)(x) for x in positions]
+            else:
+                raise ValueError(f'{column} is not stored in the pack')
+        return pd.DataFrame(codes_data, columns=columns)
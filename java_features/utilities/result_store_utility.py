@@ -0,0 +1,241 @@
+"""Result Store Utility is a module that keeps pair features in a SQLite database (standard library, single file).
+Rows are inserted in batches (for example streamed from create_features_result_df), the file name columns and
+selected feature columns are indexed, so queries by file, by threshold or for the top pairs don't need
+to load the whole result.
+"""
+
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_INDEXED_FEATURES = ('CSS', 'CLTS', 'CSA', 'CLN', 'CBLN', 'CBLN80')
+
+PAIRS_TABLE = 'pairs'
+COLUMNS_TABLE = 'pairs_columns'
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_kind(values):
+    # kind of a DataFrame column: bool, number, text or json (lists / dicts)
+    if values.dtype == bool:
+        return 'bool'
+    if np.issubdtype(values.dtype, np.number):
+        return 'number'
+    sample = next((x for x in values if x is not None), None)
+    if isinstance(sample, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(sample, (int, float, np.number)):
+        return 'number'
+    if isinstance(sample, str) or sample is None:
+        return 'text'
+    return 'json'
+
+
+def _to_sql_values(values, kind):
+    # python values of a DataFrame column, converted column-wise
+    if kind == 'json':
+        return [None if x is None else json.dumps(x, default=lambda y: y.item()) for x in values]
+    if kind == 'bool':
+        return [None if x is None else int(x) for x in values]
+    return [x.item() if isinstance(x, np.generic) else x for x in values.tolist()]
+
+
+# number columns have no type affinity, integers and floats are stored (and read back) as they are
+SQL_TYPES = {'bool': 'INTEGER', 'number': '', 'text': 'TEXT', 'json': 'TEXT'}
+
+
+class ResultStore:
+    """ResultStore is a SQLite table of pair features, one row per pair.
+    The table columns are taken from the first inserted DataFrame (same names as result_scoring_df).
+
+    """
+
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE, indexed_features=DEFAULT_INDEXED_FEATURES):
+        """
+        Args:
+            db_path (str): File path of the database (':memory:' for an in-memory database).
+            batch_size (int): Count of buffered rows inserted in one transaction.
+            indexed_features (tuple): Feature columns that get an index (if they exist in the table).
+
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.indexed_features = tuple(indexed_features)
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {COLUMNS_TABLE} (position INTEGER, name TEXT, kind TEXT)')
+
+        rows = self.connection.execute(f'SELECT name, kind FROM {COLUMNS_TABLE} ORDER BY position').fetchall()
+        self.columns = [name for name, _ in rows]
+        self.column_kinds = dict(rows)
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        if len(self.columns) == 0:
+            return 0
+        return self.connection.execute(f'SELECT COUNT(*) FROM {PAIRS_TABLE}').fetchone()[0]
+
+    def _create_table(self, result_scoring_df):
+        self.columns = list(result_scoring_df.columns)
+        self.column_kinds = {x: _column_kind(result_scoring_df[x]) for x in self.columns}
+
+        column_definitions = ', '.join(f'{_quote(x)} {SQL_TYPES[self.column_kinds[x]]}'.strip() for x in self.columns)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE {PAIRS_TABLE} ({column_definitions})')
+            self.connection.executemany(f'INSERT INTO {COLUMNS_TABLE} VALUES (?, ?, ?)',
+                                        [(position, x, self.column_kinds[x]) for position, x in enumerate(self.columns)])
+
+    def create_indexes(self):
+        """Create indexes on the file name columns and the indexed features (they are kept updated on later inserts).
+        Creating the indexes after the bulk insert is faster than inserting into indexed table.
+
+        Returns:
+            None
+
+        """
+        self.flush()
+        indexed_columns = ['Filename 1', 'Filename 2'] + [x for x in self.indexed_features if x in self.columns]
+        with self.connection:
+            for column in indexed_columns:
+                index_name = _quote('index_' + column.replace(' ', '_'))
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {PAIRS_TABLE} ({_quote(column)})')
+
+    def insert_df(self, result_scoring_df):
+        """Insert (buffer) rows of a features result DataFrame.
+
+        Args:
+            result_scoring_df (pandas.DataFrame): Features result, must have the same columns as the table.
+
+        Returns:
+            None
+
+        """
+        if len(self.columns) == 0:
+            self._create_table(result_scoring_df)
+        elif list(result_scoring_df.columns) != self.columns:
+            raise ValueError('columns of the DataFrame are different from the store columns')
+
+        all_values = [_to_sql_values(result_scoring_df[x], self.column_kinds[x]) for x in self.columns]
+        self.buffer += zip(*all_values)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered rows, one transaction per batch_size rows.
+
+        Returns:
+            None
+
+        """
+        if len(self.buffer) == 0:
+            return
+        placeholders = ', '.join('?' * len(self.columns))
+        for start in range(0, len(self.buffer), self.batch_size):
+            with self.connection:
+                self.connection.executemany(f'INSERT INTO {PAIRS_TABLE} VALUES ({placeholders})',
+                                            self.buffer[start:start + self.batch_size])
+        self.buffer = []
+
+    def close(self):
+        """Flush the buffered rows and close the database.
+
+        Returns:
+            None
+
+        """
+        self.flush()
+        self.connection.close()
+
+    def query(self, where='', parameters=(), order_by=None, limit=None):
+        """Select rows as a features result DataFrame (json / bool columns are converted back).
+
+        Args:
+            where (str): SQL condition (with ? placeholders), empty for all rows.
+            parameters (tuple): Values of the placeholders.
+            order_by (str): SQL order clause.
+            limit (int): Maximum count of rows.
+
+        Returns:
+            pandas.DataFrame: The selected rows.
+
+        """
+        self.flush()
+        if len(self.columns) == 0:
+            return pd.DataFrame()
+
+        sql = f'SELECT * FROM {PAIRS_TABLE}'
+        if where:
+            sql += f' WHERE {where}'
+        if order_by is not None:
+            sql += f' ORDER BY {order_by}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+
+        result_df = pd.DataFrame(self.connection.execute(sql, parameters).fetchall(), columns=self.columns)
+        for column in self.columns:
+            if self.column_kinds[column] == 'json':
+                result_df[column] = [None if x is None else json.loads(x) for x in result_df[column]]
+            elif self.column_kinds[column] == 'bool':
+                result_df[column] = result_df[column].astype(bool)
+        return result_df
+
+    def _check_feature(self, feature):
+        if feature not in self.columns:
+            raise ValueError(f'{feature} is not a column of the store')
+        return _quote(feature)
+
+    def pairs_for(self, filename):
+        """Get all pairs of a file.
+
+        Args:
+            filename (str): File name of the code.
+
+        Returns:
+            pandas.DataFrame: The pairs where the file is Filename 1 or Filename 2.
+
+        """
+        return self.query('"Filename 1" = ? OR "Filename 2" = ?', (filename, filename))
+
+    def pairs_above(self, feature, threshold):
+        """Get pairs with a feature value above (or equal to) a threshold, highest first.
+
+        Args:
+            feature (str): Feature column, for example 'CSA'.
+            threshold (float): Minimum value of the feature.
+
+        Returns:
+            pandas.DataFrame: The selected pairs.
+
+        """
+        column = self._check_feature(feature)
+        return self.query(f'{column} >= ?', (threshold,), order_by=f'{column} DESC')
+
+    def top_pairs(self, feature, count=100):
+        """Get the pairs with the highest feature values.
+
+        Args:
+            feature (str): Feature column, for example 'CSA'.
+            count (int): Count of pairs.
+
+        Returns:
+            pandas.DataFrame: The selected pairs, highest first.
+
+        """
+        column = self._check_feature(feature)
+        return self.query(order_by=f'{column} DESC', limit=count)
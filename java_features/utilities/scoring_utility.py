@@ -9,11 +9,12 @@ import copy
 
 import operator as op
 from functools import reduce
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import threading
+import numpy as np
 from gst_calculation import gst
 
-SAME_LINE_LENGTH = 0
-SAME_SEQUENCE_LENGTH = 0
+from levenshtein_utility import lev_ratio_one_to_many, lev_ratio_matrix, css_ratio
 
 
 ##############################
@@ -181,6 +182,239 @@ def check_charbychar(line):
 
 
 
+#############################
+# Run-Length Encoded Styles #
+#############################
+
+
+def run_length_encode(sequence):
+    """Encode a style sequence into runs of the same symbol.
+    Whiteline sequence mostly consists of long runs (one 2 per line, one 1 per indent level).
+
+    Args:
+        sequence (list): Style sequence.
+
+    Returns:
+        list: A list of runs, run is a tuple of (symbol, length).
+
+    """
+    runs = []
+    for symbol in sequence:
+        if len(runs) > 0 and runs[-1][0] == symbol:
+            runs[-1] = (symbol, runs[-1][1] + 1)
+        else:
+            runs.append((symbol, 1))
+    return runs
+
+
+def run_length_decode(runs):
+    """Decode runs back into the style sequence.
+
+    Args:
+        runs (list): A list of (symbol, length), the product of run_length_encode.
+
+    Returns:
+        list: Style sequence.
+
+    """
+    sequence = []
+    for symbol, length in runs:
+        sequence += [symbol] * length
+    return sequence
+
+
+def __mark_runs(blocks, intervals):
+    # split blocks ([symbol, length, marked]) so every interval (start, length) becomes marked blocks
+    merged_intervals = []
+    for interval_start, interval_length in sorted(intervals):
+        interval_end = interval_start + interval_length
+        if len(merged_intervals) > 0 and interval_start <= merged_intervals[-1][1]:
+            merged_intervals[-1][1] = max(merged_intervals[-1][1], interval_end)
+        else:
+            merged_intervals.append([interval_start, interval_end])
+
+    marked_blocks = []
+    position = 0
+    interval_index = 0
+    for symbol, length, marked in blocks:
+        block_start = position
+        block_end = position + length
+        position = block_end
+        if marked:
+            marked_blocks.append([symbol, length, True])
+            continue
+
+        cursor = block_start
+        while interval_index < len(merged_intervals) and cursor < block_end:
+            interval_start, interval_end = merged_intervals[interval_index]
+            if interval_start >= block_end:
+                break
+            if interval_start > cursor:
+                marked_blocks.append([symbol, interval_start - cursor, False])
+                cursor = interval_start
+            marked_end = min(interval_end, block_end)
+            marked_blocks.append([symbol, marked_end - cursor, True])
+            cursor = marked_end
+            if interval_end <= block_end:
+                interval_index += 1
+        if cursor < block_end:
+            marked_blocks.append([symbol, block_end - cursor, False])
+    return marked_blocks
+
+
+def __first_uncovered(first, last, tile_starts, length):
+    # smallest position between first and last (inclusive) that is not inside a tile (start, start + length - 1)
+    position = first
+    moved = True
+    while moved and position <= last:
+        moved = False
+        for tile_start in tile_starts:
+            if tile_start <= position < tile_start + length:
+                position = tile_start + length
+                moved = True
+    if position <= last:
+        return position
+    return None
+
+
+def rle_greedy_string_tiling(runs_1, runs_2, minimal_match=3):
+    """Greedy string tiling that works on runs directly, with the same tiles as gst.calculate.
+    Every match of an iteration starts inside a run pair (same symbol). Its length only depends on the
+    remaining lengths of both runs and on the chain of exactly equal runs that follows, so the candidates
+    of gst.calculate (with its scanning order and overlap check) are found per run pair
+    instead of per element, and the cost is proportional to the number of runs.
+
+    Args:
+        runs_1 (list): A list of (symbol, length), the product of run_length_encode.
+        runs_2 (list): A list of (symbol, length), the product of run_length_encode.
+        minimal_match (int): Number of minimal consecutively equal elements that considered to be a tile.
+
+    Returns:
+        list: The first index will be a list of tiles (match dict with the same keys as gst.calculate,
+            positions are on the decoded sequences). The second index will be total score.
+
+    """
+    # same as gst.calculate, the shorter sequence is scanned in the outer loop
+    switched = sum(length for _, length in runs_2) < sum(length for _, length in runs_1)
+    if switched:
+        runs_1, runs_2 = runs_2, runs_1
+
+    blocks_1 = [[symbol, length, False] for symbol, length in runs_1]
+    blocks_2 = [[symbol, length, False] for symbol, length in runs_2]
+    same_tiles = []
+    total_score = 0
+
+    while True:
+        offsets_1, offsets_2 = [], []
+        position = 0
+        for block in blocks_1:
+            offsets_1.append(position)
+            position += block[1]
+        position = 0
+        for block in blocks_2:
+            offsets_2.append(position)
+            position += block[1]
+
+        # matched length after both runs end at the same time (equal runs that follow)
+        chains = dict()
+        max_match = 0
+        for i, (symbol_1, length_1, marked_1) in enumerate(blocks_1):
+            if marked_1:
+                continue
+            for j, (symbol_2, length_2, marked_2) in enumerate(blocks_2):
+                if marked_2 or symbol_2 != symbol_1:
+                    continue
+
+                chain = 0
+                k = 1
+                while i + k < len(blocks_1) and j + k < len(blocks_2):
+                    next_symbol_1, next_length_1, next_marked_1 = blocks_1[i + k]
+                    next_symbol_2, next_length_2, next_marked_2 = blocks_2[j + k]
+                    if next_marked_1 or next_marked_2 or next_symbol_1 != next_symbol_2:
+                        break
+                    chain += min(next_length_1, next_length_2)
+                    if next_length_1 != next_length_2:
+                        break
+                    k += 1
+                chains[(i, j)] = chain
+                max_match = max(max_match, min(length_1, length_2) + chain)
+
+        if max_match < minimal_match:
+            break
+
+        # starts (position_1, position_2) of matches with max_match length, in the scanning order of gst.calculate:
+        # a start is taken if it's not inside a taken match (on any of the sequences)
+        matches = []
+        for i, (symbol_1, length_1, marked_1) in enumerate(blocks_1):
+            if marked_1:
+                continue
+            start_1 = offsets_1[i]
+            end_1 = start_1 + length_1
+            same_blocks = [j for j in range(len(blocks_2)) if (i, j) in chains]
+
+            # remaining length of run 1 longer than max_match, only matches run 2 with exactly max_match left
+            if length_1 > max_match:
+                candidates_2 = [offsets_2[j] + blocks_2[j][1] - max_match for j in same_blocks if blocks_2[j][1] >= max_match]
+                position_1 = start_1
+                while True:
+                    position_1 = __first_uncovered(position_1, end_1 - max_match - 1, [x[0] for x in matches], max_match)
+                    if position_1 is None:
+                        break
+                    starts_2 = [x[1] for x in matches]
+                    position_2 = next((x for x in candidates_2 if __first_uncovered(x, x, starts_2, max_match) is not None), None)
+                    if position_2 is None:
+                        break
+                    matches.append((position_1, position_2))
+
+            # remaining length of run 1 up to max_match
+            remainders = {max_match} | {max_match - chains[(i, j)] for j in same_blocks}
+            for remainder in sorted(remainders, reverse=True):
+                if not 1 <= remainder <= length_1:
+                    continue
+                position_1 = end_1 - remainder
+                if __first_uncovered(position_1, position_1, [x[0] for x in matches], max_match) is None:
+                    continue
+
+                starts_2 = [x[1] for x in matches]
+                for j in same_blocks:
+                    end_2 = offsets_2[j] + blocks_2[j][1]
+                    if remainder == max_match:
+                        # longer remaining run 2, or the same remaining length without a chain
+                        last_2 = end_2 - max_match if chains[(i, j)] == 0 else end_2 - max_match - 1
+                        position_2 = __first_uncovered(offsets_2[j], last_2, starts_2, max_match)
+                    elif remainder <= blocks_2[j][1] and remainder + chains[(i, j)] == max_match:
+                        position_2 = __first_uncovered(end_2 - remainder, end_2 - remainder, starts_2, max_match)
+                    else:
+                        position_2 = None
+
+                    if position_2 is not None:
+                        matches.append((position_1, position_2))
+                        break
+
+        for start_1, start_2 in matches:
+            same_tiles.append({
+                'token_1_position': start_1,
+                'token_2_position': start_2,
+                'length': max_match,
+                'score': max_match
+            })
+            total_score += max_match
+
+        blocks_1 = __mark_runs(blocks_1, [(match[0], max_match) for match in matches])
+        blocks_2 = __mark_runs(blocks_2, [(match[1], max_match) for match in matches])
+
+        if max_match <= minimal_match:
+            break
+
+    if switched:
+        for tile in same_tiles:
+            tile['token_1_position'], tile['token_2_position'] = tile['token_2_position'], tile['token_1_position']
+
+    return [same_tiles, total_score]
+
+
+
+
 ##################################
 # Same Segments Nerf Calculation #
 ##################################
@@ -253,7 +487,7 @@ def dup_segment_counter(main_codes_df):
 
 # minimal fraction of submission pair that must have same pattern to make that pattern considered to be a duplicate pattern
 MINIMAL_PAIR_HAVE_SAME_SEGMENT = 0.25
-def filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_have_same_segment=0.25):
+def filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_have_same_segment=0.25, document_frequency=False):
     """Filter duplicate segments from all duplicate_segments_counter.
     The default assumption for a valid duplicate segment is 
     atleast 25% of code pairs have the same pattern.
@@ -269,6 +503,8 @@ def filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_h
             Pattern is a list of tokens that are converted into a string.
         minimal_pair_have_same_segment: Minimum percentage of code pairs having the same pattern
             (for that pattern to be considered as a duplicate pattern / skeleton code)
+        document_frequency (bool): If set to True, the counter values are count of codes that contain
+            the pattern (product of frequent_segment_counter), they are converted into count of pairs (nC2).
 
     Returns:
         dict: Contains pattern as key and count as value.
@@ -279,6 +515,8 @@ def filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_h
     all_submission_len = len(main_codes_df)
     minimal_submissions_same_pattern = int(minimal_pair_have_same_segment * all_submission_len)
     minimal_pairs_same_pattern = ncr(minimal_submissions_same_pattern, 2)
+    if document_frequency:
+        duplicate_segments_counter = {key: ncr(val, 2) for key, val in duplicate_segments_counter.items()}
     sorted_dups = dict(sorted(duplicate_segments_counter.items(), key=lambda item: item[1], reverse=True))
     
     # total_pairs_count = 0
@@ -296,8 +534,8 @@ def filter_dup_segment(main_codes_df, duplicate_segments_counter, minimal_pair_h
     return all_duplicate_line_sequences
 
 
-def count_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences):
-    """Count duplicate pattern between two sequence.
+def find_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences):
+    """Count duplicate pattern between two sequence, returned as values (no global state).
 
     Args:
         sequence_l (str): tokens sequence of code 1.
@@ -305,14 +543,15 @@ def count_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequence
         all_duplicate_line_sequences (dict): The product of filter_dup_segment.
 
     Returns:
-        None
+        tuple: Contains same_line_length, same_sequence_length.
+            same_line_length = Total lines of duplicate patterns that exist on both codes (int)
+            same_sequence_length = Total tokens of duplicate patterns that exist on both codes (int)
 
     """
     sequence_l_copy = copy.deepcopy(sequence_l)
     sequence_r_copy = copy.deepcopy(sequence_r)
-    global SAME_LINE_LENGTH, SAME_SEQUENCE_LENGTH
-    SAME_LINE_LENGTH = 0
-    SAME_SEQUENCE_LENGTH = 0
+    same_line_length = 0
+    same_sequence_length = 0
     
     for duplicate_line_sequence in all_duplicate_line_sequences:    
         # combine patterns to a single string, determine if the string of token sequence is exist in both of the code
@@ -324,8 +563,43 @@ def count_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequence
             sequence_r_copy = sequence_r_copy.replace(dup_combined,'')
             dup_line_len = len(duplicate_line_sequence)
             dup_combined_len = len(dup_combined)
-            SAME_LINE_LENGTH += dup_line_len
-            SAME_SEQUENCE_LENGTH += dup_combined_len
+            same_line_length += dup_line_len
+            same_sequence_length += dup_combined_len
+
+    return same_line_length, same_sequence_length
+
+
+def count_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences):
+    """Count duplicate pattern between two sequence.
+    Deprecated, same as find_duplicate_patterns. The nerf values are not stored anymore,
+    pass the result as duplicate_pattern_lengths to the scoring functions.
+
+    Args:
+        sequence_l (str): tokens sequence of code 1.
+        sequence_r (str): tokens sequence of code 2.
+        all_duplicate_line_sequences (dict): The product of filter_dup_segment.
+
+    Returns:
+        tuple: The product of find_duplicate_patterns.
+
+    """
+    return find_duplicate_patterns(sequence_l, sequence_r, all_duplicate_line_sequences)
+
+
+def get_duplicate_pattern_lengths(duplicate_pattern_lengths):
+    """Get nerf values of the pair, the nerf has no values without them.
+
+    Args:
+        duplicate_pattern_lengths (tuple): (same_line_length, same_sequence_length) of the pair,
+            the product of find_duplicate_patterns (or SkeletonMatcher.match_pair / TemplateRegistry.pair_lengths).
+
+    Returns:
+        tuple: Contains same_line_length, same_sequence_length.
+
+    """
+    if duplicate_pattern_lengths is None:
+        raise ValueError('nerf=True needs duplicate_pattern_lengths of the pair (see find_duplicate_patterns)')
+    return duplicate_pattern_lengths
 
 
 
@@ -351,6 +625,121 @@ def lev_ratio(sequence_l, sequence_r):
     return round(ratio(sequence_l, sequence_r), 4)
 
 
+class LevRatioCache:
+    """LevRatioCache memoizes levenshtein ratio of string pairs with LRU eviction.
+    Bigram lines repeat heavily accross submissions, so the same pair of lines
+    is scored many times by extract_best over a whole corpus.
+
+    """
+
+    def __init__(self, maxsize=100000):
+        """
+        Args:
+            maxsize (int): Maximum number of string pairs kept in the cache.
+                The least recently used pair is evicted when the cache is full.
+
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ratio(self, sequence_l, sequence_r):
+        """Get levenshtein ratio from the cache, calculate and store it if missing.
+
+        Args:
+            sequence_l (str): The string sequence 1.
+            sequence_r (str): The string sequence 2.
+
+        Returns:
+            float: Same result as lev_ratio.
+
+        """
+        # ratio is symmetric, so (l, r) and (r, l) share the same entry
+        if sequence_l <= sequence_r:
+            key = (sequence_l, sequence_r)
+        else:
+            key = (sequence_r, sequence_l)
+
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+                self.hits += 1
+                return score
+            self.misses += 1
+
+        score = lev_ratio(sequence_l, sequence_r)
+        with self._lock:
+            self._scores[key] = score
+            if len(self._scores) > self.maxsize:
+                self._scores.popitem(last=False)
+        return score
+
+    def info(self):
+        """Get cache counters, useful to size the cache.
+
+        Returns:
+            dict: Contains hits, misses, size and maxsize of the cache.
+
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._scores), 'maxsize': self.maxsize}
+
+    def clear(self):
+        """Remove all cached scores and reset the counters.
+
+        """
+        with self._lock:
+            self._scores.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# corpus level cache used by extract_best, disabled by default
+LEV_RATIO_CACHE = None
+def enable_lev_ratio_cache(maxsize=100000):
+    """Enable the levenshtein ratio memo cache for extract_best.
+
+    Args:
+        maxsize (int): Maximum number of string pairs kept in the cache.
+
+    Returns:
+        LevRatioCache: The active cache.
+
+    """
+    global LEV_RATIO_CACHE
+    LEV_RATIO_CACHE = LevRatioCache(maxsize)
+    return LEV_RATIO_CACHE
+
+
+def disable_lev_ratio_cache():
+    """Disable the levenshtein ratio memo cache.
+
+    Returns:
+        None
+
+    """
+    global LEV_RATIO_CACHE
+    LEV_RATIO_CACHE = None
+
+
+def lev_ratio_cache_info():
+    """Get hit and miss counters of the levenshtein ratio memo cache.
+
+    Returns:
+        dict: Contains hits, misses, size and maxsize. None if the cache is disabled.
+
+    """
+    if LEV_RATIO_CACHE is None:
+        return None
+    return LEV_RATIO_CACHE.info()
+
+
+# minimal count of compared pairs (or candidates) to use the batched levenshtein kernel
+BATCHED_MIN_CELLS = 4096
+
+
 def __extract_scores_generator(line, sequence_line, scorer=lev_ratio):
     for line_r in sequence_line:
         yield (line_r, scorer(line, line_r))
@@ -360,10 +749,13 @@ def extract_best(line, sequence_line, scorer=lev_ratio):
     """Extract best score from comparing a sequence and list of sequences.
     The default scorer is levenshtein ratio. Any kind string similarity scorer that
     have 2 parameter of string and return a float/int score would work.
+    If the levenshtein ratio cache is enabled, the default scorer will use it.
+    For big candidate sets, the default scorer is calculated with the batched kernel.
 
     Args:
         line (str): A string for base comparison.
         sequence_line (list): A list of strings that functions as target comparison.
+        scorer (function): String similarity scorer.
 
     Returns:
         tuple: Best Score that contains line_compare, score
@@ -371,7 +763,16 @@ def extract_best(line, sequence_line, scorer=lev_ratio):
             score = The score / similarity between line and line_compare
 
     """
-    all_datas = __extract_scores_generator(line, sequence_line)
+    # whole candidate set is scored at once when it's big enough to beat the per call overhead
+    if scorer is lev_ratio and len(sequence_line) >= BATCHED_MIN_CELLS:
+        scores = lev_ratio_one_to_many(line, sequence_line)
+        best_index = int(np.argmax(scores))
+        return (sequence_line[best_index], float(scores[best_index]))
+
+    if scorer is lev_ratio and LEV_RATIO_CACHE is not None:
+        scorer = LEV_RATIO_CACHE.get_ratio
+
+    all_datas = __extract_scores_generator(line, sequence_line, scorer)
         
     return max(all_datas, key=lambda x: x[1])
 
@@ -400,7 +801,7 @@ def generate_bigram_lines(lines):
 ########################
 
 
-def calculate_css(sequence_l, sequence_r, nerf=False):
+def calculate_css(sequence_l, sequence_r, nerf=False, min_ratio=None, bit_parallel=False, duplicate_pattern_lengths=None):
     """Calculate Code Structure Similarity.
     Code Structure Similarity (CSS) use levenshtein ratio for 
     scoring / similarity between two string sequence.
@@ -410,20 +811,47 @@ def calculate_css(sequence_l, sequence_r, nerf=False):
         sequence_r (str): tokens sequence of code 2
         nerf (bool): If set to True, the score will be nerfed 
             (same segment / duplicate segment nerf calculation)
+        min_ratio (float): Cutoff of the levenshtein ratio. Pair that can't reach min_ratio
+            stops early and gets an upper bound of the ratio (lower than min_ratio) instead.
+            Implies bit_parallel.
+        bit_parallel (bool): If set to True, levenshtein ratio is calculated with 
+            the bit-parallel engine (css_ratio), the result is the same as lev_ratio.
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
 
     Returns:
         float: Score between 0-1.
 
     """
-    css = lev_ratio(sequence_l,sequence_r)
+    if bit_parallel or min_ratio is not None:
+        css = css_ratio(sequence_l, sequence_r, min_ratio)
+    else:
+        css = lev_ratio(sequence_l,sequence_r)
     
+    return calculate_css_from_ratio(css, len(sequence_l) + len(sequence_r), nerf, duplicate_pattern_lengths)
+
+
+def calculate_css_from_ratio(css, total_sequence_length, nerf=False, duplicate_pattern_lengths=None):
+    """Calculate Code Structure Similarity from the precalculated levenshtein ratio.
+
+    Args:
+        css (float): levenshtein ratio of the two tokens sequences.
+        total_sequence_length (int): Length of tokens sequence 1 + length of tokens sequence 2.
+        nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
+
+    Returns:
+        float: Score between 0-1.
+
+    """
     if(nerf):
-        reduce_score = (SAME_SEQUENCE_LENGTH * 2) / (len(sequence_l) + len(sequence_r))
+        same_sequence_length = get_duplicate_pattern_lengths(duplicate_pattern_lengths)[1]
+        reduce_score = (same_sequence_length * 2) / total_sequence_length
         return max(css - reduce_score,0)
     return css
 
 
-def calculate_clts(sequence_line_l,sequence_line_r, line_len_l, nerf=False, all_duplicate_line_sequences=None):
+def calculate_clts(sequence_line_l,sequence_line_r, line_len_l, nerf=False, all_duplicate_line_sequences=None, duplicate_pattern_lengths=None):
     """Calculate Code Line Tiles Similarity.
     Code Line Tiles Similarity (CLTS) use greedy string tiling for 
     scoring / similarity between two string sequence.
@@ -435,12 +863,32 @@ def calculate_clts(sequence_line_l,sequence_line_r, line_len_l, nerf=False, all_
         nerf (bool): If set to True, the score will be nerfed 
             (same segment / duplicate segment nerf calculation)
         all_duplicate_line_sequences (dict): The product of filter_dup_segment.
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
 
     Returns:
         float: Score between 0-1.
 
     """
     gst_calculate = gst.calculate(sequence_line_l,sequence_line_r,3)
+    return calculate_clts_from_gst(gst_calculate, sequence_line_l, line_len_l, nerf, all_duplicate_line_sequences, duplicate_pattern_lengths)
+
+
+def calculate_clts_from_gst(gst_calculate, sequence_line_l, line_len_l, nerf=False, all_duplicate_line_sequences=None, duplicate_pattern_lengths=None):
+    """Calculate Code Line Tiles Similarity from the precalculated greedy string tiling of the lines.
+
+    Args:
+        gst_calculate (list): The product of gst.calculate(sequence_line_l, sequence_line_r, 3).
+        sequence_line_l (list): A list of code lines from code 1.
+        line_len_l (int): the lines length of shorter code (between code 1 and code 2)
+        nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        all_duplicate_line_sequences (dict): The product of filter_dup_segment.
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
+
+    Returns:
+        tuple: Contains clts score (between 0-1) and the shown tiles.
+
+    """
     gst_score = gst_calculate[1]
     
     gst_tiles = []
@@ -459,7 +907,8 @@ def calculate_clts(sequence_line_l,sequence_line_r, line_len_l, nerf=False, all_
         gst_tiles = gst_calculate[0]
     
     if nerf:
-        clts = max((gst_score - SAME_LINE_LENGTH),0) / line_len_l
+        same_line_length = get_duplicate_pattern_lengths(duplicate_pattern_lengths)[0]
+        clts = max((gst_score - same_line_length),0) / line_len_l
     else:
         clts = gst_score / line_len_l
     
@@ -482,7 +931,7 @@ def calculate_csa(css, clts):
     return csa
 
 
-def calculate_cln(sequence_line_l, sequence_line_r, nerf=False):
+def calculate_cln(sequence_line_l, sequence_line_r, nerf=False, duplicate_pattern_lengths=None):
     """Calculate Common Line Normalized.
     Common Line Normalized (CLN) will count the ratio of duplicated lines 
     between two sets of line sequences.
@@ -492,6 +941,7 @@ def calculate_cln(sequence_line_l, sequence_line_r, nerf=False):
         sequence_line_r (list): A list of code lines from code 2.
         nerf (bool): If set to True, the score will be nerfed 
             (same segment / duplicate segment nerf calculation)
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
 
     Returns:
         float: Score between 0-1.
@@ -504,16 +954,34 @@ def calculate_cln(sequence_line_l, sequence_line_r, nerf=False):
     set_between = list(set(sequence_line_l) | set(sequence_line_r))
     union_size = len(set_between)
     
+    return calculate_cln_from_counts(total_len - union_size, lensequence_line_l, lensequence_line_r, nerf, duplicate_pattern_lengths)
+
+
+def calculate_cln_from_counts(duplicated_lines, distinct_len_l, distinct_len_r, nerf=False, duplicate_pattern_lengths=None):
+    """Calculate Common Line Normalized from precounted distinct lines.
+    Used when the counts come from sparse_scoring_utility (all pairs at once).
+
+    Args:
+        duplicated_lines (int): Count of distinct lines that exist on both codes.
+        distinct_len_l (int): Count of distinct lines from code 1.
+        distinct_len_r (int): Count of distinct lines from code 2.
+        nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
+
+    Returns:
+        float: Score between 0-1.
+
+    """
     if(nerf):
-        duplicated_lines = max(total_len - union_size - SAME_LINE_LENGTH, 0)
-    else:
-        duplicated_lines = total_len - union_size
+        same_line_length = get_duplicate_pattern_lengths(duplicate_pattern_lengths)[0]
+        duplicated_lines = max(duplicated_lines - same_line_length, 0)
     
-    CLN = duplicated_lines/min(lensequence_line_l,lensequence_line_r)
+    CLN = duplicated_lines/min(distinct_len_l,distinct_len_r)
     return CLN
 
 
-def calculate_cbln80(bigram_line_l, bigram_line_r, nerf=False):
+def calculate_cbln80(bigram_line_l, bigram_line_r, nerf=False, batched=None, duplicate_pattern_lengths=None):
     """Calculate Common Bigram Line Normalized 80.
     Common Bigram Line Normalized 80 (CBLN80) will calculate ratio of 
     bigram line sequence that has levenshtein ratio > 80%.
@@ -523,19 +991,80 @@ def calculate_cbln80(bigram_line_l, bigram_line_r, nerf=False):
         bigram_line_r (list): A list of bigram code lines from code 2.
         nerf (bool): If set to True, the score will be nerfed 
             (same segment / duplicate segment nerf calculation)
+        batched (bool): If set to True, all bigram pairs are scored at once with the batched kernel.
+            If set to None, the batched kernel is used when there are at least BATCHED_MIN_CELLS pairs.
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
 
     Returns:
         float: Score between 0-1.
 
+    """
+    lenbigram_line_l_dup = len(bigram_line_l)
+    counter80 = count_cbln80_matches(bigram_line_l, bigram_line_r, batched)
+        
+    return calculate_cbln80_from_matches(counter80, lenbigram_line_l_dup, nerf, duplicate_pattern_lengths)
+
+
+def calculate_cbln80_from_matches(counter80, lenbigram_line_l_dup, nerf=False, duplicate_pattern_lengths=None):
+    """Calculate Common Bigram Line Normalized 80 from the precounted matched bigram lines.
+
+    Args:
+        counter80 (int): The product of count_bigram_matches.
+        lenbigram_line_l_dup (int): Count of bigram lines from code 1.
+        nerf (bool): If set to True, the score will be nerfed 
+            (same segment / duplicate segment nerf calculation)
+        duplicate_pattern_lengths (tuple): Nerf values of the pair (see get_duplicate_pattern_lengths), required if nerf is True.
+
+    Returns:
+        float: Score between 0-1.
+
+    """
+    if(nerf):
+        same_line_length = get_duplicate_pattern_lengths(duplicate_pattern_lengths)[0]
+        nerf_score = max((same_line_length - 1), 0)
+        CBLN80 = max((counter80 - nerf_score),0) / lenbigram_line_l_dup
+    else:
+        CBLN80 = counter80 / lenbigram_line_l_dup
+    return CBLN80
+
+
+def count_cbln80_matches(bigram_line_l, bigram_line_r, batched=None):
+    """Count matched bigram lines for CBLN80 with the default or the batched kernel.
+
+    Args:
+        bigram_line_l (list): A list of bigram code lines from code 1.
+        bigram_line_r (list): A list of bigram code lines from code 2.
+        batched (bool): If set to True, all bigram pairs are scored at once with the batched kernel.
+            If set to None, the batched kernel is used when there are at least BATCHED_MIN_CELLS pairs.
+
+    Returns:
+        int: Count of matched bigram lines.
+
+    """
+    if batched is None:
+        batched = len(bigram_line_l) * len(bigram_line_r) >= BATCHED_MIN_CELLS
+
+    if batched:
+        return count_bigram_matches_batched(bigram_line_l, bigram_line_r)
+    return count_bigram_matches(bigram_line_l, bigram_line_r)
+
+
+def count_bigram_matches(bigram_line_l, bigram_line_r):
+    """Count bigram lines from code 1 that have a match (levenshtein ratio > 80%) in code 2.
+    Every bigram line of code 2 can only be matched once.
+
+    Args:
+        bigram_line_l (list): A list of bigram code lines from code 1.
+        bigram_line_r (list): A list of bigram code lines from code 2.
+
+    Returns:
+        int: Count of matched bigram lines.
+
     """
     bigram_line_l_dup = copy.deepcopy(bigram_line_l)
     bigram_line_r_dup = copy.deepcopy(bigram_line_r)
     
-    lenbigram_line_l_dup = len(bigram_line_l_dup)
-    lenbigram_line_r_dup = len(bigram_line_r_dup)
-    
     counter80 = 0
-    counter85 = 0
     for i in range(len(bigram_line_l_dup)):
         
         if len(bigram_line_r_dup) == 0:
@@ -546,11 +1075,188 @@ def calculate_cbln80(bigram_line_l, bigram_line_r, nerf=False):
         if(fuzz_result[1] > 0.8):
             bigram_line_r_dup.remove(fuzz_result[0])
             counter80 += 1
-            
+    
+    return counter80
+
+
+def count_bigram_matches_batched(bigram_line_l, bigram_line_r):
+    """Same as count_bigram_matches, but all pairs are scored with a single batched kernel call.
+    The greedy matching then runs over the score matrix.
+
+    Args:
+        bigram_line_l (list): A list of bigram code lines from code 1.
+        bigram_line_r (list): A list of bigram code lines from code 2.
+
+    Returns:
+        int: Count of matched bigram lines.
+
+    """
+    scores = lev_ratio_matrix(bigram_line_l, bigram_line_r)
+    
+    # matched bigram lines of code 2 are masked out, argmax keeps the first best like extract_best
+    available = np.ones(len(bigram_line_r), dtype=bool)
+    counter80 = 0
+    for i in range(len(bigram_line_l)):
         
-    if(nerf):
-        nerf_score = max((SAME_LINE_LENGTH - 1), 0)
-        CBLN80 = max((counter80 - nerf_score),0) / lenbigram_line_l_dup
-    else:
-        CBLN80 = counter80 / lenbigram_line_l_dup
-    return CBLN80
\ No newline at end of file
+        if not available.any():
+            break
+        
+        row_scores = np.where(available, scores[i], -1.0)
+        best_index = int(np.argmax(row_scores))
+        
+        if(row_scores[best_index] > 0.8):
+            available[best_index] = False
+            counter80 += 1
+    
+    return counter80
+
+
+##########################
+# Bounded Approximations #
+##########################
+
+
+# features that have an approximation for pathological pairs (see calculate_main_features size_budget,
+# the style features are budgeted in FeaturesCalculation.build_pair_scorer)
+APPROXIMATED_FEATURES = ('CSS', 'CLTS', 'CBLN80', 'WS', 'BS', 'CS')
+
+
+def split_aligned_blocks(length_l, length_r, block_count):
+    """Split two sequences into the same count of blocks at proportional positions.
+
+    Args:
+        length_l (int): Length of sequence 1.
+        length_r (int): Length of sequence 2.
+        block_count (int): Count of blocks.
+
+    Returns:
+        list: Pairs of block ranges ((start_l, end_l), (start_r, end_r)).
+
+    """
+    bounds_l = [length_l * k // block_count for k in range(block_count + 1)]
+    bounds_r = [length_r * k // block_count for k in range(block_count + 1)]
+    return [((bounds_l[k], bounds_l[k + 1]), (bounds_r[k], bounds_r[k + 1])) for k in range(block_count)]
+
+
+def approximate_lev_ratio(sequence_l, sequence_r, max_cells):
+    """Levenshtein ratio restricted to a block diagonal band, for sequences that are too long for the exact ratio.
+    Both sequences are split into aligned blocks (at most max_cells compared cells in total, but at least
+    the length of the shorter sequence, blocks of the longer sequence have at least one element),
+    the distance is the sum of the block distances, so the ratio is a lower bound of lev_ratio.
+
+    Args:
+        sequence_l (str): The string sequence 1.
+        sequence_r (str): The string sequence 2.
+        max_cells (int): Maximum count of compared cells (length_l * length_r of all blocks).
+
+    Returns:
+        float: Rounded to 4 precision of approximate levenshtein ratio.
+
+    """
+    total_length = len(sequence_l) + len(sequence_r)
+    if total_length == 0:
+        return 1.0
+
+    block_count = min(max(1, -(-len(sequence_l) * len(sequence_r) // max_cells)), max(len(sequence_l), len(sequence_r)))
+    matched_length = 0
+    for (start_l, end_l), (start_r, end_r) in split_aligned_blocks(len(sequence_l), len(sequence_r), block_count):
+        block_l, block_r = sequence_l[start_l:end_l], sequence_r[start_r:end_r]
+        if len(block_l) + len(block_r) > 0:
+            matched_length += ratio(block_l, block_r) * (len(block_l) + len(block_r))
+    return round(matched_length / total_length, 4)
+
+
+def approximate_gst(sequence_line_l, sequence_line_r, max_cells, minimal_match=3):
+    """Greedy string tiling restricted to aligned blocks of lines, for codes that are too long for the exact tiling.
+    Tiles can't cross block borders, so long tiles are cut or lost (the score is usually lower than the exact score).
+    Blocks have at least minimal_match lines; if those blocks still don't fit max_cells, only evenly spread
+    blocks that fit are tiled (the other blocks have no tiles), so the compared cells never exceed max_cells.
+
+    Args:
+        sequence_line_l (list): A list of code lines from code 1.
+        sequence_line_r (list): A list of code lines from code 2.
+        max_cells (int): Maximum count of compared cells (lines_l * lines_r of all tiled blocks).
+        minimal_match (int): Minimal tile length.
+
+    Returns:
+        list: Same as gst.calculate, contains tiles (positions of the whole codes) and score.
+
+    """
+    block_count = min(max(1, -(-len(sequence_line_l) * len(sequence_line_r) // max_cells)),
+                      max(1, min(len(sequence_line_l), len(sequence_line_r)) // minimal_match))
+    all_blocks = split_aligned_blocks(len(sequence_line_l), len(sequence_line_r), block_count)
+
+    # blocks of the lowest size still over the budget: tile evenly spread blocks while they fit
+    block_cells = [(end_l - start_l) * (end_r - start_r) for (start_l, end_l), (start_r, end_r) in all_blocks]
+    if sum(block_cells) > max_cells:
+        kept_count = max(1, max_cells // max(block_cells))
+        spread = sorted({block_count * x // kept_count for x in range(kept_count)})
+        used_cells = 0
+        tiled_blocks = []
+        for index in spread:
+            if used_cells + block_cells[index] <= max_cells:
+                used_cells += block_cells[index]
+                tiled_blocks.append(all_blocks[index])
+        all_blocks = tiled_blocks
+
+    all_tiles, total_score = [], 0
+    for (start_l, end_l), (start_r, end_r) in all_blocks:
+        tiles, score = gst.calculate(sequence_line_l[start_l:end_l], sequence_line_r[start_r:end_r], minimal_match)
+        for tile in tiles:
+            tile = dict(tile)
+            tile['token_1_position'] += start_l
+            tile['token_2_position'] += start_r
+            all_tiles.append(tile)
+        total_score += score
+    return [all_tiles, total_score]
+
+
+def count_bigram_matches_banded(bigram_line_l, bigram_line_r, max_cells):
+    """Approximate count_bigram_matches for codes with too many bigram lines.
+    Identical bigram lines are matched anywhere (ratio 1), other bigram lines of code 1 are only
+    compared with a band of bigram lines of code 2 around the proportional position.
+
+    Args:
+        bigram_line_l (list): A list of bigram code lines from code 1.
+        bigram_line_r (list): A list of bigram code lines from code 2.
+        max_cells (int): Maximum count of compared bigram line pairs.
+
+    Returns:
+        int: Count of matched bigram lines.
+
+    """
+    if len(bigram_line_l) == 0 or len(bigram_line_r) == 0:
+        return 0
+    band = max(1, min(len(bigram_line_r), max_cells // len(bigram_line_l)))
+
+    positions = defaultdict(list)
+    for index in range(len(bigram_line_r) - 1, -1, -1):
+        positions[bigram_line_r[index]].append(index)
+
+    available = np.ones(len(bigram_line_r), dtype=bool)
+    counter80 = 0
+    for i, line in enumerate(bigram_line_l):
+        if counter80 == len(bigram_line_r):
+            break
+
+        # first available identical line
+        same_positions = positions.get(line)
+        while same_positions and not available[same_positions[-1]]:
+            same_positions.pop()
+        if same_positions:
+            available[same_positions.pop()] = False
+            counter80 += 1
+            continue
+
+        start = min(max(0, i * len(bigram_line_r) // len(bigram_line_l) - band // 2), len(bigram_line_r) - band)
+        candidates = [x for x in range(start, start + band) if available[x]]
+        if len(candidates) == 0:
+            continue
+
+        scores = lev_ratio_one_to_many(line, [bigram_line_r[x] for x in candidates])
+        best_index = int(np.argmax(scores))
+        if(scores[best_index] > 0.8):
+            available[candidates[best_index]] = False
+            counter80 += 1
+
+    return counter80
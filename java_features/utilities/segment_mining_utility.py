@@ -0,0 +1,224 @@
+"""Segment Mining Utility is a module that finds frequent line segments (skeleton code)
+accross all codes at once.
+All codes are interned into line ids and concatenated (separated by a unique id per code),
+then a generalized suffix array and LCP array expose every repeated segment with its document frequency.
+It replaces the pairwise greedy string tiling pass of dup_segment_counter.
+"""
+
+import numpy as np
+
+
+# same minimum segment length as dup_segment_counter (tiles that consist of >= 5 lines)
+MINIMAL_SEGMENT_LINES = 5
+
+
+####################
+# Text Preparation #
+####################
+
+
+def build_line_text(sequence_lines_list):
+    """Intern lines into ids and concatenate all codes into a single integer text.
+    Each code is followed by a unique separator id, so no repeat crosses two codes.
+
+    Args:
+        sequence_lines_list (list): A list of code lines list (one per code).
+
+    Returns:
+        tuple: Contains text, documents, id_to_line.
+            text = Concatenated line ids and separators (numpy.ndarray)
+            documents = Code index of every text position (numpy.ndarray)
+            id_to_line = Line of every line id (list)
+
+    """
+    line_to_id = dict()
+    id_to_line = []
+    text = []
+    documents = []
+    for document_index, sequence_lines in enumerate(sequence_lines_list):
+        for line in sequence_lines:
+            line_id = line_to_id.get(line)
+            if line_id is None:
+                line_id = len(id_to_line)
+                line_to_id[line] = line_id
+                id_to_line.append(line)
+            text.append(line_id)
+            documents.append(document_index)
+        text.append(-1 - document_index)
+        documents.append(document_index)
+
+    # separators get the biggest ids, so all ids are non negative
+    text = np.array(text, dtype=np.int64)
+    separators = text < 0
+    text[separators] = len(id_to_line) - 1 - text[separators]
+    return text, np.array(documents, dtype=np.int64), id_to_line
+
+
+########################
+# Suffix Array and LCP #
+########################
+
+
+def build_suffix_array(text):
+    """Build suffix array with prefix doubling (vectorized with numpy).
+
+    Args:
+        text (numpy.ndarray): Integer text.
+
+    Returns:
+        tuple: Contains suffix_array, rank.
+            suffix_array = Start position of suffixes in sorted order (numpy.ndarray)
+            rank = Position of every suffix in suffix_array (numpy.ndarray)
+
+    """
+    text_len = len(text)
+    if text_len == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    _, rank = np.unique(text, return_inverse=True)
+    rank = rank.astype(np.int64)
+    suffix_array = np.argsort(rank, kind='stable')
+
+    step = 1
+    while rank[suffix_array[-1]] < text_len - 1:
+        second_key = np.full(text_len, -1, dtype=np.int64)
+        second_key[:text_len - step] = rank[step:]
+        suffix_array = np.lexsort((second_key, rank))
+
+        first_sorted = rank[suffix_array]
+        second_sorted = second_key[suffix_array]
+        is_new_rank = np.ones(text_len, dtype=bool)
+        is_new_rank[1:] = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+
+        rank = np.empty(text_len, dtype=np.int64)
+        rank[suffix_array] = np.cumsum(is_new_rank) - 1
+        step *= 2
+
+    return suffix_array, rank
+
+
+def build_lcp_array(text, suffix_array, rank):
+    """Build LCP array with Kasai algorithm.
+
+    Args:
+        text (numpy.ndarray): Integer text.
+        suffix_array (numpy.ndarray): The product of build_suffix_array.
+        rank (numpy.ndarray): The product of build_suffix_array.
+
+    Returns:
+        numpy.ndarray: lcp[i] is the longest common prefix between suffix_array[i-1] and suffix_array[i].
+
+    """
+    text_len = len(text)
+    text_list = text.tolist()
+    suffix_list = suffix_array.tolist()
+    rank_list = rank.tolist()
+
+    lcp = [0] * text_len
+    common = 0
+    for position in range(text_len):
+        current_rank = rank_list[position]
+        if current_rank == 0:
+            common = 0
+            continue
+
+        previous = suffix_list[current_rank - 1]
+        while (position + common < text_len and previous + common < text_len
+               and text_list[position + common] == text_list[previous + common]):
+            common += 1
+        lcp[current_rank] = common
+        if common > 0:
+            common -= 1
+
+    return np.array(lcp, dtype=np.int64)
+
+
+def iter_lcp_intervals(lcp):
+    """Iterate all LCP intervals (bottom-up traversal of the virtual suffix tree).
+
+    Args:
+        lcp (numpy.ndarray): The product of build_lcp_array.
+
+    Returns:
+        generator: Generator object for (lcp value, left bound, right bound) in suffix array positions.
+
+    """
+    lcp_list = lcp.tolist()
+    stack = [(0, 0)]
+    for index in range(1, len(lcp_list) + 1):
+        current_lcp = lcp_list[index] if index < len(lcp_list) else -1
+        left_bound = index - 1
+        while current_lcp < stack[-1][0]:
+            top_lcp, top_left_bound = stack.pop()
+            yield top_lcp, top_left_bound, index - 1
+            left_bound = top_left_bound
+            if len(stack) == 0:
+                break
+        if len(stack) == 0 or current_lcp > stack[-1][0]:
+            stack.append((current_lcp, left_bound))
+
+
+###########################
+# Frequent Segment Mining #
+###########################
+
+
+def mine_frequent_segments(sequence_lines_list, minimal_segment_lines=MINIMAL_SEGMENT_LINES, minimal_document_frequency=2):
+    """Find line segments that are repeated in multiple codes with their document frequency.
+    Only maximal segments are reported (can't be extended to the left or right without losing an occurrence).
+
+    Args:
+        sequence_lines_list (list): A list of code lines list (one per code).
+        minimal_segment_lines (int): Minimum count of lines of a segment.
+        minimal_document_frequency (int): Minimum count of codes that contain the segment.
+
+    Returns:
+        dict: Contains segment (tuple of lines) as key and document frequency as value.
+
+    """
+    text, documents, id_to_line = build_line_text(sequence_lines_list)
+    suffix_array, rank = build_suffix_array(text)
+    lcp = build_lcp_array(text, suffix_array, rank)
+
+    # symbol before every suffix (-1 for the first position, separators are unique anyway)
+    previous_symbols = np.full(len(text), -1, dtype=np.int64)
+    previous_symbols[suffix_array > 0] = text[suffix_array[suffix_array > 0] - 1]
+    suffix_documents = documents[suffix_array]
+
+    segments = dict()
+    for segment_len, left_bound, right_bound in iter_lcp_intervals(lcp):
+        if segment_len < minimal_segment_lines or right_bound - left_bound + 1 < minimal_document_frequency:
+            continue
+
+        interval_previous = previous_symbols[left_bound:right_bound + 1]
+        if interval_previous[0] != -1 and np.all(interval_previous == interval_previous[0]):
+            # not left maximal, the longer segment is reported by another interval
+            continue
+
+        document_frequency = len(np.unique(suffix_documents[left_bound:right_bound + 1]))
+        if document_frequency < minimal_document_frequency:
+            continue
+
+        start = suffix_array[left_bound]
+        segment = tuple(id_to_line[line_id] for line_id in text[start:start + segment_len].tolist())
+        segments[segment] = document_frequency
+
+    return segments
+
+
+def frequent_segment_counter(main_codes_df, minimal_segment_lines=MINIMAL_SEGMENT_LINES):
+    """Code duplicated segment counter based on document frequency.
+    Same output format as dup_segment_counter, but the count is the number of codes
+    that contain the segment (instead of the number of pairs), found in a single pass.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        minimal_segment_lines (int): Minimum count of lines of a segment.
+
+    Returns:
+        dict: Contains pattern as key and document frequency as value.
+            Pattern is a list of tokens that are converted into a string.
+
+    """
+    segments = mine_frequent_segments(list(main_codes_df['sequence_line']), minimal_segment_lines)
+    return {str(list(segment)): document_frequency for segment, document_frequency in segments.items()}
@@ -0,0 +1,208 @@
+"""Shard Utility is a module that splits pair scoring across several machines (only a shared filesystem is needed).
+The upper triangle of pairs (same order as create_features_result_df) is partitioned deterministically
+into contiguous, balanced ranges; every machine scores one shard and saves it, the merge concatenates
+the shards in order and adds the stats features, the same as a single machine run.
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from sketch_utility import KLLSketch, DEFAULT_SKETCH_K
+from stats_scoring_utility import get_stats_config, calculate_tokens_percentile, calculate_features_percentile
+from stats_scoring_utility import build_features_sketches, merge_sketches, features_percentile_from_sketches
+from stats_scoring_utility import build_token_stats_features, build_main_style_stats_features
+
+
+#####################
+# Pair Partitioning #
+#####################
+
+
+def count_pairs(code_count):
+    """Count pairs of the upper triangle.
+
+    Args:
+        code_count (int): Count of codes.
+
+    Returns:
+        int: Count of pairs (i, j) with i < j.
+
+    """
+    return code_count * (code_count - 1) // 2
+
+
+def shard_bounds(pair_count, shard_index, shard_count):
+    """Range of pair ranks of a shard, shard sizes differ by at most one pair.
+
+    Args:
+        pair_count (int): Count of all pairs.
+        shard_index (int): Index of the shard (0 to shard_count - 1).
+        shard_count (int): Count of shards.
+
+    Returns:
+        tuple: Contains start (inclusive) and end (exclusive) rank.
+
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f'shard_index must be between 0 and {shard_count - 1}, got {shard_index}')
+    return pair_count * shard_index // shard_count, pair_count * (shard_index + 1) // shard_count
+
+
+def shard_pairs(code_count, shard_index, shard_count):
+    """Generate the pairs of a shard, in the same order as all pairs of create_features_result_df.
+
+    Args:
+        code_count (int): Count of codes.
+        shard_index (int): Index of the shard (0 to shard_count - 1).
+        shard_count (int): Count of shards.
+
+    Returns:
+        generator: Generator object for pairs (i, j) with i < j.
+
+    """
+    start, end = shard_bounds(count_pairs(code_count), shard_index, shard_count)
+    if start == end:
+        return
+
+    # rank of the first pair of every row
+    rows = np.arange(code_count, dtype=np.int64)
+    row_starts = rows * (2 * code_count - rows - 1) // 2
+    i = int(np.searchsorted(row_starts, start, side='right')) - 1
+    j = i + 1 + (start - int(row_starts[i]))
+
+    for _ in range(end - start):
+        yield (i, j)
+        j += 1
+        if j == code_count:
+            i += 1
+            j = i + 1
+
+
+def select_shard(pairs, shard_index, shard_count):
+    """Select the shard of a sorted list of pairs (for example candidate pairs).
+
+    Args:
+        pairs (list): Sorted pairs.
+        shard_index (int): Index of the shard (0 to shard_count - 1).
+        shard_count (int): Count of shards.
+
+    Returns:
+        list: Pairs of the shard.
+
+    """
+    start, end = shard_bounds(len(pairs), shard_index, shard_count)
+    return pairs[start:end]
+
+
+################
+# Shard Output #
+################
+
+
+def shard_file_path(directory, shard_index, shard_count):
+    return os.path.join(directory, f'shard-{shard_index:04d}-of-{shard_count:04d}.pkl')
+
+
+def save_shard(result_scoring_df, directory, shard_index, shard_count, code_count, with_sketches=False,
+               k=DEFAULT_SKETCH_K, config=None):
+    """Save the features result of a shard (written to a temporary file first, then renamed).
+
+    Args:
+        result_scoring_df (pandas.DataFrame): Result of create_features_result_df with the same shard_index / shard_count.
+        directory (str): Shared directory of the shards.
+        shard_index (int): Index of the shard.
+        shard_count (int): Count of shards.
+        code_count (int): Count of codes (checked on merge).
+        with_sketches (bool): If set to True, sketches of the percentile feature columns are saved too,
+            so the merge doesn't need to read the raw columns for the percentiles.
+        k (int): Size parameter of the sketches.
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+
+    Returns:
+        str: File path of the shard.
+
+    """
+    features_sketches = None
+    if with_sketches:
+        features_sketches = build_features_sketches(result_scoring_df, None, k, config)
+        features_sketches = {x: sketch.to_dict() for x, sketch in features_sketches.items()}
+
+    shard = {
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'code_count': code_count,
+        'result_scoring_df': result_scoring_df,
+        'features_sketches': features_sketches,
+    }
+
+    file_path = shard_file_path(directory, shard_index, shard_count)
+    with open(file_path + '.tmp', 'wb') as shard_file:
+        pickle.dump(shard, shard_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_path + '.tmp', file_path)
+    return file_path
+
+
+def load_shards(directory, shard_count):
+    """Load all saved shards, in shard order.
+
+    Args:
+        directory (str): Shared directory of the shards.
+        shard_count (int): Count of shards.
+
+    Returns:
+        list: Shard dicts (written by save_shard).
+
+    """
+    missing = [x for x in range(shard_count) if not os.path.exists(shard_file_path(directory, x, shard_count))]
+    if len(missing) > 0:
+        raise ValueError(f'missing shards: {missing}')
+
+    all_shards = []
+    for shard_index in range(shard_count):
+        with open(shard_file_path(directory, shard_index, shard_count), 'rb') as shard_file:
+            all_shards.append(pickle.load(shard_file))
+
+    if len({x['code_count'] for x in all_shards}) > 1:
+        raise ValueError('shards are calculated from different count of codes')
+    return all_shards
+
+
+def merge_shards(directory, shard_count, main_codes_df, config=None, use_sketches=False):
+    """Merge shard results and add the stats features, same as the single machine pipeline.
+
+    Args:
+        directory (str): Shared directory of the shards.
+        shard_count (int): Count of shards.
+        main_codes_df (pandas.DataFrame): The same codes DataFrame as used by the shards.
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+        use_sketches (bool): If set to True, feature percentiles come from the merged shard sketches
+            (saved with with_sketches=True, approximate for large results), otherwise from all raw values (exact).
+
+    Returns:
+        pandas.DataFrame: Contains DataFrame for features result with stats features.
+
+    """
+    if config is None:
+        config = get_stats_config()
+
+    all_shards = load_shards(directory, shard_count)
+    if all_shards[0]['code_count'] != len(main_codes_df):
+        raise ValueError('shards are calculated from different codes')
+
+    result_scoring_df = pd.concat([x['result_scoring_df'] for x in all_shards], ignore_index=True)
+
+    tokens_percentile = calculate_tokens_percentile(main_codes_df.assign(sequence_len=main_codes_df['sequence'].str.len()), config)
+    if use_sketches:
+        if any(x['features_sketches'] is None for x in all_shards):
+            raise ValueError('shards are saved without sketches')
+        all_sketches = [{column: KLLSketch.from_dict(data) for column, data in x['features_sketches'].items()} for x in all_shards]
+        features_percentile = features_percentile_from_sketches(merge_sketches(all_sketches), config)
+    else:
+        features_percentile = calculate_features_percentile(result_scoring_df, config)
+
+    build_token_stats_features(result_scoring_df, main_codes_df, config, tokens_percentile)
+    build_main_style_stats_features(result_scoring_df, config, features_percentile)
+    return result_scoring_df
@@ -0,0 +1,222 @@
+"""Skeleton Utility is a module that matches duplicate patterns (skeleton code) on every code once,
+instead of searching and replacing every pattern for every pair (count_duplicate_patterns).
+All patterns are compiled into a single Aho-Corasick automaton, each code keeps
+a bitmask of the patterns it contains, so the nerf values of a pair come from combining two bitmasks.
+"""
+
+from collections import deque, OrderedDict
+
+
+# count of texts (code with removed patterns) kept by SkeletonMatcher, older ones are rebuilt when needed
+DEFAULT_MAX_CACHED_TEXTS = 1024
+
+
+##########################
+# Aho-Corasick Automaton #
+##########################
+
+
+class AhoCorasick:
+    """AhoCorasick finds which of many patterns occur in a text with a single scan.
+
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns (list): A list of strings, pattern i is reported as bit i.
+
+        """
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [0]
+
+        for pattern_index, pattern in enumerate(patterns):
+            node = 0
+            for character in pattern:
+                next_node = self.goto[node].get(character)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][character] = next_node
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.output.append(0)
+                node = next_node
+            self.output[node] |= 1 << pattern_index
+
+        # breadth first, so the fail node of every node is already complete
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail_node = self.fail[node]
+                while fail_node != 0 and character not in self.goto[fail_node]:
+                    fail_node = self.fail[fail_node]
+                self.fail[next_node] = self.goto[fail_node].get(character, 0)
+                self.output[next_node] |= self.output[self.fail[next_node]]
+
+    def scan(self, text):
+        """Scan the text once and report every pattern that occurs in it.
+
+        Args:
+            text (str): Text to scan.
+
+        Returns:
+            int: Bitmask of patterns that occur in the text.
+
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        found = output[0]
+        node = 0
+        for character in text:
+            while node != 0 and character not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(character, 0)
+            found |= output[node]
+        return found
+
+
+####################
+# Skeleton Matcher #
+####################
+
+
+class SkeletonMatcher:
+    """SkeletonMatcher computes the same nerf values as count_duplicate_patterns.
+    Patterns are checked from the longest one, a pattern that exists on both codes is removed
+    from both of them before checking the next pattern. The removed patterns are the same for both codes,
+    so every code memoizes its pattern bitmask per set of removed patterns.
+    Most pairs never remove anything that changes the other patterns, then the result is
+    only a combination of the two cached bitmasks.
+    Texts with removed patterns are only kept in a bounded LRU cache, an evicted text is rebuilt
+    from the code by removing the patterns again.
+
+    """
+
+    def __init__(self, all_duplicate_line_sequences, max_cached_texts=DEFAULT_MAX_CACHED_TEXTS):
+        """
+        Args:
+            all_duplicate_line_sequences (list): The product of filter_dup_segment.
+            max_cached_texts (int): Count of texts with removed patterns kept in memory.
+
+        """
+        self.patterns = [''.join(x).strip() for x in all_duplicate_line_sequences]
+        self.line_lengths = [len(x) for x in all_duplicate_line_sequences]
+        self.sequence_lengths = [len(x) for x in self.patterns]
+        self.automaton = AhoCorasick(self.patterns)
+        self.max_cached_texts = max_cached_texts
+
+        # document key -> tokens sequence
+        self.sequences = dict()
+        # document key -> {removed patterns bitmask: found patterns bitmask}
+        self.documents = dict()
+        # (document key, removed patterns bitmask) -> text, least recently used first
+        self.texts = OrderedDict()
+
+    def add_document(self, key, sequence):
+        """Scan a code and store its bitmask of matched patterns.
+
+        Args:
+            key (hashable): Identifier of the code (for example row position or filename).
+            sequence (str): tokens sequence of the code.
+
+        Returns:
+            int: Bitmask of patterns that exist on the code.
+
+        """
+        found = self.automaton.scan(sequence)
+        self.sequences[key] = sequence
+        self.documents[key] = {0: found}
+        return found
+
+    def get_document_mask(self, key):
+        """Get bitmask of patterns that exist on the code (without any removal).
+
+        Args:
+            key (hashable): Identifier of the code.
+
+        Returns:
+            int: Bitmask of matched patterns.
+
+        """
+        return self.documents[key][0]
+
+    def __get_text(self, key, removed):
+        if removed == 0:
+            return self.sequences[key]
+        text = self.texts.get((key, removed))
+        if text is not None:
+            self.texts.move_to_end((key, removed))
+            return text
+
+        # patterns are removed by order, same as match_pair
+        text = self.sequences[key]
+        pattern_index = 0
+        remaining = removed
+        while remaining:
+            if remaining & 1:
+                text = text.replace(self.patterns[pattern_index], '')
+            remaining >>= 1
+            pattern_index += 1
+        self.__cache_text(key, removed, text)
+        return text
+
+    def __cache_text(self, key, removed, text):
+        if self.max_cached_texts <= 0:
+            return
+        self.texts[(key, removed)] = text
+        if len(self.texts) > self.max_cached_texts:
+            self.texts.popitem(last=False)
+
+    def __get_state(self, key, removed, parent_removed, pattern_index):
+        states = self.documents[key]
+        found = states.get(removed)
+        if found is None:
+            text = self.__get_text(key, parent_removed).replace(self.patterns[pattern_index], '')
+            self.__cache_text(key, removed, text)
+            found = self.automaton.scan(text)
+            states[removed] = found
+        return found
+
+    def match_pair(self, key_l, key_r):
+        """Calculate nerf values of a pair.
+
+        Args:
+            key_l (hashable): Identifier of code 1.
+            key_r (hashable): Identifier of code 2.
+
+        Returns:
+            tuple: Contains same_line_length, same_sequence_length, removed.
+                same_line_length = Total lines of removed patterns (int)
+                same_sequence_length = Total tokens of removed patterns (int)
+                removed = Bitmask of removed patterns (int)
+
+        """
+        found_l = self.get_document_mask(key_l)
+        found_r = self.get_document_mask(key_r)
+
+        removed = 0
+        same_line_length = 0
+        same_sequence_length = 0
+        next_index = 0
+        while True:
+            candidates = (found_l & found_r) >> next_index << next_index
+            if candidates == 0:
+                break
+
+            # the next pattern (by order) that exists on both codes
+            pattern_index = (candidates & -candidates).bit_length() - 1
+            next_removed = removed | (1 << pattern_index)
+            found_l = self.__get_state(key_l, next_removed, removed, pattern_index)
+            found_r = self.__get_state(key_r, next_removed, removed, pattern_index)
+            removed = next_removed
+
+            same_line_length += self.line_lengths[pattern_index]
+            same_sequence_length += self.sequence_lengths[pattern_index]
+            next_index = pattern_index + 1
+
+        return same_line_length, same_sequence_length, removed
@@ -0,0 +1,243 @@
+"""Sketch Utility is a module that contains mergeable quantile sketches (KLL, Karnin-Lang-Liberty 2016).
+A sketch summarizes a stream of values in bounded memory, sketches of different chunks (or machines)
+are merged into a sketch of the whole stream, so percentile features don't need every pair in memory.
+While no compaction has happened, the sketch keeps every value and percentiles are the same as np.percentile.
+"""
+
+import math
+import random
+
+import numpy as np
+
+
+# default k, normalized rank error around 1.3%
+DEFAULT_SKETCH_K = 200
+
+# compactor capacity decays by this factor for every level below the top one
+CAPACITY_DECAY = 2 / 3
+
+MINIMAL_CAPACITY = 2
+
+
+##########################
+# Error Bound and Sizing #
+##########################
+
+
+def kll_rank_error(k):
+    """Estimate normalized rank error of a KLL sketch (empirical bound, 99% confidence).
+
+    Args:
+        k (int): Size parameter of the sketch.
+
+    Returns:
+        float: Rank error as a fraction of the stream length.
+
+    """
+    return 2.296 / (k ** 0.9723)
+
+
+def kll_k_from_error(rank_error):
+    """Find the smallest k that satisfies a normalized rank error.
+
+    Args:
+        rank_error (float): Wanted rank error as a fraction of the stream length (for example 0.01).
+
+    Returns:
+        int: Size parameter of the sketch.
+
+    """
+    return max(MINIMAL_CAPACITY, math.ceil((2.296 / rank_error) ** (1 / 0.9723)))
+
+
+##############
+# KLL Sketch #
+##############
+
+
+class KLLSketch:
+    """KLLSketch keeps a hierarchy of compactors, an item on level h represents 2^h values of the stream.
+    A full compactor is sorted and every second item is promoted to the next level.
+
+    """
+
+    def __init__(self, k=DEFAULT_SKETCH_K, seed=0):
+        """
+        Args:
+            k (int): Size parameter of the sketch, bigger k gives smaller error (see kll_k_from_error).
+            seed (int): Seed of the compaction offsets, the same seed and input give the same sketch.
+
+        """
+        self.k = k
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = self.__capacity(0)
+        self.count = 0
+        self.is_exact = True
+
+    def __capacity(self, level):
+        height = len(self.compactors)
+        return max(MINIMAL_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** (height - level - 1))))
+
+    def __grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self.__capacity(level) for level in range(len(self.compactors)))
+
+    def __compress(self):
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) < self.__capacity(level):
+                continue
+            if level + 1 >= len(self.compactors):
+                self.__grow()
+
+            compactor = sorted(self.compactors[level])
+            # odd item stays on the same level
+            kept = [compactor.pop()] if len(compactor) % 2 == 1 else []
+            offset = self.random.randint(0, 1)
+            self.compactors[level + 1].extend(compactor[offset::2])
+            self.compactors[level] = kept
+            self.is_exact = False
+
+            self.size = sum(len(x) for x in self.compactors)
+            if self.size < self.max_size:
+                break
+
+    def update(self, value):
+        """Add a value to the sketch.
+
+        Args:
+            value (float): A value of the stream.
+
+        Returns:
+            None
+
+        """
+        self.update_many([value])
+
+    def update_many(self, values):
+        """Add many values to the sketch.
+
+        Args:
+            values (list/numpy.ndarray/pandas.Series): Values of the stream.
+
+        Returns:
+            None
+
+        """
+        values = np.asarray(values, dtype=np.float64).ravel().tolist()
+        self.compactors[0].extend(values)
+        self.count += len(values)
+        self.size += len(values)
+        while self.size >= self.max_size:
+            self.__compress()
+
+    def merge(self, other):
+        """Merge another sketch into this sketch (the other sketch is not changed).
+
+        Args:
+            other (KLLSketch): Sketch of another chunk of the stream.
+
+        Returns:
+            KLLSketch: This sketch.
+
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.__grow()
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+
+        self.count += other.count
+        self.is_exact = self.is_exact and other.is_exact
+        self.size = sum(len(x) for x in self.compactors)
+        while self.size >= self.max_size:
+            self.__compress()
+        return self
+
+    def weighted_items(self):
+        """Get sorted items of the sketch with their weights.
+
+        Returns:
+            tuple: Contains items, weights (both numpy.ndarray).
+
+        """
+        items = []
+        weights = []
+        for level, compactor in enumerate(self.compactors):
+            items.extend(compactor)
+            weights.extend([1 << level] * len(compactor))
+
+        items = np.array(items, dtype=np.float64)
+        weights = np.array(weights, dtype=np.int64)
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def percentile(self, percentile):
+        """Estimate a percentile of the stream.
+        When the sketch is exact, the result is the same as np.percentile (linear interpolation).
+
+        Args:
+            percentile (float): Percentile between 0-100.
+
+        Returns:
+            float: Estimated percentile value.
+
+        """
+        if self.count == 0:
+            raise ValueError('percentile of an empty sketch')
+        if self.is_exact:
+            return np.percentile(self.compactors[0], percentile)
+
+        # same interpolation as np.percentile, over the weighted ranks
+        items, weights = self.weighted_items()
+        rank = (percentile / 100) * (self.count - 1)
+        cumulative = np.cumsum(weights)
+        lower = min(int(np.searchsorted(cumulative, math.floor(rank), side='right')), len(items) - 1)
+        upper = min(int(np.searchsorted(cumulative, math.ceil(rank), side='right')), len(items) - 1)
+        fraction = rank - math.floor(rank)
+        return items[lower] + (items[upper] - items[lower]) * fraction
+
+    def rank_error(self):
+        """Get normalized rank error of the sketch (0 if the sketch is exact).
+
+        Returns:
+            float: Rank error as a fraction of the stream length.
+
+        """
+        return 0.0 if self.is_exact else kll_rank_error(self.k)
+
+    def to_dict(self):
+        """Serialize the sketch (json compatible), to merge sketches from other processes or machines.
+
+        Returns:
+            dict: Contains k, seed, count, is_exact and compactors.
+
+        """
+        return {
+            'k': self.k,
+            'seed': self.seed,
+            'count': self.count,
+            'is_exact': self.is_exact,
+            'compactors': [list(x) for x in self.compactors],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load a sketch serialized by to_dict.
+
+        Args:
+            data (dict): The product of to_dict.
+
+        Returns:
+            KLLSketch: The loaded sketch.
+
+        """
+        sketch = cls(data['k'], data['seed'])
+        while len(sketch.compactors) < len(data['compactors']):
+            sketch.__grow()
+        sketch.compactors = [list(x) for x in data['compactors']]
+        sketch.count = data['count']
+        sketch.is_exact = data['is_exact']
+        sketch.size = sum(len(x) for x in sketch.compactors)
+        return sketch
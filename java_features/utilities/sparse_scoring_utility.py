@@ -0,0 +1,267 @@
+"""Sparse Scoring Utility is a module that calculates line based features (CLN, CBLN)
+for all pairs at once.
+Every code becomes a row of sparse incidence matrix (code x distinct line), so the count of
+shared distinct lines between all pairs comes from a single (blocked) matrix product.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from scoring_utility import generate_bigram_lines
+
+
+# count of rows multiplied at once, bounds the dense block to (block_size x all codes)
+INTERSECTION_BLOCK_SIZE = 1024
+
+
+#########################
+# Line Incidence Matrix #
+#########################
+
+
+def build_line_incidence_matrix(sequence_lines_list, vocabulary=None):
+    """Build sparse incidence matrix between codes and distinct lines.
+
+    Args:
+        sequence_lines_list (list): A list of code lines list (one per code).
+        vocabulary (dict): Contains line as key and column index as value.
+            New lines will be added to it. If set to None, a new vocabulary is created.
+            Passing the same vocabulary makes matrices of different code sets comparable.
+
+    Returns:
+        tuple: Contains incidence, vocabulary.
+            incidence = Binary matrix with shape (codes, distinct lines) (scipy.sparse.csr_matrix)
+            vocabulary = Line to column index (dict)
+
+    """
+    if vocabulary is None:
+        vocabulary = dict()
+
+    indptr = [0]
+    indices = []
+    for sequence_lines in sequence_lines_list:
+        line_ids = [vocabulary.setdefault(line, len(vocabulary)) for line in set(sequence_lines)]
+        indices.extend(sorted(line_ids))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.int32)
+    incidence = csr_matrix((data, np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                           shape=(len(sequence_lines_list), len(vocabulary)))
+    return incidence, vocabulary
+
+
+def iter_pairwise_intersections(incidence_l, incidence_r=None, block_size=INTERSECTION_BLOCK_SIZE):
+    """Iterate count of shared distinct lines between codes, one dense block of rows at a time.
+
+    Args:
+        incidence_l (scipy.sparse.csr_matrix): Incidence matrix of the row codes.
+        incidence_r (scipy.sparse.csr_matrix): Incidence matrix of the column codes
+            (built with the same vocabulary). If set to None, incidence_l is used.
+        block_size (int): Count of rows multiplied at once.
+
+    Returns:
+        generator: Generator object for (row_start, row_stop, intersections block).
+            Intersections block has shape (row_stop - row_start, column codes).
+
+    """
+    if incidence_r is None:
+        incidence_r = incidence_l
+
+    # vocabulary might grow after incidence_l was built, align the column count
+    columns = max(incidence_l.shape[1], incidence_r.shape[1])
+    incidence_l = _resize_columns(incidence_l, columns)
+    incidence_r_t = _resize_columns(incidence_r, columns).T.tocsc()
+
+    for row_start in range(0, incidence_l.shape[0], block_size):
+        row_stop = min(row_start + block_size, incidence_l.shape[0])
+        block = incidence_l[row_start:row_stop] @ incidence_r_t
+        yield row_start, row_stop, block.toarray().astype(np.int32)
+
+
+def pairwise_intersection_counts(incidence_l, incidence_r=None, block_size=INTERSECTION_BLOCK_SIZE):
+    """Count shared distinct lines between every pair of codes.
+
+    Args:
+        incidence_l (scipy.sparse.csr_matrix): Incidence matrix of the row codes.
+        incidence_r (scipy.sparse.csr_matrix): Incidence matrix of the column codes.
+            If set to None, incidence_l is used (all pairs within the same codes).
+        block_size (int): Count of rows multiplied at once.
+
+    Returns:
+        numpy.ndarray: Intersections count with shape (row codes, column codes).
+
+    """
+    columns_count = incidence_l.shape[0] if incidence_r is None else incidence_r.shape[0]
+    intersections = np.zeros((incidence_l.shape[0], columns_count), dtype=np.int32)
+    for row_start, row_stop, block in iter_pairwise_intersections(incidence_l, incidence_r, block_size):
+        intersections[row_start:row_stop] = block
+    return intersections
+
+
+def _resize_columns(incidence, columns):
+    if incidence.shape[1] == columns:
+        return incidence
+    return csr_matrix((incidence.data, incidence.indices, incidence.indptr), shape=(incidence.shape[0], columns))
+
+
+##########################
+# All Pairs CLN and CBLN #
+##########################
+
+
+def distinct_line_counts(incidence):
+    """Count distinct lines of every code.
+
+    Args:
+        incidence (scipy.sparse.csr_matrix): Incidence matrix, the product of build_line_incidence_matrix.
+
+    Returns:
+        numpy.ndarray: Count of distinct lines per code.
+
+    """
+    return np.diff(incidence.indptr)
+
+
+def cln_matrix_from_counts(intersections, distinct_counts_l, distinct_counts_r=None):
+    """Calculate Common Line Normalized for every pair from the intersection counts.
+    Same formula as calculate_cln (shared distinct lines / minimum distinct lines),
+    a pair with a code without lines scores 0.
+
+    Args:
+        intersections (numpy.ndarray): The product of pairwise_intersection_counts.
+        distinct_counts_l (numpy.ndarray): Distinct lines count of the row codes.
+        distinct_counts_r (numpy.ndarray): Distinct lines count of the column codes.
+            If set to None, distinct_counts_l is used.
+
+    Returns:
+        numpy.ndarray: Score between 0-1 with the same shape as intersections.
+
+    """
+    if distinct_counts_r is None:
+        distinct_counts_r = distinct_counts_l
+    min_distinct = np.minimum(distinct_counts_l[:, None], distinct_counts_r[None, :])
+    return np.divide(intersections, min_distinct, out=np.zeros(min_distinct.shape), where=min_distinct > 0)
+
+
+def build_line_features_index(main_codes_df, use_preprocessing=True, block_size=INTERSECTION_BLOCK_SIZE):
+    """Build incidence matrices of lines and bigram lines for all codes.
+    Intersection counts are calculated lazily by get_pair_line_counts, one block of rows at a time,
+    so no (codes x codes) matrix is built. Pairs asked in the pair order of create_features_result_df
+    calculate every block once.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        use_preprocessing (bool): If set to True, the tokenized lines (sequence_line) are used,
+            otherwise the raw lines (raw_sequence_line).
+        block_size (int): Count of rows multiplied at once.
+
+    Returns:
+        dict: Contains 'line' and 'bigram' keys, each one is a dict with
+            'incidence' (scipy.sparse.csr_matrix), 'incidence_t' (transposed, scipy.sparse.csc_matrix),
+            'distinct' (numpy.ndarray), 'block_size' (int), and the last calculated rows
+            'block' and 'row' (tuple of row_start and intersections, or None).
+
+    """
+    if use_preprocessing:
+        sequence_lines_list = list(main_codes_df['sequence_line'])
+    else:
+        sequence_lines_list = list(main_codes_df['raw_sequence_line'])
+    bigram_lines_list = [generate_bigram_lines(sequence_lines) for sequence_lines in sequence_lines_list]
+
+    line_features_index = dict()
+    for key, lines_list in [('line', sequence_lines_list), ('bigram', bigram_lines_list)]:
+        incidence, _ = build_line_incidence_matrix(lines_list)
+        line_features_index[key] = {
+            'incidence': incidence,
+            'incidence_t': incidence.T.tocsc(),
+            'distinct': distinct_line_counts(incidence),
+            'block_size': block_size,
+            'block': None,
+            'row': None,
+        }
+    return line_features_index
+
+
+def get_pair_line_counts(line_features_index_entry, index_l, index_r):
+    """Get line counts of a pair, used by calculate_cln_from_counts.
+    Moving forward past the current block calculates the next block of rows,
+    a row before the current block (for example a duplicate representative) is calculated alone.
+
+    Args:
+        line_features_index_entry (dict): 'line' or 'bigram' entry of build_line_features_index.
+        index_l (int): Row position of code 1.
+        index_r (int): Row position of code 2.
+
+    Returns:
+        tuple: Contains duplicated_lines, distinct_len_l, distinct_len_r (all int).
+
+    """
+    entry = line_features_index_entry
+    distinct = entry['distinct']
+    for cached in [entry['block'], entry['row']]:
+        if cached is not None and cached[0] <= index_l < cached[0] + len(cached[1]):
+            row_start, intersections = cached
+            break
+    else:
+        if entry['block'] is None or index_l >= entry['block'][0]:
+            cache_key = 'block'
+            row_start = index_l - index_l % entry['block_size']
+            row_stop = row_start + entry['block_size']
+        else:
+            cache_key = 'row'
+            row_start, row_stop = index_l, index_l + 1
+        intersections = (entry['incidence'][row_start:row_stop] @ entry['incidence_t']).toarray().astype(np.int32)
+        entry[cache_key] = (row_start, intersections)
+
+    return int(intersections[index_l - row_start, index_r]), int(distinct[index_l]), int(distinct[index_r])
+
+
+def calculate_all_pairs_cln(main_codes_df, use_preprocessing=True):
+    """Calculate CLN and CBLN of every pair without nerf, as dense (codes x codes) matrices.
+    For many codes, use iter_all_pairs_cln instead.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        use_preprocessing (bool): If set to True, the tokenized lines (sequence_line) are used,
+            otherwise the raw lines (raw_sequence_line).
+
+    Returns:
+        tuple: Contains cln, cbln.
+            cln = CLN score with shape (codes, codes) (numpy.ndarray)
+            cbln = CBLN score with shape (codes, codes) (numpy.ndarray)
+
+    """
+    line_features_index = build_line_features_index(main_codes_df, use_preprocessing)
+    all_cln = []
+    for key in ['line', 'bigram']:
+        intersections = pairwise_intersection_counts(line_features_index[key]['incidence'])
+        all_cln.append(cln_matrix_from_counts(intersections, line_features_index[key]['distinct']))
+    return tuple(all_cln)
+
+
+def iter_all_pairs_cln(main_codes_df, use_preprocessing=True, block_size=INTERSECTION_BLOCK_SIZE):
+    """Calculate CLN and CBLN of every pair (i < j) without nerf, one block of rows at a time,
+    so the dense (codes x codes) matrices are never built.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Taken from init dataframe.
+        use_preprocessing (bool): If set to True, the tokenized lines (sequence_line) are used,
+            otherwise the raw lines (raw_sequence_line).
+        block_size (int): Count of rows multiplied at once.
+
+    Returns:
+        generator: Generator object for (cln, cbln) of the pairs of a block of rows (numpy.ndarray),
+            in the pair order of create_features_result_df.
+
+    """
+    line_features_index = build_line_features_index(main_codes_df, use_preprocessing, block_size)
+    incidence, distinct = line_features_index['line']['incidence'], line_features_index['line']['distinct']
+    bigram_incidence, bigram_distinct = line_features_index['bigram']['incidence'], line_features_index['bigram']['distinct']
+
+    all_positions = np.arange(len(main_codes_df))
+    for (row_start, row_stop, block), (_, _, bigram_block) in zip(iter_pairwise_intersections(incidence, None, block_size),
+                                                                  iter_pairwise_intersections(bigram_incidence, None, block_size)):
+        upper = all_positions[None, :] > all_positions[row_start:row_stop, None]
+        cln = cln_matrix_from_counts(block, distinct[row_start:row_stop], distinct)[upper]
+        cbln = cln_matrix_from_counts(bigram_block, bigram_distinct[row_start:row_stop], bigram_distinct)[upper]
+        yield cln, cbln
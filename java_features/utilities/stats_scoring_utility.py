@@ -4,6 +4,10 @@ calculations for similarities scoring.
 
 
 import numpy as np
+import pandas as pd
+
+from sketch_utility import KLLSketch, DEFAULT_SKETCH_K
+from config_utility import FeatureConfig
 
 
 #################
@@ -38,16 +42,44 @@ def initialize_stats_config(percentiles_define_token, add_percentile_feature_col
         list: Contains elements from the text
 
     """
-    global PERCENTILES_DEFINE_TOKEN, ADD_PERCENTILE_FEATURE_COLS, PERCENTILES_DEFINE_FEATURE, USED_MAIN_FEATURES
+    global PERCENTILES_DEFINE_TOKEN, ADD_PERCENTILE_FEATURE_COLS, PERCENTILES_DEFINE_FEATURE, USED_MAIN_FEATURES, PERCENTILE_TOKENS_LABEL
 
     PERCENTILES_DEFINE_TOKEN = percentiles_define_token
     ADD_PERCENTILE_FEATURE_COLS = add_percentile_feature_cols
     PERCENTILES_DEFINE_FEATURE = percentiles_define_feature
     USED_MAIN_FEATURES = used_main_features
 
-    for i in PERCENTILES_DEFINE_TOKEN:
-        p_token_label = f'tokens_less_{str(i).zfill(2)}'
-        PERCENTILE_TOKENS_LABEL.append(p_token_label)
+    # rebuilt (not appended), so calling it again doesn't duplicate the labels
+    PERCENTILE_TOKENS_LABEL = list(get_stats_config().percentile_tokens_label)
+
+
+def get_stats_config():
+    """Get a FeatureConfig from the config set by initialize_stats_config.
+    Used by the stats functions when no config is passed.
+
+    Returns:
+        FeatureConfig: Snapshot of the current stats config.
+
+    """
+    return FeatureConfig(used_main_features=USED_MAIN_FEATURES,
+                         percentiles_define_token=PERCENTILES_DEFINE_TOKEN,
+                         add_percentile_feature_cols=ADD_PERCENTILE_FEATURE_COLS,
+                         percentiles_define_feature=PERCENTILES_DEFINE_FEATURE)
+
+
+def calculate_tokens_percentile(main_codes_df, config):
+    """Calculate specified percentile value for tokens sequence length.
+
+    Args:
+        main_codes_df (pandas.DataFrame): Dataframe that contains code information.
+            Processed after "build_style_sequence" function
+        config (FeatureConfig): Determines percentiles_define_token.
+
+    Returns:
+        list: Percentile value for every percentile in percentiles_define_token.
+
+    """
+    return [np.percentile(main_codes_df['sequence_len'], p_token) for p_token in config.percentiles_define_token]
 
 
 def initialize_tokens_percentile(main_codes_df):
@@ -62,79 +94,111 @@ def initialize_tokens_percentile(main_codes_df):
 
     """
     global PERCENTILE_TOKENS_ALL
-    PERCENTILE_TOKENS_ALL = []
-    for p_token in PERCENTILES_DEFINE_TOKEN:
-        percentile = np.percentile(main_codes_df['sequence_len'], p_token)
-        PERCENTILE_TOKENS_ALL.append(percentile)
+    PERCENTILE_TOKENS_ALL = calculate_tokens_percentile(main_codes_df, get_stats_config())
+
 
+def build_tokens_sketch(main_codes_df, tokens_sketch=None, k=DEFAULT_SKETCH_K):
+    """Add tokens sequence length of the codes into a mergeable quantile sketch.
+    Used instead of initialize_tokens_percentile when the codes are processed in chunks.
 
-def build_token_stats_features(result_scoring_df, main_codes_df):
+    Args:
+        main_codes_df (pandas.DataFrame): Dataframe (or chunk) that contains code information.
+        tokens_sketch (KLLSketch): Sketch of the previous chunks. If set to None, a new sketch is created.
+        k (int): Size parameter of a new sketch.
+
+    Returns:
+        KLLSketch: Sketch of tokens sequence length.
+
+    """
+    if tokens_sketch is None:
+        tokens_sketch = KLLSketch(k)
+    tokens_sketch.update_many(main_codes_df['sequence'].str.len().to_numpy())
+    return tokens_sketch
+
+
+def tokens_percentile_from_sketch(tokens_sketch, config):
+    """Calculate specified percentile value for tokens sequence length from a sketch.
+
+    Args:
+        tokens_sketch (KLLSketch): The product of build_tokens_sketch (merged from all chunks).
+        config (FeatureConfig): Determines percentiles_define_token.
+
+    Returns:
+        list: Percentile value for every percentile in percentiles_define_token.
+
+    """
+    return [tokens_sketch.percentile(p_token) for p_token in config.percentiles_define_token]
+
+
+def initialize_tokens_percentile_from_sketch(tokens_sketch):
+    """Initialize specified percentile value for tokens sequence length from a sketch.
+
+    Args:
+        tokens_sketch (KLLSketch): The product of build_tokens_sketch (merged from all chunks).
+
+    Returns:
+        None
+
+    """
+    global PERCENTILE_TOKENS_ALL
+    PERCENTILE_TOKENS_ALL = tokens_percentile_from_sketch(tokens_sketch, get_stats_config())
+
+
+def build_token_stats_features(result_scoring_df, main_codes_df, config=None, tokens_percentile=None):
     """Build token statistics features.
 
     This function will add new statistic feature columns for tokens length.
     The purpose of these stats feature are to find false positive from small / short codes.
     Token length that is shorter than percentile value N will be marked as True, otherwise False.
+    Token length of every filename is looked up once, then all rows are calculated at once.
 
     Args:
         result_scoring_df (pandas.DataFrame): Dataframe that contains scoring results.
             Processed after "create_features_result_df" function
         main_codes_df (pandas.DataFrame): Dataframe that contains code information.
             Processed after "build_style_sequence" function
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+        tokens_percentile (list): The product of calculate_tokens_percentile.
+            If set to None, the values of initialize_tokens_percentile are used.
 
     Returns:
         None
 
     """
+    if config is None:
+        config = get_stats_config()
+    if tokens_percentile is None:
+        tokens_percentile = PERCENTILE_TOKENS_ALL
     
-    all_token_features = []
-    
-    for index, content in result_scoring_df[['Filename 1', 'Filename 2']].iterrows():
-        filename1 = content['Filename 1']
-        filename2 = content['Filename 2']
-        
-        seq_1 = main_codes_df[main_codes_df['filename'] == filename1]['sequence'].values[0]
-        len_seq_1 = len(seq_1)
-
-        seq_2 = main_codes_df[main_codes_df['filename'] == filename2]['sequence'].values[0]
-        len_seq_2 = len(seq_2)
-
-        if ('TCA' in USED_MAIN_FEATURES):
-            average_tokens_between = [np.average([len_seq_1, len_seq_2])]
-        else:
-            average_tokens_between = []
-        
-        if('TCD' in USED_MAIN_FEATURES):
-            diff_tokens_between = [abs(len_seq_2 - len_seq_1)]
-        else:
-            diff_tokens_between = []
-
-        # build percentile feature to detect outlier of false positive (high similairty score but not plag because of skeleton file / short file)
-        # if either one of the code satisified the condition, then it's counted as a true 
-        # (because if code1 is shorter and code2 is longer, the pair will have high score if most parts of code1 exists in code2)
-        percentile_tokens_bools = []
-        for percentile_val in PERCENTILE_TOKENS_ALL:
-
-            if len_seq_1 <= percentile_val or len_seq_2 <= percentile_val:
-                percentile_tokens_bools.append(True)
-            else:
-                percentile_tokens_bools.append(False)
-
-        current_data =  average_tokens_between + diff_tokens_between + percentile_tokens_bools
-        
-        all_token_features.append(current_data)
-    
-    token_features_name = []
-    if ('TCA' in USED_MAIN_FEATURES):
-        token_features_name.append('TCA')
-    
-    if ('TCD' in USED_MAIN_FEATURES):
-        token_features_name.append('TCD')
+    # first code wins if there are duplicated filenames
+    tokens_length = pd.Series(main_codes_df['sequence'].str.len().to_numpy(), index=main_codes_df['filename'])
+    tokens_length = tokens_length[~tokens_length.index.duplicated(keep='first')]
+
+    for column in ['Filename 1', 'Filename 2']:
+        missing_filenames = ~result_scoring_df[column].isin(tokens_length.index)
+        if missing_filenames.any():
+            raise ValueError(f'{column} "{result_scoring_df[column][missing_filenames].iloc[0]}" is not in main_codes_df')
 
-    for label in PERCENTILE_TOKENS_LABEL:
-        token_features_name.append(label)
+    len_seq_1 = tokens_length.reindex(result_scoring_df['Filename 1']).to_numpy()
+    len_seq_2 = tokens_length.reindex(result_scoring_df['Filename 2']).to_numpy()
+
+    token_features = dict()
+    if ('TCA' in config.used_main_features):
+        token_features['TCA'] = (len_seq_1 + len_seq_2) / 2
+    
+    if ('TCD' in config.used_main_features):
+        token_features['TCD'] = np.abs(len_seq_2 - len_seq_1)
+
+    # build percentile feature to detect outlier of false positive (high similairty score but not plag because of skeleton file / short file)
+    # if either one of the code satisified the condition, then it's counted as a true 
+    # (because if code1 is shorter and code2 is longer, the pair will have high score if most parts of code1 exists in code2)
+    percentile_values = np.array(tokens_percentile, dtype=np.float64)
+    percentile_tokens_bools = (len_seq_1[:, None] <= percentile_values[None, :]) | (len_seq_2[:, None] <= percentile_values[None, :])
+    for label_index, label in enumerate(config.percentile_tokens_label):
+        token_features[label] = percentile_tokens_bools[:, label_index]
     
-    if(len(token_features_name) > 0):
-        result_scoring_df[token_features_name] = all_token_features
+    for label, values in token_features.items():
+        result_scoring_df[label] = values
 
 
 def initialize_features_percentile(result_scoring_df):
@@ -149,18 +213,113 @@ def initialize_features_percentile(result_scoring_df):
 
     """
 
-    used_columns = ADD_PERCENTILE_FEATURE_COLS
-    used_percentiles = PERCENTILES_DEFINE_FEATURE
     global PERCENTILES_FEATURE_VALUE
-    PERCENTILES_FEATURE_VALUE = []
+    PERCENTILES_FEATURE_VALUE = calculate_features_percentile(result_scoring_df, get_stats_config())
+
 
-    for used_column in used_columns:
-        for used_percentile in used_percentiles:
+def calculate_features_percentile(result_scoring_df, config):
+    """Calculate specified percentile value for specified main features and style features.
+
+    Args:
+        result_scoring_df (pandas.DataFrame): Dataframe that contains scoring results.
+            Processed after "create_features_result_df" function
+        config (FeatureConfig): Determines add_percentile_feature_cols and percentiles_define_feature.
+
+    Returns:
+        list: Percentile values, ordered by feature then percentile.
+
+    """
+    percentiles_feature_value = []
+    for used_column in config.add_percentile_feature_cols:
+        for used_percentile in config.percentiles_define_feature:
             percentile_value = np.percentile(result_scoring_df[used_column], used_percentile)
-            PERCENTILES_FEATURE_VALUE.append(percentile_value)
+            percentiles_feature_value.append(percentile_value)
+    return percentiles_feature_value
+
+
+def build_features_sketches(result_scoring_df, features_sketches=None, k=DEFAULT_SKETCH_K, config=None):
+    """Add feature values into mergeable quantile sketches, one sketch per column in add_percentile_feature_cols.
+    Used instead of initialize_features_percentile when the pairs are processed in chunks.
+
+    Args:
+        result_scoring_df (pandas.DataFrame): Dataframe (or chunk) that contains scoring results.
+        features_sketches (dict): Sketches of the previous chunks. If set to None, new sketches are created.
+        k (int): Size parameter of new sketches.
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+
+    Returns:
+        dict: Contains column name as key and KLLSketch as value.
+
+    """
+    if config is None:
+        config = get_stats_config()
+    if features_sketches is None:
+        features_sketches = dict()
+    for used_column in config.add_percentile_feature_cols:
+        if used_column not in features_sketches:
+            features_sketches[used_column] = KLLSketch(k)
+        features_sketches[used_column].update_many(result_scoring_df[used_column].to_numpy())
+    return features_sketches
+
+
+def merge_sketches(all_sketches):
+    """Merge sketches (or dicts of sketches) from different chunks, processes or machines.
+
+    Args:
+        all_sketches (list): A list of KLLSketch, or a list of dicts from build_features_sketches.
+
+    Returns:
+        KLLSketch/dict: Merged sketch, or dict of merged sketches.
+
+    """
+    if isinstance(all_sketches[0], dict):
+        merged = dict()
+        for features_sketches in all_sketches:
+            for used_column, sketch in features_sketches.items():
+                if used_column not in merged:
+                    merged[used_column] = KLLSketch(sketch.k, sketch.seed)
+                merged[used_column].merge(sketch)
+        return merged
+
+    merged = KLLSketch(all_sketches[0].k, all_sketches[0].seed)
+    for sketch in all_sketches:
+        merged.merge(sketch)
+    return merged
+
+
+def initialize_features_percentile_from_sketches(features_sketches):
+    """Initialize specified percentile value for specified main features and style features from sketches.
+
+    Args:
+        features_sketches (dict): The product of build_features_sketches (merged from all chunks).
 
+    Returns:
+        None
+
+    """
+    global PERCENTILES_FEATURE_VALUE
+    PERCENTILES_FEATURE_VALUE = features_percentile_from_sketches(features_sketches, get_stats_config())
+
+
+def features_percentile_from_sketches(features_sketches, config):
+    """Calculate specified percentile value for specified main features and style features from sketches.
+
+    Args:
+        features_sketches (dict): The product of build_features_sketches (merged from all chunks).
+        config (FeatureConfig): Determines add_percentile_feature_cols and percentiles_define_feature.
+
+    Returns:
+        list: Percentile values, ordered by feature then percentile.
+
+    """
+    percentiles_feature_value = []
+    for used_column in config.add_percentile_feature_cols:
+        for used_percentile in config.percentiles_define_feature:
+            percentiles_feature_value.append(features_sketches[used_column].percentile(used_percentile))
+    return percentiles_feature_value
 
-def build_main_style_stats_features(result_scoring_df):
+
+def build_main_style_stats_features(result_scoring_df, config=None, features_percentile=None):
     """Build percentile features for main features and style features
     that specified in ADD_PERCENTILE_FEATURE_COLS.
 
@@ -172,42 +331,69 @@ def build_main_style_stats_features(result_scoring_df):
     Args:
         result_scoring_df (pandas.DataFrame): Dataframe that contains scoring results.
             Processed after "create_features_result_df" function
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+        features_percentile (list): The product of calculate_features_percentile.
+            If set to None, the values of initialize_features_percentile are used.
 
     Returns:
         None
 
     """
-    all_percentile_feats = []
-
-    if(len(ADD_PERCENTILE_FEATURE_COLS) == 0):
+    if config is None:
+        config = get_stats_config()
+    if features_percentile is None:
+        features_percentile = PERCENTILES_FEATURE_VALUE
+
+    used_columns = list(config.add_percentile_feature_cols)
+    used_percentiles = config.percentiles_define_feature
+    if(len(used_columns) == 0):
         return
     
-    for i, content in result_scoring_df[ADD_PERCENTILE_FEATURE_COLS].iterrows():
-        sims_list = content.values
-        
-        percentile_feats = []
-        
-        # loop through all score value (sim) and compare them with the pre-calculated percentile value
-        for i, sim in enumerate(sims_list):
-            for j in range(len(PERCENTILES_DEFINE_FEATURE)):
-                
-                # take percentile value from PERCENTILES_FEATURE_VALUE (starting from first index to last index)
-                percentile_val = PERCENTILES_FEATURE_VALUE[i*len(PERCENTILES_DEFINE_FEATURE)+j]
-                
-                if(sim >= percentile_val):
-                    percentile_feats.append(True)
-                else:
-                    percentile_feats.append(False)
-                    
-        
-        all_percentile_feats.append(percentile_feats)
-        
+    # compare all score values (sims) with the pre-calculated percentile values at once
+    # feature matrix (rows, features, 1) against threshold matrix (1, features, percentiles)
+    sims_matrix = result_scoring_df[used_columns].to_numpy(dtype=np.float64)
+    percentile_matrix = np.array(features_percentile, dtype=np.float64).reshape(len(used_columns), len(used_percentiles))
+    percentile_feats = sims_matrix[:, :, None] >= percentile_matrix[None, :, :]
     
-    percentile_features_name = []
-    for feature in ADD_PERCENTILE_FEATURE_COLS:
-        for percentile in PERCENTILES_DEFINE_FEATURE:
+    percentile_features = dict()
+    for i, feature in enumerate(used_columns):
+        for j, percentile in enumerate(used_percentiles):
             label = f'{feature}_more_{percentile}'
-            percentile_features_name.append(label)
-    
-    result_scoring_df[percentile_features_name] = all_percentile_feats
+            percentile_features[label] = percentile_feats[:, i, j]
     
+    for label, values in percentile_features.items():
+        result_scoring_df[label] = values
+
+
+def build_stats_features_two_pass(load_result_chunks, main_codes_df, k=DEFAULT_SKETCH_K, config=None):
+    """Build token and percentile stats features for results that are processed in chunks.
+    The first pass fills the feature sketches, the second pass adds the stats features to every chunk,
+    so all pairs never have to be in memory at once. Tokens percentiles are exact (main_codes_df is in memory).
+
+    Args:
+        load_result_chunks (function): Returns an iterable of scoring result chunks (pandas.DataFrame),
+            it is called once per pass (for example reading chunk files from disk).
+        main_codes_df (pandas.DataFrame): Dataframe that contains code information.
+            Processed after "build_style_sequence" function
+        k (int): Size parameter of the feature sketches.
+        config (FeatureConfig): If set to None, the config of initialize_stats_config is used.
+
+    Returns:
+        generator: Generator object for result chunks with the stats features.
+
+    """
+    if config is None:
+        config = get_stats_config()
+    tokens_percentile = calculate_tokens_percentile(main_codes_df.assign(sequence_len=main_codes_df['sequence'].str.len()), config)
+
+    features_sketches = None
+    for result_chunk in load_result_chunks():
+        features_sketches = build_features_sketches(result_chunk, features_sketches, k, config)
+    features_percentile = []
+    if features_sketches is not None:
+        features_percentile = features_percentile_from_sketches(features_sketches, config)
+
+    for result_chunk in load_result_chunks():
+        build_token_stats_features(result_chunk, main_codes_df, config, tokens_percentile)
+        build_main_style_stats_features(result_chunk, config, features_percentile)
+        yield result_chunk
@@ -0,0 +1,198 @@
+"""Template Utility is a module that registers starter codes (templates) of an assignment.
+Templates are tokenized with the same Java_Tokenizer pipeline as the submissions and indexed by
+line n-grams, so the skeleton code of every submission is found by matching it against the
+templates in linear time, without mining duplicate segments from all pairs.
+"""
+
+import json
+
+from main_utility import generate_init_data
+
+
+# same minimum segment length as dup_segment_counter (tiles that consist of >= 5 lines)
+MINIMAL_TEMPLATE_SEGMENT_LINES = 5
+
+
+class TemplateRegistry:
+    """TemplateRegistry stores tokenized templates and a line n-gram index.
+    Matching a submission gives a bitmask of template lines that exist in the submission
+    (as a part of a segment with at least minimal_segment_lines lines).
+
+    """
+
+    def __init__(self, minimal_segment_lines=MINIMAL_TEMPLATE_SEGMENT_LINES, use_preprocessing=True):
+        """
+        Args:
+            minimal_segment_lines (int): Minimum count of consecutive template lines
+                that must exist in a submission to be considered as skeleton code.
+            use_preprocessing (bool): If set to True, tokenized lines are indexed (sequence_line),
+                otherwise the raw lines (raw_sequence_line). Must be the same as the features calculation.
+
+        """
+        self.minimal_segment_lines = minimal_segment_lines
+        self.use_preprocessing = use_preprocessing
+
+        # template: dict with 'filename', 'sequence_line' and 'raw_sequence_line'
+        self.templates = []
+        self.template_lines = []
+        self.line_offsets = []
+        self.total_lines = 0
+        self.index = dict()
+
+    def register(self, filepaths):
+        """Tokenize and index template files.
+
+        Args:
+            filepaths (list/generator): Contains filepaths of the templates / starter codes.
+
+        Returns:
+            int: Count of registered templates.
+
+        """
+        registered = 0
+        for (filename, raw_code, line_sequence, line_num, raw_line_sequence, sequence, lines_length) in generate_init_data(filepaths):
+            self.add_template(filename, line_sequence, raw_line_sequence)
+            registered += 1
+        return registered
+
+    def add_template(self, filename, sequence_line, raw_sequence_line):
+        """Index an already tokenized template.
+
+        Args:
+            filename (str): File name of the template.
+            sequence_line (list): A list of tokenized code lines.
+            raw_sequence_line (list): A list of raw code lines.
+
+        Returns:
+            None
+
+        """
+        self.templates.append({
+            'filename': filename,
+            'sequence_line': list(sequence_line),
+            'raw_sequence_line': list(raw_sequence_line),
+        })
+
+        lines = sequence_line if self.use_preprocessing else raw_sequence_line
+        template_index = len(self.template_lines)
+        self.template_lines.append(list(lines))
+        self.line_offsets.append(self.total_lines)
+        self.total_lines += len(lines)
+
+        n = self.minimal_segment_lines
+        for position in range(len(lines) - n + 1):
+            self.index.setdefault(tuple(lines[position:position + n]), []).append((template_index, position))
+
+    def match(self, sequence_lines, matched_segments=None):
+        """Match a submission against the templates (the registry is not changed).
+
+        Args:
+            sequence_lines (list): A list of code lines of the submission.
+            matched_segments (dict): If given, matched template segments (tuple of lines) are counted into it,
+                to be passed to duplicate_line_sequences.
+
+        Returns:
+            int: Bitmask of template lines that exist in the submission
+                (bit position is the line position accross all templates).
+
+        """
+        n = self.minimal_segment_lines
+        covered = 0
+        position = 0
+        while position <= len(sequence_lines) - n:
+            hits = self.index.get(tuple(sequence_lines[position:position + n]))
+            if hits is None:
+                position += 1
+                continue
+
+            longest = n
+            for template_index, template_position in hits:
+                template = self.template_lines[template_index]
+                length = n
+                while (position + length < len(sequence_lines) and template_position + length < len(template)
+                       and sequence_lines[position + length] == template[template_position + length]):
+                    length += 1
+
+                start = self.line_offsets[template_index] + template_position
+                covered |= ((1 << length) - 1) << start
+                if matched_segments is not None:
+                    segment = tuple(template[template_position:template_position + length])
+                    matched_segments[segment] = matched_segments.get(segment, 0) + 1
+                longest = max(longest, length)
+
+            # lines inside the matched segment are already covered
+            position += longest - n + 1
+        return covered
+
+    def pair_lengths(self, covered_l, covered_r):
+        """Calculate nerf values of a pair from the bitmasks of matched template lines.
+
+        Args:
+            covered_l (int): The product of match for code 1.
+            covered_r (int): The product of match for code 2.
+
+        Returns:
+            tuple: Contains same_line_length, same_sequence_length.
+                same_line_length = Count of template lines that exist on both codes (int)
+                same_sequence_length = Total tokens of those lines (int)
+
+        """
+        common = covered_l & covered_r
+        same_line_length = bin(common).count('1')
+        same_sequence_length = 0
+        for template_index, lines in enumerate(self.template_lines):
+            template_common = (common >> self.line_offsets[template_index]) & ((1 << len(lines)) - 1)
+            while template_common:
+                line_position = (template_common & -template_common).bit_length() - 1
+                same_sequence_length += len(lines[line_position])
+                template_common &= template_common - 1
+        return same_line_length, same_sequence_length
+
+    def duplicate_line_sequences(self, matched_segments):
+        """Get matched template segments, sorted from the lengthiest one.
+        Same format as the product of filter_dup_segment (used to hide CLTS tiles).
+
+        Args:
+            matched_segments (dict): Segments counted by match, only for the current codes.
+
+        Returns:
+            list: A list of segments (list of lines).
+
+        """
+        return [list(x) for x in sorted(matched_segments, key=len, reverse=True)]
+
+    def save(self, file_path):
+        """Save the registered templates to a json file.
+
+        Args:
+            file_path (str): File path of the registry.
+
+        Returns:
+            None
+
+        """
+        with open(file_path, 'w', encoding='utf8') as registry_file:
+            json.dump({
+                'minimal_segment_lines': self.minimal_segment_lines,
+                'use_preprocessing': self.use_preprocessing,
+                'templates': self.templates,
+            }, registry_file)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load templates saved by save and rebuild the index (without tokenizing again).
+
+        Args:
+            file_path (str): File path of the registry.
+
+        Returns:
+            TemplateRegistry: The loaded registry.
+
+        """
+        with open(file_path, 'r', encoding='utf8') as registry_file:
+            data = json.load(registry_file)
+
+        registry = cls(data['minimal_segment_lines'], data['use_preprocessing'])
+        for template in data['templates']:
+            registry.add_template(template['filename'], template['sequence_line'], template['raw_sequence_line'])
+        return registry
@@ -0,0 +1,47 @@
+import sys
+from os.path import dirname, abspath, join
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.append(join(dirname(dirname(abspath(__file__))), 'java_features', 'utilities'))
+
+from config_utility import FeatureConfig
+from main_utility import generate_init_data
+from java_features.FeaturesCalculation import build_style_sequence
+
+
+INIT_COLUMNS = ['filename', 'raw_code', 'sequence_line', 'line_pos', 'raw_sequence_line', 'sequence', 'line_len']
+
+
+def write_java_codes(directory, count, prefix='Sub'):
+    filepaths = []
+    for index in range(count):
+        lines = ['public class %s%d {' % (prefix, index), '    public static void main(String[] args) {']
+        lines += ['        int value%d = %d;' % (x, x * index) for x in range(index % 5 + 2)]
+        if index % 2 == 0:
+            lines += ['        for (int i = 0; i < 10; i++) {', '            System.out.println(i);', '        }']
+        lines += ['    }', '}']
+        filepath = join(str(directory), '%s%02d.java' % (prefix, index))
+        with open(filepath, 'w') as code_file:
+            code_file.write('\n'.join(lines))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def build_codes_df(filepaths, config=None):
+    codes_df = pd.DataFrame(generate_init_data(filepaths), columns=INIT_COLUMNS)
+    codes_df = codes_df.sort_values(by=['line_len'], kind='stable').reset_index(drop=True)
+    build_style_sequence(codes_df, config=config or FeatureConfig.default())
+    return codes_df
+
+
+@pytest.fixture
+def write_codes():
+    return write_java_codes
+
+
+@pytest.fixture
+def main_codes_df(tmp_path):
+    return build_codes_df(write_java_codes(tmp_path, 12))
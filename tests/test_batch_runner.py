@@ -0,0 +1,31 @@
+import os
+
+from config_utility import FeatureConfig
+from main_utility import get_all_filepaths
+from java_features.BatchRunner import Assignment, run_batch, build_assignment_stats
+from java_features.FeaturesCalculation import create_features_result_df
+
+from conftest import build_codes_df
+
+
+def test_failed_assignment_does_not_stop_the_others(tmp_path, write_codes):
+    for name in ['good', 'bad']:
+        os.makedirs(tmp_path / name)
+        write_codes(tmp_path / name, 6)
+
+    assignments = [
+        Assignment('bad', str(tmp_path / 'bad'), features_kwargs={'no_such_option': True}),
+        Assignment('good', str(tmp_path / 'good')),
+    ]
+    outputs = run_batch(assignments, output_dir=str(tmp_path / 'out'), max_workers=2, tokenize_chunk_size=2,
+                        pair_chunk_size=4, keep_results=True)
+
+    assert isinstance(outputs['bad'], TypeError)
+    assert not os.path.exists(tmp_path / 'out' / 'bad-features-output.csv')
+
+    config = FeatureConfig.default()
+    main_codes_df = build_codes_df(list(get_all_filepaths(str(tmp_path / 'good'))), config)
+    expected = create_features_result_df(main_codes_df, config=config)
+    build_assignment_stats(expected, main_codes_df, config)
+    assert outputs['good'].shape == (15, expected.shape[1])
+    assert outputs['good'].equals(expected)
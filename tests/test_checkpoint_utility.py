@@ -0,0 +1,49 @@
+import pytest
+
+from config_utility import FeatureConfig
+from result_store_utility import ResultStore
+from java_features.FeaturesCalculation import create_features_result_df
+
+
+class CrashingStore(ResultStore):
+    # raises on the crash_on-th insert, before or after the rows are committed
+    def __init__(self, db_path, batch_size, crash_on, after_commit):
+        super().__init__(db_path, batch_size)
+        self.crash_on = crash_on
+        self.after_commit = after_commit
+        self.inserts = 0
+
+    def insert_df(self, result_scoring_df):
+        self.inserts += 1
+        if self.inserts == self.crash_on and not self.after_commit:
+            raise RuntimeError('crash')
+        super().insert_df(result_scoring_df)
+        if self.inserts == self.crash_on:
+            self.flush()
+            raise RuntimeError('crash')
+
+
+def stored_pairs(store):
+    return sorted(store.query()[['Filename 1', 'Filename 2']].itertuples(index=False, name=None))
+
+
+@pytest.mark.parametrize('after_commit', [False, True])
+def test_resume_does_not_insert_committed_rows_again(tmp_path, main_codes_df, after_commit):
+    config = FeatureConfig.default()
+    db_path = str(tmp_path / 'pairs.db')
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+
+    store = CrashingStore(db_path, batch_size=10, crash_on=4, after_commit=after_commit)
+    with pytest.raises(RuntimeError):
+        create_features_result_df(main_codes_df, config=config, result_store=store,
+                                  checkpoint_dir=checkpoint_dir, checkpoint_chunk_size=7)
+    store.close()
+
+    with ResultStore(db_path, batch_size=10) as store:
+        assert len(store) == (40 if after_commit else 30)
+        create_features_result_df(main_codes_df, config=config, result_store=store,
+                                  checkpoint_dir=checkpoint_dir, resume=True, checkpoint_chunk_size=7)
+        assert len(store) == 66
+
+        expected = create_features_result_df(main_codes_df, config=config)
+        assert stored_pairs(store) == sorted(zip(expected['Filename 1'], expected['Filename 2']))
@@ -0,0 +1,46 @@
+from os.path import basename
+
+from config_utility import FeatureConfig
+from stats_scoring_utility import calculate_tokens_percentile, calculate_features_percentile
+from stats_scoring_utility import build_token_stats_features, build_main_style_stats_features
+from java_features.Corpus import Corpus
+from java_features.FeaturesCalculation import create_features_result_df
+
+from conftest import build_codes_df
+
+
+def full_result(filepaths, config):
+    # the whole pipeline on the sorted codes, same as the boilerplate code
+    main_codes_df = build_codes_df(filepaths, config)
+    result_scoring_df = create_features_result_df(main_codes_df, config=config)
+    main_codes_df['sequence_len'] = main_codes_df['sequence'].str.len()
+    build_token_stats_features(result_scoring_df, main_codes_df, config, calculate_tokens_percentile(main_codes_df, config))
+    build_main_style_stats_features(result_scoring_df, config, calculate_features_percentile(result_scoring_df, config))
+    return result_scoring_df
+
+
+def test_incremental_corpus_same_as_full_run(tmp_path, write_codes):
+    config = FeatureConfig.default()
+    filepaths = write_codes(tmp_path, 12)
+
+    corpus = Corpus(config=config)
+    assert len(corpus.add(filepaths[:5])) == 10
+    assert len(corpus.add(filepaths[5:9])) == 26
+    assert len(corpus.add(filepaths[9:])) == 30
+    assert len(corpus) == 12
+    assert corpus.get_result().equals(full_result(filepaths, config))
+
+    removed = [basename(filepaths[4])]
+    assert corpus.remove(removed[0]) == 11
+    removed += [basename(filepaths[0]), basename(filepaths[7])]
+    assert corpus.remove(removed[1:]) == 19
+    assert len(corpus) == 9
+    assert corpus.remove('missing.java') == 0
+
+    rest = [x for x in filepaths if basename(x) not in removed]
+    expected = full_result(rest, config)
+    assert len(expected) == 36
+    assert corpus.get_result().equals(expected)
+
+    corpus.save(str(tmp_path / 'corpus.pkl'))
+    assert Corpus.load(str(tmp_path / 'corpus.pkl')).get_result().equals(expected)
@@ -0,0 +1,52 @@
+import pytest
+
+from config_utility import FeatureConfig
+from gst_calculation import gst
+from scoring_utility import run_length_encode
+from java_features.FeaturesCalculation import create_features_result_df
+
+from conftest import build_codes_df, write_java_codes
+
+
+def write_generated_code(filepath, class_name, lines_count):
+    lines = ['public class %s {' % class_name, '    public static void main(String[] args) {']
+    lines += ['        if (value > %d) { value = %d; } %s' % (x, x, ['// step', '/* step */'][x % 2]) for x in range(lines_count)]
+    lines += ['    }', '}']
+    with open(filepath, 'w') as code_file:
+        code_file.write('\n'.join(lines))
+    return str(filepath)
+
+
+@pytest.mark.parametrize('style_run_length', [False, True])
+def test_style_budget_approximates_huge_pair(tmp_path, monkeypatch, style_run_length):
+    config = FeatureConfig.default()
+    filepaths = write_java_codes(tmp_path, 3)
+    filepaths += [write_generated_code(tmp_path / ('Generated%d.java' % x), 'Generated%d' % x, 2000) for x in range(2)]
+    main_codes_df = build_codes_df(filepaths, config)
+    for label in ['WS', 'BS', 'CS']:
+        assert len(run_length_encode(main_codes_df[label + '_sequence'].iat[-1])) ** 2 > 10**5
+
+    # every tiling of the run compares at most the budget
+    compared_cells = []
+    calculate = gst.calculate
+
+    def counted_calculate(tokens_sequence_1, tokens_sequence_2, minimal_match=3):
+        compared_cells.append(len(tokens_sequence_1) * len(tokens_sequence_2))
+        return calculate(tokens_sequence_1, tokens_sequence_2, minimal_match)
+    monkeypatch.setattr(gst, 'calculate', counted_calculate)
+
+    pair_size_budget = {'CSS': 10**6, 'CLTS': 10**5, 'CBLN80': 10**5, 'WS': 10**5, 'BS': 10**5, 'CS': 10**5}
+    result_scoring_df = create_features_result_df(main_codes_df, config=config, style_run_length=style_run_length,
+                                                  pair_size_budget=pair_size_budget)
+    assert max(compared_cells) <= 10**5
+
+    approximated = dict(zip(zip(result_scoring_df['Filename 1'], result_scoring_df['Filename 2']),
+                            result_scoring_df['Approximated Features'].str.split(',')))
+    small_codes = set(main_codes_df['filename'].iloc[:3])
+    assert all(not set(features) & {'WS', 'BS', 'CS'} for pair, features in approximated.items() if set(pair) <= small_codes)
+    huge_pair = tuple(main_codes_df['filename'].iloc[-2:])
+    assert {'WS', 'BS', 'CS'} <= set(approximated[huge_pair])
+
+    # the huge pair is still a copy
+    huge_row = result_scoring_df[(result_scoring_df['Filename 1'] == huge_pair[0]) & (result_scoring_df['Filename 2'] == huge_pair[1])]
+    assert huge_row['WS'].iat[0] > 0.9
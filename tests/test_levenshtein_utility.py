@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from levenshtein_utility import lev_ratio_matrix, css_ratio
+from scoring_utility import lev_ratio, count_bigram_matches, count_bigram_matches_batched
+
+
+def random_string(rng, alphabet, max_length):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+
+def mutate(rng, sequence, alphabet):
+    # keep the strings similar, so the ratios are near the cutoffs
+    characters = list(sequence)
+    for _ in range(rng.randint(0, max(1, len(characters) // 8))):
+        position = rng.randint(0, len(characters))
+        if characters and rng.random() < 0.5:
+            del characters[min(position, len(characters) - 1)]
+        else:
+            characters.insert(position, rng.choice(alphabet))
+    return ''.join(characters)
+
+
+@pytest.mark.parametrize('max_length', [10, 70, 200])
+def test_lev_ratio_matrix_same_as_lev_ratio(max_length):
+    # lengths over 64 use more than one word per pattern (carry between words)
+    rng = random.Random(max_length)
+    for alphabet in ['ab', 'abcdef', '(){};=+.xyz']:
+        sequences_l = [random_string(rng, alphabet, max_length) for _ in range(12)]
+        sequences_r = [mutate(rng, x, alphabet) for x in sequences_l] + [random_string(rng, alphabet, max_length) for _ in range(5)]
+
+        scores = lev_ratio_matrix(sequences_l, sequences_r)
+        assert scores.shape == (len(sequences_l), len(sequences_r))
+        for i, sequence_l in enumerate(sequences_l):
+            for j, sequence_r in enumerate(sequences_r):
+                assert scores[i, j] == lev_ratio(sequence_l, sequence_r), (sequence_l, sequence_r)
+
+
+def test_lev_ratio_matrix_carry_through_unmatched_word():
+    # the middle word of the pattern never matches, carries of the first word pass through it
+    rng = random.Random(3)
+    sequences_l = [random_string(rng, 'ab', 64)[:60].ljust(64, 'a') + 'c' * 64 + random_string(rng, 'ab', 80) for _ in range(6)]
+    sequences_r = [random_string(rng, 'ab', 250) for _ in range(6)] + [x.replace('c', '') for x in sequences_l]
+
+    scores = lev_ratio_matrix(sequences_l, sequences_r)
+    for i, sequence_l in enumerate(sequences_l):
+        for j, sequence_r in enumerate(sequences_r):
+            assert scores[i, j] == lev_ratio(sequence_l, sequence_r)
+
+
+def test_count_bigram_matches_batched_same_as_count_bigram_matches():
+    rng = random.Random(0)
+    for _ in range(100):
+        alphabet = rng.choice(['ab', 'abc', '(){};=xyz'])
+        bigram_line_l = [random_string(rng, alphabet, rng.choice([8, 40, 150])) for _ in range(rng.randint(0, 10))]
+        bigram_line_r = [mutate(rng, x, alphabet) for x in bigram_line_l if rng.random() < 0.7]
+        bigram_line_r += [random_string(rng, alphabet, 100) for _ in range(rng.randint(0, 4))] + bigram_line_r[:2]
+        rng.shuffle(bigram_line_r)
+
+        assert count_bigram_matches_batched(bigram_line_l, bigram_line_r) == count_bigram_matches(bigram_line_l, bigram_line_r)
+
+
+def test_css_ratio_same_as_lev_ratio():
+    rng = random.Random(1)
+    for _ in range(300):
+        alphabet = rng.choice(['ab', 'abcdefgh'])
+        sequence_l = random_string(rng, alphabet, 300)
+        sequence_r = mutate(rng, sequence_l, alphabet) if rng.random() < 0.5 else random_string(rng, alphabet, 300)
+        assert css_ratio(sequence_l, sequence_r) == lev_ratio(sequence_l, sequence_r)
+
+
+def test_css_ratio_min_ratio_exact_above_cutoff_upper_bound_below():
+    rng = random.Random(2)
+    above, below = 0, 0
+    for _ in range(400):
+        alphabet = rng.choice(['ab', 'abcdefgh', 'abcdefghijklmnop'])
+        sequence_l = random_string(rng, alphabet, 400)
+        sequence_r = mutate(rng, sequence_l, alphabet) if rng.random() < 0.5 else random_string(rng, alphabet, 400)
+        min_ratio = rng.choice([0.3, 0.5, 0.8, 0.95])
+
+        expected = lev_ratio(sequence_l, sequence_r)
+        result = css_ratio(sequence_l, sequence_r, min_ratio)
+        if expected >= min_ratio:
+            above += 1
+            assert result == expected
+        else:
+            below += 1
+            assert expected <= result < min_ratio
+    assert above > 0 and below > 0
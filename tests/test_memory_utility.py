@@ -0,0 +1,51 @@
+import os
+
+from config_utility import FeatureConfig
+from memory_utility import SpilledDocuments, deep_sizeof
+import java_features.FeaturesCalculation as features_calculation
+
+
+def test_spilled_documents_build_once_and_keep_row_code(tmp_path):
+    built = []
+
+    def build(position):
+        built.append(position)
+        return ['line %d %s' % (position, 'x' * 200)] * 5
+
+    payload_bytes = deep_sizeof(build(0))
+    built.clear()
+    documents = SpilledDocuments(build, 10, 4 * payload_bytes, str(tmp_path))
+    assert built == list(range(10))
+    assert len(os.listdir(tmp_path)) == 10
+
+    for i in range(10):
+        documents.pin(i)
+        for j in range(i + 1, 10):
+            assert documents[i] == build(i)
+            assert documents[j] == build(j)
+            assert i in documents.values
+            assert documents.total_bytes <= 4 * payload_bytes
+    # least recently used eviction of the same three payloads loads 51 times on this scan
+    assert documents.load_count < 51
+
+
+def test_memory_budget_builds_every_payload_once(tmp_path, main_codes_df, monkeypatch):
+    config = FeatureConfig.default()
+    expected = features_calculation.create_features_result_df(main_codes_df, config=config)
+
+    bigram_builds = []
+    generate_bigram_lines = features_calculation.generate_bigram_lines
+
+    def counted_generate_bigram_lines(sequence_lines):
+        bigram_builds.append(1)
+        return generate_bigram_lines(sequence_lines)
+    monkeypatch.setattr(features_calculation, 'generate_bigram_lines', counted_generate_bigram_lines)
+
+    spill_dir = str(tmp_path / 'spill')
+    spilled_result = features_calculation.create_features_result_df(main_codes_df, config=config, memory_budget='8K', spill_dir=spill_dir)
+    assert len(os.listdir(os.path.join(spill_dir, 'documents'))) == len(main_codes_df)
+    assert len(bigram_builds) == len(main_codes_df)
+
+    result_scoring_df = spilled_result.to_df()
+    assert len(result_scoring_df) == 66
+    assert result_scoring_df.equals(expected)
@@ -0,0 +1,60 @@
+from os.path import basename
+
+import pandas as pd
+
+from config_utility import FeatureConfig
+from main_utility import generate_init_data
+from java_features.FeaturesCalculation import create_features_result_df
+from java_features.ReferenceCorpus import ReferenceIndex, score_against_reference
+
+from conftest import INIT_COLUMNS, build_codes_df
+
+
+def pair_keys(result_scoring_df):
+    return result_scoring_df.set_index(['Filename 1', 'Filename 2'])
+
+
+def test_reference_rows_same_as_full_run(tmp_path, write_codes):
+    config = FeatureConfig.default()
+    filepaths = write_codes(tmp_path, 12)
+    query_filepaths, reference_filepaths = filepaths[:5], filepaths[5:]
+
+    reference_index = ReferenceIndex(config=config)
+    assert reference_index.build(reference_filepaths) == 7
+    reference_index.save(str(tmp_path / 'reference.idx'))
+    reference_index = ReferenceIndex.load(str(tmp_path / 'reference.idx'))
+    assert len(reference_index.profiles) == 7
+
+    query_codes_df = pd.DataFrame(generate_init_data(query_filepaths), columns=INIT_COLUMNS)
+    result_scoring_df = score_against_reference(query_codes_df, reference_index)
+
+    # query x reference rows of a full run on all codes
+    full_result_df = create_features_result_df(build_codes_df(query_filepaths + reference_filepaths, config), config=config)
+    query_filenames = {basename(x) for x in query_filepaths}
+    expected = full_result_df[full_result_df['Filename 1'].isin(query_filenames) != full_result_df['Filename 2'].isin(query_filenames)]
+    assert len(result_scoring_df) == 35
+    assert result_scoring_df.equals(expected.reset_index(drop=True))
+
+    pairs = reference_index.candidate_pairs(query_codes_df, by='lines', min_shared=3)
+    assert 0 < len(pairs) < 35
+    candidates_df = score_against_reference(query_codes_df, reference_index, pairs)
+    assert pair_keys(candidates_df).equals(pair_keys(expected).loc[pair_keys(candidates_df).index])
+
+
+def test_candidate_pairs_length_prefilter(tmp_path, write_codes):
+    filepaths = write_codes(tmp_path, 12)
+    reference_index = ReferenceIndex(config=FeatureConfig.default())
+    reference_index.build(filepaths[5:])
+    query_codes_df = pd.DataFrame(generate_init_data(filepaths[:5]), columns=INIT_COLUMNS)
+
+    query_lengths = query_codes_df['sequence'].str.len().to_numpy()
+    reference_lengths = reference_index.profiles['sequence_len'].to_numpy()
+
+    def length_ratio(pair):
+        lengths = [query_lengths[pair[0]], reference_lengths[pair[1]]]
+        return min(lengths) / max(lengths)
+
+    all_pairs = reference_index.candidate_pairs(query_codes_df, by='shingles')
+    filtered_pairs = reference_index.candidate_pairs(query_codes_df, by='shingles', min_length_ratio=0.9)
+    assert filtered_pairs == [x for x in all_pairs if length_ratio(x) >= 0.9]
+    assert 0 < len(filtered_pairs) < len(all_pairs)
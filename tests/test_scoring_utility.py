@@ -0,0 +1,42 @@
+import random
+import sys
+from os.path import dirname, abspath, join
+
+import pytest
+
+sys.path.append(join(dirname(dirname(abspath(__file__))), 'java_features', 'utilities'))
+
+from gst_calculation import gst
+from scoring_utility import run_length_encode, run_length_decode, rle_greedy_string_tiling, calculate_css
+
+
+def random_style_sequence(rng, alphabet_size):
+    sequence = []
+    for _ in range(rng.randint(0, 12)):
+        sequence += [rng.randrange(alphabet_size)] * rng.choice([1, 1, 2, 3, 4, 5, 7, 10])
+    return sequence
+
+
+def test_run_length_roundtrip():
+    sequence = [2, 1, 1, 1, 2, 2, 1]
+    assert run_length_encode(sequence) == [(2, 1), (1, 3), (2, 2), (1, 1)]
+    assert run_length_decode(run_length_encode(sequence)) == sequence
+
+
+def test_rle_greedy_string_tiling_same_as_gst():
+    rng = random.Random(0)
+    for _ in range(3000):
+        alphabet_size = rng.randint(1, 4)
+        sequence_1 = random_style_sequence(rng, alphabet_size)
+        sequence_2 = random_style_sequence(rng, alphabet_size)
+        minimal_match = rng.choice([1, 2, 3, 4])
+
+        expected = gst.calculate(sequence_1, sequence_2, minimal_match)
+        result = rle_greedy_string_tiling(run_length_encode(sequence_1), run_length_encode(sequence_2), minimal_match)
+        assert result == expected, (sequence_1, sequence_2, minimal_match)
+
+
+def test_nerf_needs_duplicate_pattern_lengths():
+    with pytest.raises(ValueError):
+        calculate_css('abcd', 'abce', nerf=True)
+    assert calculate_css('abcd', 'abcd', nerf=True, duplicate_pattern_lengths=(0, 0)) == calculate_css('abcd', 'abcd')
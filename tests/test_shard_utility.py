@@ -0,0 +1,42 @@
+import pytest
+
+from config_utility import FeatureConfig
+from shard_utility import save_shard, merge_shards
+from stats_scoring_utility import calculate_tokens_percentile, calculate_features_percentile
+from stats_scoring_utility import build_token_stats_features, build_main_style_stats_features
+from java_features.FeaturesCalculation import create_features_result_df
+
+
+SHARD_COUNT = 3
+
+
+def single_run(main_codes_df, config, **features_kwargs):
+    result_scoring_df = create_features_result_df(main_codes_df, config=config, **features_kwargs)
+    codes_df = main_codes_df.assign(sequence_len=main_codes_df['sequence'].str.len())
+    build_token_stats_features(result_scoring_df, codes_df, config, calculate_tokens_percentile(codes_df, config))
+    build_main_style_stats_features(result_scoring_df, config, calculate_features_percentile(result_scoring_df, config))
+    return result_scoring_df
+
+
+@pytest.mark.parametrize('features_kwargs', [
+    {},
+    {'pairs': [(i, j) for i in range(12) for j in range(i + 1, 12) if (i + j) % 3 != 0]},
+    {'same_segment_nerf': True, 'frequent_segment_mining': True},
+])
+def test_merged_shards_same_as_single_run(tmp_path, main_codes_df, features_kwargs):
+    config = FeatureConfig.default()
+    for shard_index in range(SHARD_COUNT):
+        result_scoring_df = create_features_result_df(main_codes_df, config=config, shard_index=shard_index,
+                                                      shard_count=SHARD_COUNT, **features_kwargs)
+        save_shard(result_scoring_df, str(tmp_path), shard_index, SHARD_COUNT, len(main_codes_df), config=config)
+
+    merged = merge_shards(str(tmp_path), SHARD_COUNT, main_codes_df, config=config)
+    expected = single_run(main_codes_df, config, **features_kwargs)
+    assert len(expected) == len(features_kwargs.get('pairs', range(66)))
+    assert merged.equals(expected)
+
+
+def test_sharded_mined_nerf_is_rejected(main_codes_df):
+    with pytest.raises(ValueError):
+        create_features_result_df(main_codes_df, config=FeatureConfig.default(), same_segment_nerf=True,
+                                  shard_index=0, shard_count=SHARD_COUNT)
@@ -0,0 +1,35 @@
+import random
+import sys
+from os.path import dirname, abspath, join
+
+import pytest
+
+sys.path.append(join(dirname(dirname(abspath(__file__))), 'java_features', 'utilities'))
+
+from scoring_utility import find_duplicate_patterns
+from skeleton_utility import SkeletonMatcher
+
+
+def random_text(rng, alphabet, length):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+@pytest.mark.parametrize('max_cached_texts', [0, 1, 1024])
+def test_skeleton_matcher_same_as_find_duplicate_patterns(max_cached_texts):
+    rng = random.Random(max_cached_texts)
+    for _ in range(30):
+        all_duplicate_line_sequences = [[random_text(rng, 'ab', rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+                                        for _ in range(rng.randint(1, 6))]
+        all_duplicate_line_sequences.sort(key=lambda x: -len(''.join(x)))
+        sequences = [random_text(rng, 'abc', rng.randint(0, 40)) for _ in range(8)]
+
+        matcher = SkeletonMatcher(all_duplicate_line_sequences, max_cached_texts=max_cached_texts)
+        for key, sequence in enumerate(sequences):
+            matcher.add_document(key, sequence)
+        assert len(matcher.texts) <= max_cached_texts
+
+        for i in range(len(sequences)):
+            for j in range(i + 1, len(sequences)):
+                expected = find_duplicate_patterns(sequences[i], sequences[j], all_duplicate_line_sequences)
+                assert matcher.match_pair(i, j)[:2] == expected
+        assert len(matcher.texts) <= max_cached_texts